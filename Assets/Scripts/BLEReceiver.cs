@@ -5,12 +5,37 @@ using System.Net.WebSockets;
 using System.Threading;
 using System.Text;
 using System.Collections;
+using System.IO;
 
 [System.Serializable]
 public class ActionEvent
 {
     public string motion_type; // 修改为匹配 Python 端的字段名
-    public float timestamp;
+    public string device_id;   // 多设备时标识事件来源
+    public double timestamp;  // 墙钟时间(Unix秒)，float精度不足
+}
+
+// 桥接服务的就绪状态: 连接时的欢迎消息带bridge_state对象，状态变化时广播status为bridge_state的消息
+[System.Serializable]
+public class BridgeStateInfo
+{
+    public string state;
+}
+
+[System.Serializable]
+public class StatusMessage
+{
+    public string status;
+    public string state;
+    public BridgeStateInfo bridge_state;
+}
+
+// 命令的回复(ping的pong、错误等)，既不是状态消息也不是动作事件
+[System.Serializable]
+public class ReplyMessage
+{
+    public string response;
+    public string error;
 }
 
 public class BLEReceiver : MonoBehaviour
@@ -20,6 +45,9 @@ public class BLEReceiver : MonoBehaviour
     public bool autoConnect = true;
     public float reconnectInterval = 3f;
 
+    [Tooltip("使用紧凑的二进制动作事件代替JSON")]
+    public bool useBinaryEvents = false;
+
     [Header("调试")]
     public bool debugLog = true;
     public bool showConnectionStatus = true;
@@ -27,6 +55,19 @@ public class BLEReceiver : MonoBehaviour
     // 事件定义
     public event Action OnStompDetected;
     public event Action OnKickDetected;
+    // 临时事件: 服务端开启provisional_events时，检测到运动开始即触发
+    public event Action OnMotionStarted;
+    // 传感器数据帧: 设备ID, 基准时间戳, 样本数组(每个样本7个float: 时间偏移, 加速度xyz, 角速度xyz)
+    public event Action<string, double, float[]> OnSensorFrame;
+    // 桥接服务就绪状态变化: starting(加载设备) / connecting(传感器未连接) / partial / ready
+    public event Action<string> OnBridgeStateChanged;
+    // 命令回复的原始JSON(设备列表、统计、错误等)
+    public event Action<string> OnCommandReply;
+
+    public string BridgeState { get; private set; } = "unknown";
+
+    // 二进制动作事件中的动作代码(从1开始)，与Python端ACTION_CODES一致
+    private static readonly string[] ActionCodes = { "stomp", "kick", "motion_started" };
 
     // WebSocket相关
     private ClientWebSocket webSocket;
@@ -64,6 +105,11 @@ public class BLEReceiver : MonoBehaviour
             
             // 开始接收消息
             ReceiveMessages();
+            
+            if (useBinaryEvents)
+            {
+                SendCommand("{\"command\":\"set_event_format\",\"format\":\"binary\"}");
+            }
         }
         catch (Exception e)
         {
@@ -79,13 +125,21 @@ public class BLEReceiver : MonoBehaviour
     private async void ReceiveMessages()
     {
         var buffer = new byte[4096];
+        // 一条消息可能分多次收到(统计、设备列表等较长的回复)，累积到EndOfMessage再处理
+        var received = new MemoryStream();
         
         while (webSocket != null && webSocket.State == WebSocketState.Open && !cts.IsCancellationRequested)
         {
             try
             {
-                var result = await webSocket.ReceiveAsync(
-                    new ArraySegment<byte>(buffer), cts.Token);
+                WebSocketReceiveResult result;
+                received.SetLength(0);
+                do
+                {
+                    result = await webSocket.ReceiveAsync(
+                        new ArraySegment<byte>(buffer), cts.Token);
+                    received.Write(buffer, 0, result.Count);
+                } while (!result.EndOfMessage && result.MessageType != WebSocketMessageType.Close);
                 
                 if (result.MessageType == WebSocketMessageType.Close)
                 {
@@ -97,7 +151,14 @@ public class BLEReceiver : MonoBehaviour
                     break;
                 }
                 
-                var message = Encoding.UTF8.GetString(buffer, 0, result.Count);
+                if (result.MessageType == WebSocketMessageType.Binary)
+                {
+                    // 二进制帧: 紧凑动作事件或订阅的传感器数据
+                    ProcessBinaryMessage(received.GetBuffer(), (int)received.Length);
+                    continue;
+                }
+                
+                var message = Encoding.UTF8.GetString(received.GetBuffer(), 0, (int)received.Length);
                 DebugLog($"收到消息: {message}");
                 
                 // 处理消息
@@ -120,22 +181,103 @@ public class BLEReceiver : MonoBehaviour
         DebugLog("消息接收循环已结束");
     }
 
-    // 处理接收到的 WebSocket 消息
-   // 处理接收到的 WebSocket 消息
-private void ProcessWebSocketMessage(string json)
-{
-    try
+    // 二进制消息按魔数区分: "IMUE" 动作事件, "IMUS" 传感器数据
+    private void ProcessBinaryMessage(byte[] data, int length)
     {
-        var eventData = JsonUtility.FromJson<ActionEvent>(json);
-        
-        // 在调试日志中显示解析后的数据
-        DebugLog($"解析JSON结果: motion_type={eventData.motion_type}, timestamp={eventData.timestamp}");
-        
-        // 处理动作事件
-        switch (eventData.motion_type.ToLower())
+        if (length >= 4 && data[0] == 'I' && data[1] == 'M' && data[2] == 'U')
+        {
+            if (data[3] == 'E')
+            {
+                ProcessBinaryEvent(data, length);
+                return;
+            }
+            if (data[3] == 'S')
+            {
+                ProcessSensorFrame(data, length);
+                return;
+            }
+        }
+        DebugLog("收到未知的二进制消息", true);
+    }
+
+    // 解析紧凑动作事件: 魔数"IMUE", 版本, 动作代码, 设备ID长度, 保留, 置信度float, 时间戳double, 设备ID
+    private void ProcessBinaryEvent(byte[] data, int length)
+    {
+        if (length < 20 || length < 20 + data[6])
+        {
+            DebugLog("动作事件帧长度不足", true);
+            return;
+        }
+
+        int actionCode = data[5];
+        double timestamp = BitConverter.ToDouble(data, 12);
+        if (actionCode < 1 || actionCode > ActionCodes.Length)
+        {
+            DebugLog($"未知的动作代码: {actionCode}");
+            return;
+        }
+        DispatchMotion(ActionCodes[actionCode - 1], timestamp);
+    }
+
+    // 解析传感器数据帧: 头部16字节(魔数"IMUS", 版本, 设备ID长度, 样本数, 基准时间戳) + 设备ID + 样本
+    private void ProcessSensorFrame(byte[] data, int length)
+    {
+        if (length < 16)
+        {
+            DebugLog("传感器数据帧长度不足", true);
+            return;
+        }
+
+        int idLength = data[5];
+        int sampleCount = BitConverter.ToUInt16(data, 6);
+        double baseTime = BitConverter.ToDouble(data, 8);
+        int offset = 16 + idLength;
+        if (offset + sampleCount * 7 * sizeof(float) > length)
+        {
+            DebugLog("传感器数据帧长度不足", true);
+            return;
+        }
+
+        string deviceId = Encoding.UTF8.GetString(data, 16, idLength);
+        var samples = new float[sampleCount * 7];
+        Buffer.BlockCopy(data, offset, samples, 0, samples.Length * sizeof(float));
+        OnSensorFrame?.Invoke(deviceId, baseTime, samples);
+    }
+
+    // 发送命令到服务器
+    public async void SendCommand(string json)
+    {
+        if (webSocket == null || webSocket.State != WebSocketState.Open) return;
+
+        try
+        {
+            var bytes = Encoding.UTF8.GetBytes(json);
+            await webSocket.SendAsync(new ArraySegment<byte>(bytes), WebSocketMessageType.Text, true, cts.Token);
+        }
+        catch (Exception e)
+        {
+            DebugLog($"发送命令失败: {e.Message}", true);
+        }
+    }
+
+    // 订阅传感器数据流(mode: "decimate" 抽取 / "average" 平均；source: "filtered" 滤波后 / "raw" 未滤波)
+    public void SubscribeSensorStream(float rate = 30f, string mode = "decimate", string source = "filtered")
+    {
+        SendCommand($"{{\"command\":\"subscribe_sensor\",\"rate\":{rate.ToString(System.Globalization.CultureInfo.InvariantCulture)},\"mode\":\"{mode}\",\"source\":\"{source}\"}}");
+    }
+
+    public void UnsubscribeSensorStream()
+    {
+        SendCommand("{\"command\":\"unsubscribe_sensor\"}");
+    }
+
+    // 根据动作类型触发事件
+    private void DispatchMotion(string motionType, double timestamp)
+    {
+        switch (motionType.ToLower())
         {
             case "stomp":
-                DebugLog($"收到跺脚事件 @{eventData.timestamp}");
+                DebugLog($"收到跺脚事件 @{timestamp}");
                 
                 // 触发自己的事件
                 OnStompDetected?.Invoke();
@@ -153,7 +295,7 @@ private void ProcessWebSocketMessage(string json)
                 break;
                 
             case "kick":
-                DebugLog($"收到踢腿事件 @{eventData.timestamp}");
+                DebugLog($"收到踢腿事件 @{timestamp}");
                 
                 // 触发自己的事件
                 OnKickDetected?.Invoke();
@@ -170,11 +312,65 @@ private void ProcessWebSocketMessage(string json)
                 }
                 break;
                 
+            case "motion_started":
+                // 临时事件: 检测到运动开始，动作类型随后确定
+                DebugLog($"检测到运动开始 @{timestamp}");
+                OnMotionStarted?.Invoke();
+                break;
+                
             default:
-                DebugLog($"未知的动作类型: {eventData.motion_type}");
+                DebugLog($"未知的动作类型: {motionType}");
                 break;
         }
     }
+
+    // 处理接收到的 WebSocket 消息
+   // 处理接收到的 WebSocket 消息
+private void ProcessWebSocketMessage(string json)
+{
+    try
+    {
+        // 欢迎消息和就绪状态广播只更新桥接状态，其他状态消息(thresholds_updated等)是命令回复
+        var statusMessage = JsonUtility.FromJson<StatusMessage>(json);
+        if (!string.IsNullOrEmpty(statusMessage.status))
+        {
+            bool isBroadcast = statusMessage.status == "bridge_state";
+            bool isWelcome = statusMessage.status == "connected";
+            if (!isBroadcast && !isWelcome)
+            {
+                OnCommandReply?.Invoke(json);
+                return;
+            }
+            string state = isBroadcast ? statusMessage.state
+                : statusMessage.bridge_state != null ? statusMessage.bridge_state.state : null;
+            if (!string.IsNullOrEmpty(state) && state != BridgeState)
+            {
+                BridgeState = state;
+                DebugLog($"桥接服务状态: {state}");
+                OnBridgeStateChanged?.Invoke(state);
+            }
+            return;
+        }
+        
+        var eventData = JsonUtility.FromJson<ActionEvent>(json);
+        if (string.IsNullOrEmpty(eventData.motion_type))
+        {
+            // 命令的回复不是动作事件，不进入DispatchMotion
+            var reply = JsonUtility.FromJson<ReplyMessage>(json);
+            if (!string.IsNullOrEmpty(reply.error))
+            {
+                DebugLog($"服务端返回错误: {reply.error}", true);
+            }
+            OnCommandReply?.Invoke(json);
+            return;
+        }
+        
+        // 在调试日志中显示解析后的数据
+        DebugLog($"解析JSON结果: motion_type={eventData.motion_type}, timestamp={eventData.timestamp}");
+        
+        // 处理动作事件
+        DispatchMotion(eventData.motion_type, eventData.timestamp);
+    }
     catch (Exception e)
     {
         DebugLog($"消息解析失败: {e.Message}\n原始数据: {json}", true);
@@ -1,18 +1,34 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # 启动计时起点: 开始导入依赖之前
+# numpy和websockets在模块级直接导入(监听和检测管线都要用)，其导入时间计入websocket_listening；只有bleak按需导入
+
+import argparse
 import asyncio
+import bisect
 import json
+import math
+import mmap
+import multiprocessing
+import os
+import queue
+import re
+import signal
 import websockets
+import websockets.exceptions
 import logging
 import numpy as np
-from bleak import BleakScanner, BleakClient
 from collections import deque
-import time
+from multiprocessing import connection as mp_connection, shared_memory
+import struct
+import threading
+from imu_protocol import ACCEL_SCALE, CHARACTERISTIC_UUID, GYRO_SCALE, SERVICE_UUID
 
 # 配置区域 - 根据你的设备修改
-DEVICE_NAME = "im600-V3.11"  # 修改为扫描到的名称
-SERVICE_UUID = "0000ae30-0000-1000-8000-00805f9b34fb"  # 服务UUID
-CHARACTERISTIC_UUID = "0000ae02-0000-1000-8000-00805f9b34fb"  # 通知特征UUID
+DEVICE_NAME = "im600-V3.11"  # 修改为扫描到的名称(服务和通知特征UUID见imu_protocol.py)
 WEBSOCKET_PORT = 8765  # WebSocket服务器端口
+METRICS_PORT = 8766  # 指标HTTP端口(Prometheus文本格式)，0表示不启动
 DEVICE_ADDRESS = "19:6F:51:5D:D5:D6"  # 扫描到的设备地址
+DEVICES_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "devices.json")  # 多设备配置文件
 
 # 设置日志
 logging.basicConfig(
@@ -21,53 +37,1029 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 保存连接的WebSocket客户端
-connected_clients = set()
+# 保存连接的WebSocket客户端: websocket -> ClientConnection
+connected_clients = {}
 
 # 序列检测参数
 WINDOW_SIZE = 80  # 增大窗口，捕捉完整动作
 DETECTION_WINDOW = 50
 COOLDOWN_TIME = 2.5  # 增加冷却时间，避免重复检测
 
-# 数据缓冲区
-accel_buffer = deque(maxlen=WINDOW_SIZE)
-gyro_buffer = deque(maxlen=WINDOW_SIZE)
-time_buffer = deque(maxlen=WINDOW_SIZE)
+# 录制文件: 64字节文件头 + 逐条记录(到达时间f8, 长度u2, 原始通知)，只追加写入，可内存映射读取
+RECORDING_MAGIC = b'IMUREC01'
+# 魔数, 帧头长度, 每帧样本数, 样本间距, 采样率, 设备ID, 时钟来源, 计数器偏移, 计数器字节数, 计数器标志, tick频率
+RECORDING_HEADER = struct.Struct('<8sHHHf32sBBBBf6x')
+RECORD_HEADER = struct.Struct('<dH')
+# 录制文件的附属JSON(同名.recording.json): 每次打开或检测配置变化时写入一段，记录起始帧、
+# 同时读取的(墙钟时间, 单调时钟时间)锚点，以及当时的滤波、校准偏移、检测参数和分类器配置
+RECORDING_SIDECAR_SUFFIX = ".recording.json"
+RECORDING_FLUSH_INTERVAL = 1.0  # 录制文件刷盘间隔(秒)
 
-# 状态管理
-last_detection_time = 0
-detection_stats = {"stomp": 0, "kick": 0, "total_processed": 0}
+# 训练会话存储: 每个会话一个目录，样本和运动序列按列分块写入NPZ，manifest.json记录各块的时间范围
+SESSION_CHUNK_SAMPLES = 6000  # 每个样本块的样本数(100Hz约1分钟)
+SESSION_CHUNK_MOTIONS = 64  # 每个运动块最多的运动序列数
+SESSION_FLUSH_INTERVAL = 30.0  # 未满的块至少每隔该时间写出一次(秒)
+SESSION_MAX_PENDING = 8  # 等待后台写入的块数上限，超过时丢弃新块并计数
+
+# 延迟直方图桶上限(秒): 1µs到10s，每个数量级4个桶，内存固定
+LATENCY_BUCKETS = tuple(10 ** (e / 4) for e in range(-24, 5))
+
+# WebSocket发送队列参数
+CLIENT_QUEUE_SIZE = 64  # 每个客户端最多排队的待发送消息数
+SLOW_CLIENT_POLICIES = ("drop", "coalesce", "disconnect")  # 慢客户端策略: 丢弃最旧/同类合并/断开
+default_client_policy = "drop"
+
+# 传感器数据流: 每个节拍把新样本按客户端要求的频率降采样后打包成二进制帧发送
+SENSOR_TICK_INTERVAL = 0.05  # 打包发送间隔(秒)
+SENSOR_DEFAULT_RATE = 30.0  # 默认输出频率(Hz)
+SENSOR_MODES = ("decimate", "average")  # 抽取 / 区间平均
+SENSOR_SOURCES = ("filtered", "raw")  # filtered: 送入检测器的样本(默认)，raw: 解析后未经滤波阶段的样本
+# 每种来源缓存的样本数(100Hz下约10秒): 每个节拍最多取回这么多新样本，积压更多时最旧的样本被跳过
+SENSOR_BUFFER_SIZE = 1024
+SENSOR_FRAME_MAGIC = b'IMUS'
+SENSOR_FRAME_VERSION = 1
+# 二进制帧: 头部(魔数, 版本, 设备ID长度, 样本数, 基准时间戳f8(墙钟时间)) + 设备ID + 样本数×7个float32(时间偏移, 六轴)，小端
+SENSOR_FRAME_HEADER = struct.Struct('<4sBBHd')
+
+# 动作事件编码: JSON(按详细程度裁剪字段)或紧凑二进制帧，由客户端协商
+EVENT_FORMATS = ("json", "binary")
+EVENT_VERBOSITY = ("minimal", "scores", "full")  # 默认minimal，scores/full需客户端显式请求
+ACTION_CODES = {"stomp": 1, "kick": 2, "motion_started": 3}  # 二进制事件中的动作代码，0表示未知动作
+EVENT_FRAME_MAGIC = b'IMUE'
+EVENT_FRAME_VERSION = 1
+# 二进制事件: 魔数, 版本, 动作代码, 设备ID长度, 保留, 置信度f4, 时间戳f8(墙钟时间) + 设备ID，小端，共20字节+设备ID
+EVENT_FRAME_HEADER = struct.Struct('<4sBBBxfd')
+
+# 内部时间统一使用单调时钟(不受系统时间调整影响)，发给客户端的时间戳按启动时的差值换算为墙钟时间(Unix秒)
+WALL_CLOCK_OFFSET = time.time() - time.monotonic()
+
+# 通知队列参数
+FRAME_QUEUE_SIZE = 256  # 每个设备最多缓存的原始通知数，满时丢弃最旧的
+FRAME_BATCH_SIZE = 64  # 消费任务每次最多处理的通知数
+
+# 多进程检测: 设备按轮询分配到工作进程，原始通知经共享内存环形缓冲区传入，事件经管道传回
+WORKER_RING_SLOTS = 1024  # 每个设备的共享环形缓冲区槽数，满时丢弃新通知
+WORKER_SLOT_SIZE = 264  # 每槽字节数: 槽头(到达时间f8, 入队时间f8, 长度u2) + 最长244字节的BLE通知(ATT_MTU-3)
+WORKER_STATS_INTERVAL = 1.0  # 工作进程回传统计和延迟直方图的间隔(秒)
+WORKER_SHUTDOWN_TIMEOUT = 30.0  # 退出时等待工作进程写完会话并确认结束的时间(秒)，超时才强制终止
+WORKER_STAGES = ("parse", "filter", "detect", "feature", "classify")  # 在工作进程中计时的阶段
+SLOT_HEADER = struct.Struct('<ddH')
+
+# 提前决策模式(命令行开关，对所有设备的检测器生效)
+default_early_decision = False
+default_provisional_events = False
+
+# 客户端可通过set_thresholds调整的检测参数及其类型
+DETECTOR_PARAMS = {
+    "motion_intensity_threshold": float,
+    "min_motion_duration": float,
+    "max_motion_duration": float,
+    "cooldown_time": float,
+    "early_decision": bool,
+    "early_confidence_threshold": float,
+    "provisional_events": bool,
+}
+THRESHOLD_SCOPES = ("device", "client")  # device(默认): 修改设备共享的检测器，client: 只影响发出命令的客户端
+BOOL_STRINGS = {"true": True, "1": True, "false": False, "0": False}
+
+# 校准: 静止采集一段样本，计算各轴零偏和噪声底，按设备地址保存
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json")
+CALIBRATION_SAMPLES = 200  # 静止采集的样本数
+CALIBRATION_TIMEOUT = 15.0  # 采集超时(秒)
+CALIBRATION_MAX_NOISE = (0.1, 10.0)  # 静止判定: 加速度(G)和角速度(°/s)标准差上限
+NOISE_THRESHOLD_FACTOR = 3.0  # 运动强度阈值 = 静止时的强度噪声底 × 该系数
+
+# BLE连接管理参数
+SCAN_TIMEOUT = 5.0  # 单次扫描时长(秒)
+SCAN_CACHE_TTL = 5.0  # 全量扫描结果的有效期，多个设备同时查找时共用同一次扫描(秒)
+RECONNECT_BACKOFF_INITIAL = 0.5  # 首次重连等待(秒)，之后每次翻倍
+RECONNECT_BACKOFF_MAX = 10.0  # 重连等待上限(秒)
+CACHED_CONNECT_ATTEMPTS = 3  # 缓存的设备连续连接失败该次数后重新扫描
+NOTIFICATION_GAP_THRESHOLD = 0.5  # 两次通知间隔超过该值记为一次中断(秒)
+STALL_TIMEOUT = 3.0  # 连接仍在但超过该时间没有通知时主动重连(秒)
+RATE_WINDOW = 1.0  # 包速率统计窗口(秒)
+RATE_DROP_RATIO = 0.5  # 包速率低于基线的该比例时记为一次掉速
+
+# 样本时间戳来源: 到达时间 / 按标称采样率重建 / 帧头序号计数器 / 帧头设备时间戳
+CLOCK_SOURCES = ("arrival", "nominal", "counter", "timestamp")
+CLOCK_MAX_LAG = 0.25  # 重建时间落后到达时间超过该值时重新对齐(标称模式下计为丢样)(秒)
+CLOCK_MIN_STEP = 1e-6  # 相邻样本时间戳的最小间隔(秒)
+
+# 样本结构: 时间戳 + 六轴(加速度xyz, 角速度xyz)
+IMU_SAMPLE_DTYPE = np.dtype([('timestamp', np.float64), ('imu', np.float32, (6,))])
+AX, AY, AZ, GX, GY, GZ = range(6)
+
+class IMURingBuffer:
+    """预分配的定长IMU样本环形缓冲区"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # 镜像存储: 每个样本同时写入i和i+capacity，任意最近n个样本都是连续切片
+        self._data = np.zeros(capacity * 2, dtype=IMU_SAMPLE_DTYPE)
+        self._head = 0
+        self._count = 0
+        self.total = 0  # 累计写入的样本数(清空缓冲区不归零)，用于判断哪些样本是新的
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def append(self, timestamp, imu):
+        """写入一个样本，imu为(ax, ay, az, gx, gy, gz)"""
+        i = self._head
+        record = (timestamp, imu)
+        self._data[i] = record
+        self._data[i + self.capacity] = record
+        self._head = (i + 1) % self.capacity
+        self.total += 1
+        if self._count < self.capacity:
+            self._count += 1
+
+    def extend(self, timestamps, imu):
+        """批量写入样本，imu为(N, 6)数组"""
+        n = total = len(timestamps)
+        cap = self.capacity
+        if n > cap:
+            timestamps = timestamps[-cap:]
+            imu = imu[-cap:]
+            n = cap
+        i = self._head
+        # 在两份镜像中各写一段连续区域(第二份可能越过2*capacity，需回绕到开头)
+        for start in (i, i + cap):
+            first = min(n, 2 * cap - start)
+            self._data['timestamp'][start:start + first] = timestamps[:first]
+            self._data['imu'][start:start + first] = imu[:first]
+            if first < n:
+                self._data['timestamp'][:n - first] = timestamps[first:]
+                self._data['imu'][:n - first] = imu[first:]
+        self._head = (i + n) % cap
+        self.total += total
+        self._count = min(self._count + n, cap)
+
+    def window(self, n=None):
+        """返回最近n个样本的零拷贝视图(按时间顺序)"""
+        if n is None or n > self._count:
+            n = self._count
+        end = self._head + self.capacity
+        return self._data[end - n:end]
+
+class MotionSequenceBuffer:
+    """可增长的完整动作序列缓冲区，数据以连续(N, 6)数组保存"""
+    def __init__(self, initial_capacity=256):
+        self._timestamps = np.empty(initial_capacity, dtype=np.float64)
+        self._imu = np.empty((initial_capacity, 6), dtype=np.float64)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._count = 0
+
+    def append(self, timestamp, imu):
+        n = self._count
+        if n == len(self._timestamps):
+            # 容量不足时倍增，摊还O(1)
+            self._timestamps = np.resize(self._timestamps, n * 2)
+            self._imu = np.resize(self._imu, (n * 2, 6))
+        self._timestamps[n] = timestamp
+        self._imu[n] = imu
+        self._count = n + 1
+
+    @property
+    def timestamps(self):
+        return self._timestamps[:self._count]
+
+    @property
+    def imu(self):
+        return self._imu[:self._count]
+
+class IncrementalMotionFeatures:
+    """随样本到达增量更新的部分序列特征，与extract_motion_features的定义一致(峰值计数除外)"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.start_time = 0.0
+        self.last_time = 0.0
+        self._mean = [0.0, 0.0, 0.0]  # 加速度X、加速度Z、角速度Y
+        self._m2 = [0.0, 0.0, 0.0]
+        self._min = [0.0, 0.0, 0.0]
+        self._max = [0.0, 0.0, 0.0]
+        self.max_intensity = 0.0
+        self._prev = None  # 上一个样本的X、Z加速度
+        self._prev_diff = None
+        # 一阶差分和二阶差分的Welford累加(X、Z两轴)
+        self._d1 = [0, [0.0, 0.0], [0.0, 0.0]]
+        self._d2 = [0, [0.0, 0.0], [0.0, 0.0]]
+
+    @staticmethod
+    def _welford(acc, values):
+        n = acc[0] + 1
+        acc[0] = n
+        for j, x in enumerate(values):
+            delta = x - acc[1][j]
+            acc[1][j] += delta / n
+            acc[2][j] += delta * (x - acc[1][j])
+
+    def update(self, timestamp, imu):
+        values = (float(imu[AX]), float(imu[AZ]), float(imu[GY]))
+        n = self.count + 1
+        if n == 1:
+            self.start_time = timestamp
+            self._min = list(values)
+            self._max = list(values)
+        self.last_time = timestamp
+        for j, x in enumerate(values):
+            delta = x - self._mean[j]
+            self._mean[j] += delta / n
+            self._m2[j] += delta * (x - self._mean[j])
+            if x < self._min[j]:
+                self._min[j] = x
+            elif x > self._max[j]:
+                self._max[j] = x
+        intensity = abs(values[0]) + abs(values[1]) + abs(values[2]) / 100
+        if intensity > self.max_intensity:
+            self.max_intensity = intensity
+        
+        xz = values[:2]
+        if self._prev is not None:
+            diff = (xz[0] - self._prev[0], xz[1] - self._prev[1])
+            self._welford(self._d1, diff)
+            if self._prev_diff is not None:
+                self._welford(self._d2, (diff[0] - self._prev_diff[0], diff[1] - self._prev_diff[1]))
+            self._prev_diff = diff
+        self._prev = xz
+        self.count = n
+
+    def features(self):
+        """当前部分序列的特征字典"""
+        n = self.count
+        stds = [(m2 / n) ** 0.5 if n else 0.0 for m2 in self._m2]
+        ranges = [hi - lo for lo, hi in zip(self._min, self._max)]
+        features = {
+            'x_std': stds[0],
+            'z_std': stds[1],
+            'y_gyro_std': stds[2],
+            'x_range': ranges[0],
+            'z_range': ranges[1],
+            'y_gyro_range': ranges[2],
+            'duration': self.last_time - self.start_time if n > 1 else 0,
+            'max_intensity': self.max_intensity if n else 0,
+            'transition_sharpness': 0,
+            'motion_smoothness': 0,
+        }
+        if n > 4:
+            d1, d2 = self._d1, self._d2
+            features['transition_sharpness'] = d2[2][0] / d2[0] + d2[2][1] / d2[0]
+            features['motion_smoothness'] = (1.0 / (1.0 + d1[2][0] / d1[0]) + 1.0 / (1.0 + d1[2][1] / d1[0])) / 2
+        return features
+
+class SampleClock:
+    """样本时间戳: 由帧头计数器/设备时间戳或标称采样率得到等间隔时间，以到达时间(单调时钟)为锚点，并检测丢样
+
+    锚点取到达时间的下包络(样本不可能早于采集时刻到达)，因此BLE连接间隔的批量到达和事件循环抖动不影响样本间隔。
+    """
+    def __init__(self, source="nominal", sample_rate=None, samples_per_frame=1, offset=0, size=2,
+                 byteorder="little", per_sample=False, tick_rate=1000.0, max_lag=CLOCK_MAX_LAG):
+        if source not in CLOCK_SOURCES[1:]:
+            raise ValueError(f"未知的时钟来源: {source}")
+        if source in ("nominal", "counter") and not sample_rate:
+            raise ValueError(f"时钟来源{source}需要采样率(sample_rate)")
+        if source == "timestamp" and samples_per_frame > 1 and not sample_rate:
+            raise ValueError("每帧多个样本时需要采样率(sample_rate)确定帧内样本间隔")
+        if size not in (1, 2, 4):
+            raise ValueError(f"计数器字节数必须为1、2或4: {size}")
+        self.source = source
+        self.samples_per_frame = samples_per_frame
+        self.interval = 1.0 / sample_rate if sample_rate else 0.0
+        self.offset = offset
+        self.size = size
+        self.byteorder = byteorder
+        self.per_sample = per_sample
+        self.tick_rate = float(tick_rate)
+        self.max_lag = max_lag
+        self._struct = self._build_struct()
+        self._modulus = 1 << (8 * size)
+        self._sample_offsets = np.arange(samples_per_frame) * self.interval
+        self.reset()
+
+    def _build_struct(self):
+        return struct.Struct(('<' if self.byteorder == "little" else '>') + {1: 'B', 2: 'H', 4: 'I'}[self.size])
+
+    def __getstate__(self):
+        # 预编译的struct不能序列化(传给检测工作进程时)，恢复时重建
+        state = self.__dict__.copy()
+        del state['_struct']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._struct = self._build_struct()
+
+    def header_fields(self):
+        """录制文件头中的时钟字段"""
+        flags = (self.byteorder == "big") | (self.per_sample << 1)
+        return CLOCK_SOURCES.index(self.source), self.offset, self.size, flags, self.tick_rate
+
+    @classmethod
+    def from_header(cls, source_code, offset, size, flags, tick_rate, sample_rate, samples_per_frame):
+        if source_code == 0:
+            return None
+        return cls(CLOCK_SOURCES[source_code], sample_rate, samples_per_frame, offset, size,
+                   "big" if flags & 1 else "little", bool(flags & 2), tick_rate)
+
+    def reset(self):
+        self._anchor = None  # 设备时间0对应的到达时间
+        self._position = None  # 上一帧第一个样本的设备时间(秒)
+        self._last_raw = None
+        self._last_time = None
+        self.dropped_samples = 0
+        self.resyncs = 0
+
+    def _positions(self, frames):
+        """每帧第一个样本的设备时间(秒)，同时统计计数器跳变对应的丢样"""
+        frame_span = self.samples_per_frame * self.interval
+        if self.source == "nominal":
+            seconds = np.full(len(frames), frame_span)
+        else:
+            unpack = self._struct.unpack_from
+            offset = self.offset
+            raw = np.array([unpack(f, offset)[0] for f in frames], dtype=np.int64)
+            expected = self._expected_step()
+            previous = raw[0] - expected if self._last_raw is None else self._last_raw
+            steps = np.diff(raw, prepend=previous) % self._modulus
+            self._last_raw = int(raw[-1])
+            # 回绕后差值超过一半量程视为设备重启或乱序，按正常间隔处理(由锚点重新对齐)
+            steps[steps > self._modulus // 2] = expected
+            if self.source == "counter":
+                seconds = steps * (self.interval if self.per_sample else frame_span)
+                lost = int(np.clip(steps - expected, 0, None).sum())
+                self.dropped_samples += lost if self.per_sample else lost * self.samples_per_frame
+            else:
+                seconds = steps / self.tick_rate
+                if frame_span:
+                    lost = np.clip(np.round(seconds / frame_span) - 1, 0, None).sum()
+                    self.dropped_samples += int(lost) * self.samples_per_frame
+        base = self._position if self._position is not None else -seconds[0]
+        positions = base + np.cumsum(seconds)
+        self._position = float(positions[-1])
+        return positions
+
+    def _expected_step(self):
+        if self.source == "counter":
+            return self.samples_per_frame if self.per_sample else 1
+        return int(round(self.samples_per_frame * self.interval * self.tick_rate))
+
+    def timestamps(self, frames, arrival_times):
+        """返回每个样本的时间戳(N,)，N = 帧数 × 每帧样本数，跨批次严格递增"""
+        if len(frames) == 0:
+            return np.empty(0, dtype=np.float64)
+        positions = self._positions(frames)
+        # 每帧给出的锚点上限: 最后一个样本不可能晚于该帧的到达时间采集
+        candidates = np.asarray(arrival_times, dtype=np.float64) - (positions + self._sample_offsets[-1])
+        starts = np.empty(len(frames))
+        anchor = self._anchor
+        i = 0
+        while i < len(frames):
+            if anchor is None:
+                anchor = candidates[i]
+            # 下包络: 一起到达的帧(BLE连接间隔内的批量通知)以整段中最早的约束为准，再统一计算时间
+            envelope = np.minimum.accumulate(np.minimum(candidates[i:], anchor))
+            late = np.flatnonzero(candidates[i:] - envelope > self.max_lag)
+            end = i + late[0] if len(late) else len(frames)
+            if end > i:
+                anchor = envelope[end - i - 1]
+                starts[i:end] = anchor + positions[i:end]
+            if end < len(frames):
+                # 到达明显晚于重建时间: 中间的样本丢失或设备暂停，从该帧起重新对齐
+                lag = candidates[end] - anchor
+                self.resyncs += 1
+                if self.source == "nominal" and self.interval:
+                    self.dropped_samples += int(round(lag / self.interval))
+                anchor = candidates[end]
+            i = end
+        self._anchor = float(anchor)
+
+        times = (starts[:, None] + self._sample_offsets).reshape(-1)
+        # 锚点前移或计数器重复可能使时间不增，按最小间隔CLOCK_MIN_STEP顺延，保证严格递增
+        steps = np.arange(len(times)) * CLOCK_MIN_STEP
+        floor = -np.inf if self._last_time is None else self._last_time + CLOCK_MIN_STEP
+        times = np.maximum.accumulate(np.maximum(times - steps, floor)) + steps
+        self._last_time = float(times[-1])
+        return times
+
+    def get_stats(self):
+        return {
+            "source": self.source,
+            "dropped_samples": self.dropped_samples,
+            "resyncs": self.resyncs
+        }
+
+class IMUFrameParser:
+    """BLE通知帧解析器: 预编译的大端int16布局，单帧用struct，批量用跨步int16视图"""
+    def __init__(self, header_size=10, samples_per_frame=1, sample_stride=12, sample_rate=None):
+        self.header_size = header_size
+        self.samples_per_frame = samples_per_frame
+        self.sample_stride = sample_stride
+        self.sample_rate = sample_rate
+        self.min_frame_size = header_size + (samples_per_frame - 1) * sample_stride + 12
+        # 单帧和批量路径使用同一组float64系数，两条路径得到完全相同的数值
+        self.scale = np.array([ACCEL_SCALE] * 3 + [GYRO_SCALE] * 3, dtype=np.float64)
+        self._scale_list = self.scale.tolist()
+        # 校准零偏在换算时一并扣除: 数值 = 原始值 × 系数 + 偏移(偏移 = -零偏)
+        self.offset = np.zeros(6)
+        self._offset_list = self.offset.tolist()
+        
+        self._struct = self._build_struct()
+        self._int16 = np.dtype('>i2')
+        
+        # 一帧包含多个样本时，按标称采样率把前面的样本往前推
+        interval = 1.0 / sample_rate if sample_rate else 0.0
+        self._time_offsets = (np.arange(samples_per_frame) - (samples_per_frame - 1)) * interval
+        # 样本时钟(SampleClock): 为None时直接使用到达时间
+        self.clock = None
+
+    def _build_struct(self):
+        # 单帧: 每个样本6个int16，样本之间可能有填充字节
+        pad = f'{self.sample_stride - 12}x' if self.sample_stride > 12 else ''
+        return struct.Struct('>' + pad.join(['6h'] * self.samples_per_frame))
+
+    def __getstate__(self):
+        # 预编译的struct不能序列化(传给检测工作进程时)，恢复时重建
+        state = self.__dict__.copy()
+        del state['_struct']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._struct = self._build_struct()
+
+    def set_offset(self, offset):
+        """设置各轴偏移(校准零偏取负)"""
+        self.offset = np.array(offset, dtype=np.float64)
+        self._offset_list = self.offset.tolist()
+
+    def parse_frame(self, data):
+        """解析单个每帧一个样本的通知，返回六轴数值列表"""
+        raw = self._struct.unpack_from(data, self.header_size)
+        return [v * s + o for v, s, o in zip(raw, self._scale_list, self._offset_list)]
+
+    def _convert(self, raw):
+        """原始int16换算为物理量，乘加原地完成"""
+        out = np.multiply(raw.reshape(-1, 6), self.scale)
+        out += self.offset
+        return out
+
+    def decode(self, buffer, count, offset, frame_stride):
+        """从缓冲区按固定帧间距直接解码count帧(跨步大端int16视图，不切片不复制)"""
+        raw = np.ndarray((count, self.samples_per_frame, 6), dtype=self._int16,
+                         buffer=buffer, offset=offset + self.header_size,
+                         strides=(frame_stride, self.sample_stride, 2))
+        return self._convert(raw)
+
+    def sample_times(self, arrival_times):
+        """每帧到达时间展开为每个样本的时间戳"""
+        return (np.asarray(arrival_times, dtype=np.float64)[:, None] + self._time_offsets).reshape(-1)
+
+    def timestamps(self, frames, arrival_times):
+        """每个样本的时间戳: 配置了样本时钟时由帧头计数器或标称采样率重建，否则使用到达时间"""
+        if self.clock is None:
+            return self.sample_times(arrival_times)
+        return self.clock.timestamps(frames, arrival_times)
+
+    def parse_batch(self, frames, arrival_times):
+        """批量解析通知帧，返回(时间戳(N,), 六轴(N, 6))；长度不足的帧被跳过"""
+        if any(len(f) < self.min_frame_size for f in frames):
+            kept = [(f, t) for f, t in zip(frames, arrival_times) if len(f) >= self.min_frame_size]
+            frames = [f for f, _ in kept]
+            arrival_times = [t for _, t in kept]
+        if not frames:
+            return np.empty(0, dtype=np.float64), np.empty((0, 6), dtype=np.float32)
+        
+        frame_size = len(frames[0])
+        if all(len(f) == frame_size for f in frames):
+            # 等长帧: 拼接后一次解码
+            imu = self.decode(b''.join(frames), len(frames), 0, frame_size)
+        else:
+            raw = np.array([self._struct.unpack_from(f, self.header_size) for f in frames], dtype=np.int16)
+            imu = self._convert(raw)
+        
+        return self.timestamps(frames, arrival_times), imu
+
+def lowpass_biquad(cutoff, sample_rate, q=0.7071):
+    """二阶巴特沃斯型低通滤波器系数(RBJ公式)，返回归一化的(b, a)"""
+    w0 = 2 * np.pi * cutoff / sample_rate
+    alpha = np.sin(w0) / (2 * q)
+    cos_w0 = np.cos(w0)
+    b = np.array([(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2])
+    a = np.array([1 + alpha, -2 * cos_w0, 1 - alpha])
+    return b / a[0], a / a[0]
+
+class BiquadFilter:
+    """多通道流式二阶IIR滤波器(直接II型转置)，状态跨批次保留
+
+    一批样本用分块状态空间形式一次算完: y = H·x + O·s0，s_L = A^L·s0 + Ctrl·x，
+    H为冲激响应构成的下三角矩阵，均按最大块长预先计算，不重复滤波历史数据。
+    """
+    def __init__(self, b, a, channels, max_block=FRAME_BATCH_SIZE):
+        b0, b1, b2 = b
+        _, a1, a2 = a
+        A = np.array([[-a1, 1.0], [-a2, 0.0]])
+        B = np.array([b1 - a1 * b0, b2 - a2 * b0])
+        self.max_block = max_block
+        self._gain = b0
+        # A^k (k = 0..max_block)，以及 C·A^k 和 A^k·B
+        powers = [np.eye(2)]
+        for _ in range(max_block):
+            powers.append(A @ powers[-1])
+        self._powers = np.array(powers)
+        self._observe = self._powers[:max_block, 0, :]  # (L, 2)
+        self._drive = self._powers[:max_block] @ B  # (L, 2)
+        impulse = np.concatenate([[b0], self._drive[:max_block - 1, 0]])
+        k = np.arange(max_block)
+        lag = k[:, None] - k[None, :]
+        self._response = np.where(lag >= 0, impulse[np.clip(lag, 0, None)], 0.0)  # (L, L)
+        self._steady = np.linalg.solve(np.eye(2) - A, B)  # 常数输入下的稳态状态(每单位输入)
+        self.channels = channels
+        self.state = None
+
+    def reset(self):
+        self.state = None
+
+    def process(self, x):
+        """滤波(N, 通道数)数组，返回同形状的输出"""
+        x = np.asarray(x, dtype=np.float64)
+        if len(x) == 0:
+            return x.copy()
+        if self.state is None:
+            # 以第一个样本的稳态初始化，避免启动瞬态
+            self.state = self._steady[:, None] * x[0]
+        out = np.empty_like(x)
+        for i in range(0, len(x), self.max_block):
+            block = x[i:i + self.max_block]
+            n = len(block)
+            out[i:i + n] = self._response[:n, :n] @ block + self._observe[:n] @ self.state
+            self.state = self._powers[n] @ self.state + self._drive[n - 1::-1].T @ block
+        return out
+
+class IMUFilter:
+    """检测前的滤波阶段: 低通去噪、低通估计重力并扣除，可选把重力方向对齐到Z轴
+
+    输出仍为(N, 6): 线加速度(G, 已去重力) + 角速度(°/s)，对齐后与传感器安装角度无关。
+    """
+    def __init__(self, sample_rate, lowpass_cutoff=15.0, gravity_cutoff=0.5, align_gravity=False):
+        if not sample_rate:
+            raise ValueError("滤波阶段需要采样率(sample_rate)")
+        self.sample_rate = float(sample_rate)
+        self.align_gravity = align_gravity
+        self.config = {"sample_rate": self.sample_rate, "lowpass_cutoff": lowpass_cutoff,
+                       "gravity_cutoff": gravity_cutoff, "align_gravity": align_gravity}
+        cutoff = min(lowpass_cutoff, 0.45 * self.sample_rate)
+        self._lowpass = BiquadFilter(*lowpass_biquad(cutoff, self.sample_rate), channels=6)
+        self._gravity = BiquadFilter(*lowpass_biquad(gravity_cutoff, self.sample_rate), channels=3)
+
+    def reset(self):
+        self._lowpass.reset()
+        self._gravity.reset()
+
+    def process(self, imu):
+        """滤波一批样本(N, 6)，返回新数组"""
+        smoothed = self._lowpass.process(imu)
+        gravity = self._gravity.process(np.asarray(imu, dtype=np.float64)[:, :3])
+        out = smoothed
+        out[:, :3] -= gravity
+        if self.align_gravity:
+            rotation = self._gravity_rotation(gravity)
+            out[:, :3] = np.einsum('nij,nj->ni', rotation, out[:, :3])
+            out[:, 3:] = np.einsum('nij,nj->ni', rotation, out[:, 3:])
+        return out
+
+    @staticmethod
+    def _gravity_rotation(gravity):
+        """每个样本的旋转矩阵(N, 3, 3): 把重力方向转到+Z轴的最小旋转(Rodrigues公式)"""
+        norm = np.linalg.norm(gravity, axis=1, keepdims=True)
+        u = gravity / np.where(norm > 0, norm, 1.0)
+        # v = u × z, c = u · z
+        v = np.stack([u[:, 1], -u[:, 0], np.zeros(len(u))], axis=1)
+        c = u[:, 2]
+        skew = np.zeros((len(u), 3, 3))
+        skew[:, 0, 2], skew[:, 1, 2] = v[:, 1], -v[:, 0]
+        skew[:, 2, 0], skew[:, 2, 1] = -v[:, 1], v[:, 0]
+        # 倒置(c接近-1)时改用绕X轴旋转180°
+        flipped = c < -0.999
+        scale = np.where(flipped, 0.0, 1.0 / np.where(flipped, 1.0, 1.0 + c))
+        rotation = np.eye(3) + skew + skew @ skew * scale[:, None, None]
+        rotation[flipped] = np.diag([1.0, -1.0, -1.0])
+        return rotation
+
+class LatencyHistogram:
+    """固定桶的延迟直方图，记录一次只需一次二分查找"""
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """按桶上限估计分位数(秒)"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            cumulative += n
+            if cumulative >= target:
+                return min(LATENCY_BUCKETS[i], self.max) if i < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p90_ms": self.quantile(0.9) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+            "max_ms": self.max * 1000
+        }
+
+class PipelineMetrics:
+    """各处理阶段的延迟直方图"""
+    STAGES = (
+        "parse",       # 通知解析
+        "filter",      # 滤波阶段(可选)
+        "detect",      # 窗口统计与状态机(含动作结束时的分析)
+        "feature",     # 完整序列特征提取
+        "classify",    # 动作分类
+        "queue_wait",  # 通知在队列中的等待
+        "broadcast",   # WebSocket广播
+        "end_to_end",  # BLE通知到达到WebSocket发送完成
+    )
 
-class SequentialMotionDetector:
     def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+
+    def observe(self, stage, seconds):
+        self.histograms[stage].observe(seconds)
+
+    def snapshot(self):
+        return {stage: h.snapshot() for stage, h in self.histograms.items()}
+
+class SlidingWindowStats:
+    """滑动窗口增量统计: 每个样本O(1)更新均值/方差，单调队列维护最大/最小值"""
+    def __init__(self, window_size, axes=(AX, AZ, GY)):
+        self.window_size = window_size
+        self.axes = axes
+        self.reset()
+
+    def reset(self):
+        n_axes = len(self.axes)
+        self._index = 0
+        self._count = 0
+        self._mean = [0.0] * n_axes
+        self._m2 = [0.0] * n_axes
+        self._values = [[0.0] * self.window_size for _ in range(n_axes)]
+        self._max_q = [deque() for _ in range(n_axes)]
+        self._min_q = [deque() for _ in range(n_axes)]
+
+    def __len__(self):
+        return self._count
+
+    def update(self, imu):
+        """加入一个样本(六轴)，窗口满时同时移出最旧样本"""
+        w = self.window_size
+        n = self._count
+        idx = self._index
+        slot = idx % w
+        expired = idx - w
+        for j, axis in enumerate(self.axes):
+            x = float(imu[axis])
+            mean = self._mean[j]
+            values = self._values[j]
+            if n < w:
+                # 窗口未满: 标准Welford累加
+                delta = x - mean
+                new_mean = mean + delta / (n + 1)
+                self._m2[j] += delta * (x - new_mean)
+            else:
+                # 窗口已满: 新样本替换最旧样本
+                old = values[slot]
+                new_mean = mean + (x - old) / w
+                self._m2[j] += (x - old) * (x - new_mean + old - mean)
+            self._mean[j] = new_mean
+            values[slot] = x
+
+            max_q = self._max_q[j]
+            while max_q and max_q[-1][1] <= x:
+                max_q.pop()
+            max_q.append((idx, x))
+            if max_q[0][0] <= expired:
+                max_q.popleft()
+
+            min_q = self._min_q[j]
+            while min_q and min_q[-1][1] >= x:
+                min_q.pop()
+            min_q.append((idx, x))
+            if min_q[0][0] <= expired:
+                min_q.popleft()
+
+        self._index = idx + 1
+        if n < w:
+            self._count = n + 1
+
+    def std(self, j):
+        if self._count == 0:
+            return 0.0
+        return (max(self._m2[j], 0.0) / self._count) ** 0.5
+
+    def range(self, j):
+        if self._count == 0:
+            return 0.0
+        return self._max_q[j][0][1] - self._min_q[j][0][1]
+
+    def features(self):
+        """返回运动开始/结束判断所需的窗口特征(轴顺序: 加速度X, 加速度Z, 角速度Y)"""
+        return {
+            'x_std': self.std(0),
+            'z_std': self.std(1),
+            'y_gyro_std': self.std(2),
+            'x_range': self.range(0),
+            'z_range': self.range(1),
+            'y_gyro_range': self.range(2),
+        }
+
+# 基于真实数据的运动模式规则表: 每条规则对一个特征做区间判断，命中时给各动作加分
+# 区间边界: min/max为闭区间，above/below为开区间；新动作只需在actions和rules中增加条目
+DEFAULT_CLASSIFIER_CONFIG = {
+    "actions": ["stomp", "kick"],
+    "min_total_score": 4.0,      # 总分低于此值视为噪声
+    "min_action_score": 5.0,     # 胜出动作的最低得分
+    "confidence_scale": 10.0,    # 置信度 = 得分 / confidence_scale
+    "max_confidence": 0.95,
+    "rules": [
+        # 持续时间: 跺脚0.8~2.5s，踢腿1.0~3.5s
+        {"feature": "duration", "min": 0.8, "max": 2.5, "scores": {"stomp": 2.0},
+         "reason": "持续时间{value:.2f}s符合跺脚范围"},
+        {"feature": "duration", "min": 1.0, "max": 3.5, "scores": {"kick": 2.0},
+         "reason": "持续时间{value:.2f}s符合踢腿范围"},
+        # Z轴范围（关键区分特征）
+        {"feature": "z_range", "above": 3.0, "scores": {"stomp": 3.0},
+         "reason": "Z轴范围{value:.2f}G大，偏向跺脚"},
+        {"feature": "z_range", "below": 1.5, "scores": {"kick": 2.5},
+         "reason": "Z轴范围{value:.2f}G小，偏向踢腿"},
+        # 最终角速度
+        {"feature": "y_gyro_std", "min": 15, "max": 120, "scores": {"stomp": 2.5},
+         "reason": "角速度{value:.1f}°/s符合跺脚范围"},
+        {"feature": "y_gyro_std", "min": 50, "max": 100, "scores": {"kick": 2.5},
+         "reason": "角速度{value:.1f}°/s符合踢腿范围"},
+        # 运动尖锐度 vs 平滑度: 跺脚更尖锐，踢腿更平滑
+        {"feature": "transition_sharpness", "above": 0.5, "scores": {"stomp": 2.0},
+         "reason": "运动尖锐度{value:.3f}高，偏向跺脚"},
+        {"feature": "motion_smoothness", "above": 0.3, "scores": {"kick": 1.5},
+         "reason": "运动平滑度{value:.3f}高，偏向踢腿"},
+        # 峰值强度
+        {"feature": "max_intensity", "above": 0.5, "scores": {"stomp": 1.5},
+         "reason": "峰值强度{value:.2f}高，偏向跺脚"},
+    ]
+}
+
+class RuleClassifier:
+    """表驱动的动作分类器: 规则区间掩码 × 权重矩阵，一次得到所有动作的得分
+
+    检测器只依赖classify(features)接口，返回结果字典或None，可替换为其他分类器。
+    """
+    def __init__(self, config=DEFAULT_CLASSIFIER_CONFIG):
+        self.config = config
+        self.actions = list(config["actions"])
+        self.min_total_score = float(config.get("min_total_score", 4.0))
+        self.min_action_score = float(config.get("min_action_score", 5.0))
+        self.confidence_scale = float(config.get("confidence_scale", 10.0))
+        self.max_confidence = float(config.get("max_confidence", 0.95))
+        
+        rules = config["rules"]
+        if not self.actions or not rules:
+            raise ValueError("分类器配置需要至少一个动作和一条规则")
+        self.feature_names = list(dict.fromkeys(rule["feature"] for rule in rules))
+        self.rule_feature = np.array([self.feature_names.index(rule["feature"]) for rule in rules])
+        self.lower = np.full(len(rules), -np.inf)
+        self.upper = np.full(len(rules), np.inf)
+        self.lower_open = np.zeros(len(rules), dtype=bool)
+        self.upper_open = np.zeros(len(rules), dtype=bool)
+        self.weights = np.zeros((len(rules), len(self.actions)))
+        self.reasons = []
+        for i, rule in enumerate(rules):
+            if "min" in rule and "above" in rule or "max" in rule and "below" in rule:
+                raise ValueError(f"规则边界重复: {rule}")
+            if "above" in rule:
+                self.lower[i], self.lower_open[i] = rule["above"], True
+            elif "min" in rule:
+                self.lower[i] = rule["min"]
+            if "below" in rule:
+                self.upper[i], self.upper_open[i] = rule["below"], True
+            elif "max" in rule:
+                self.upper[i] = rule["max"]
+            for action, weight in rule["scores"].items():
+                if action not in self.actions:
+                    raise ValueError(f"规则引用了未声明的动作: {action}")
+                self.weights[i, self.actions.index(action)] = weight
+            self.reasons.append(rule.get("reason", f"{rule['feature']}={{value:.3f}}"))
+
+    def feature_vector(self, features):
+        """按分类器的特征顺序把特征字典转换为向量"""
+        return np.array([features[name] for name in self.feature_names], dtype=np.float64)
+
+    def rule_mask(self, X, lower=None, upper=None):
+        """计算规则命中掩码: X为(..., 特征数)，lower/upper可带前置批维度以同时评估多组阈值"""
+        lower = self.lower if lower is None else lower
+        upper = self.upper if upper is None else upper
+        values = np.asarray(X)[..., self.rule_feature]
+        if lower is not self.lower or upper is not self.upper:
+            # 多组阈值: (参数组, 1, 规则数)与(样本数, 规则数)广播
+            lower = np.asarray(lower)[..., None, :] if np.ndim(lower) > 1 else lower
+            upper = np.asarray(upper)[..., None, :] if np.ndim(upper) > 1 else upper
+        above = np.where(self.lower_open, values > lower, values >= lower)
+        below = np.where(self.upper_open, values < upper, values <= upper)
+        return above & below
+
+    def score(self, X, lower=None, upper=None, weights=None):
+        """返回各动作得分(..., 动作数)"""
+        weights = self.weights if weights is None else weights
+        return self.rule_mask(X, lower, upper) @ weights
+
+    def decide(self, scores):
+        """由得分决定动作: 返回(动作下标, 置信度)，-1表示不触发"""
+        best = scores.argmax(axis=-1)
+        best_score = scores.max(axis=-1)
+        unique = (scores == best_score[..., None]).sum(axis=-1) == 1
+        valid = (scores.sum(axis=-1) >= self.min_total_score) & unique & (best_score > self.min_action_score)
+        confidence = np.minimum(best_score / self.confidence_scale, self.max_confidence)
+        return np.where(valid, best, -1), np.where(valid, confidence, 0.0)
+
+    def classify(self, features):
+        """对一个完整运动序列的特征分类，返回结果字典或None"""
+        x = self.feature_vector(features)
+        mask = self.rule_mask(x)
+        scores = mask @ self.weights
+        index, confidence = self.decide(scores)
+        if index < 0:
+            return None
+        values = x[self.rule_feature]
+        return {
+            "action": self.actions[index],
+            "confidence": float(confidence),
+            "scores": dict(zip(self.actions, scores.tolist())),
+            "reasons": [self.reasons[i].format(value=values[i]) for i in np.flatnonzero(mask)],
+            "features": features
+        }
+
+class LinearClassifier:
+    """训练得到的多项逻辑回归分类器(见imu_trainer.py)，纯NumPy推理
+
+    模型为各动作加一个"无动作"类别的线性得分，标准化参数在加载时合并进权重，
+    推理只需一次向量乘法和softmax。与RuleClassifier接口相同。
+    """
+    def __init__(self, model):
+        if model.get("type") != "logistic":
+            raise ValueError(f"未知的模型类型: {model.get('type')}")
+        self.model = model
+        self.actions = list(model["actions"])
+        self.feature_names = list(model["feature_names"])
+        self.min_confidence = float(model.get("min_confidence", 0.5))
+        self.max_confidence = float(model.get("max_confidence", 0.95))
+        
+        mean = np.asarray(model["mean"], dtype=np.float64)
+        scale = np.asarray(model["scale"], dtype=np.float64)
+        weights = np.asarray(model["weights"], dtype=np.float64)
+        bias = np.asarray(model["bias"], dtype=np.float64)
+        if weights.shape != (len(self.feature_names), len(self.actions) + 1) or bias.shape != (len(self.actions) + 1,):
+            raise ValueError(f"模型权重形状不匹配: {weights.shape}")
+        # (x - mean) / scale @ W + b = x @ (W / scale) + (b - (mean / scale) @ W)
+        self.mean = mean
+        self.weights = weights / scale[:, None]
+        self.bias = bias - (mean / scale) @ weights
+
+    def feature_vector(self, features):
+        """按模型的特征顺序把特征字典转换为向量"""
+        return np.array([features[name] for name in self.feature_names], dtype=np.float64)
+
+    def predict_proba(self, X):
+        """返回各类别概率(..., 动作数 + 1)，最后一列为无动作"""
+        logits = np.asarray(X) @ self.weights + self.bias
+        logits -= logits.max(axis=-1, keepdims=True)
+        p = np.exp(logits)
+        return p / p.sum(axis=-1, keepdims=True)
+
+    def classify(self, features):
+        """对一个运动序列的特征分类，返回结果字典或None(无动作或概率不足)"""
+        x = self.feature_vector(features)
+        logits = (x @ self.weights + self.bias).tolist()
+        # 类别很少，softmax和取最大值用Python完成比小数组上的NumPy调用更快
+        top = max(logits)
+        p = [math.exp(v - top) for v in logits]
+        total = sum(p)
+        index = logits.index(top)
+        confidence = p[index] / total
+        if index >= len(self.actions) or confidence < self.min_confidence:
+            return None
+        # 诊断: 相对训练集均值，对胜出动作贡献最大的三个特征
+        contributions = ((x - self.mean) * self.weights[:, index]).tolist()
+        ranked = sorted(range(len(contributions)), key=contributions.__getitem__, reverse=True)[:3]
+        values = x.tolist()
+        return {
+            "action": self.actions[index],
+            "confidence": min(confidence, self.max_confidence),
+            "scores": {action: v / total for action, v in zip(self.actions, p)},
+            "reasons": [f"{self.feature_names[i]}={values[i]:.3f}偏向{self.actions[index]}" for i in ranked
+                        if contributions[i] > 0],
+            "features": features
+        }
+
+def load_classifier(spec, base_dir="."):
+    """从配置创建分类器: spec为规则表或模型(type为logistic)字典，或JSON文件路径(相对于设备配置文件)
+
+    分类器文件无法读取或模型无效时记录错误并回退到内置规则表(也是训练模型的比较基线)。
+    """
+    if spec is None:
+        return RuleClassifier()
+    if isinstance(spec, str):
+        path = os.path.join(base_dir, spec)
+        try:
+            with open(path, encoding="utf-8") as f:
+                spec = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"无法读取分类器文件 {path}: {e}，使用内置规则表")
+            return RuleClassifier()
+    if "type" in spec:
+        try:
+            classifier = LinearClassifier(spec)
+        except (KeyError, ValueError) as e:
+            logger.error(f"无法加载分类模型: {e}，使用内置规则表")
+            return RuleClassifier()
+    else:
+        classifier = RuleClassifier(spec)
+    for action in classifier.actions:
+        # 新动作自动分配二进制事件代码
+        ACTION_CODES.setdefault(action, max(ACTION_CODES.values(), default=0) + 1)
+    return classifier
+
+class SequentialMotionDetector:
+    def __init__(self, classifier=None):
         # 运动状态跟踪
         self.motion_state = "idle"  # idle, building, analyzing
         self.motion_start_time = 0
-        self.motion_data_buffer = []
+        self.motion_data_buffer = MotionSequenceBuffer()
         self.min_motion_duration = 0.5  # 最小运动持续时间
         self.max_motion_duration = 3.0  # 最大运动持续时间
         self.motion_intensity_threshold = 0.12
         
-        # 基于真实数据的运动模式特征
-        self.motion_patterns = {
-            'stomp': {
-                # 跺脚完整序列特征
-                'total_duration_range': (0.8, 2.5),      # 跺脚持续时间
-                'peak_intensity_threshold': 0.5,          # 峰值强度
-                'z_range_threshold': 3.0,                 # Z轴范围大
-                'sharp_transition_count': 2,              # 尖锐变化次数多
-                'final_gyro_range': (15, 120),           # 最终角速度范围
-            },
-            'kick': {
-                # 踢腿完整序列特征  
-                'total_duration_range': (1.0, 3.5),      # 踢腿持续时间更长
-                'peak_intensity_threshold': 0.4,          # 峰值强度
-                'z_range_threshold': 1.5,                 # Z轴范围相对小
-                'smooth_transition_score': 0.3,           # 平滑变化更多
-                'final_gyro_range': (50, 100),           # 最终角速度范围
-            }
-        }
+        # 提前决策: 运动进行中持续对部分序列分类，置信度达到阈值即发出事件(每个运动序列最多一次)
+        # 内置规则表在合成基准数据上(默认阈值0.9): 跺脚约2.6s(p50)、踢腿约3.0s识别(完整序列模式均约3.1s)，不增加误报；
+        # 阈值0.7时跺脚约1.05s、踢腿约2.0s，但噪声段的部分序列置信度可达0.8，会误报跺脚并用冷却时间挡住随后的动作
+        self.early_decision = default_early_decision
+        self.early_confidence_threshold = 0.9
+        self.early_min_duration = 0.1  # 部分序列至少持续该时间(秒)才尝试分类
+        self.provisional_events = default_provisional_events  # 运动开始时先发出临时的motion_started事件
+        self.partial_features = IncrementalMotionFeatures()
+        self.partial_tracking = False  # 部分序列特征是否从本次运动开始就在更新(运动中途开启提前决策时要等下一次运动)
+        self.motion_decided = False
+        
+        # 数据缓冲区与当前窗口增量统计(用于运动开始/结束判断)
+        self.sample_buffer = IMURingBuffer(WINDOW_SIZE)
+        self.window_stats = SlidingWindowStats(15)
+        
+        # 检测状态与统计
+        self.cooldown_time = COOLDOWN_TIME
+        self.metrics = None  # 可选的PipelineMetrics，记录特征提取和分类耗时
+        # 可选的回调(运动开始, 结束时间, 特征, 分类结果, 是否发出事件)，每个分析过的运动序列调用一次(会话记录用)
+        self.motion_sink = None
+        self.last_motion_features = None
+        self.last_detection_time = 0
+        self.detection_stats = {"total_processed": 0}
+        
+        # 完整运动序列分类器(规则表可通过配置替换)
+        self.classifier = None
+        self.set_classifier(classifier or RuleClassifier())
         
+    def set_classifier(self, classifier):
+        """更换分类器，并为其动作初始化识别计数"""
+        self.classifier = classifier
+        for action in classifier.actions:
+            self.detection_stats.setdefault(action, 0)
+        # 增量特征不含峰值计数(依赖整个序列的标准差)，只在分类器用到时对部分序列重新统计
+        self.partial_peak_counts = bool({'peak_count_x', 'peak_count_z'} & set(classifier.feature_names))
+    
     def detect_motion_start(self, current_features):
         """检测运动开始"""
         motion_intensity = (current_features['x_std'] + 
@@ -92,23 +1084,33 @@ class SequentialMotionDetector:
         # 如果最近的强度都低于阈值，认为运动结束
         return all(intensity < self.motion_intensity_threshold * 0.5 for intensity in recent_intensities)
         
-    def extract_motion_features(self, accel_data, gyro_data, time_data):
-        """提取运动特征"""
+    def extract_motion_features(self, imu_data, time_data):
+        """提取运动特征(imu_data为(N, 6)数组，全部特征向量化计算)"""
+        n = len(imu_data)
+        # 加速度X、加速度Z、角速度Y三列一次性计算
+        axes = imu_data[:, [AX, AZ, GY]]
+        stds = axes.std(axis=0)
+        ranges = axes.max(axis=0) - axes.min(axis=0)
+        abs_axes = np.abs(axes)
+        
+        # 峰值特征: 超过两倍标准差的样本数
+        peak_counts = (abs_axes[:, :2] > stds[:2] * 2).sum(axis=0)
+        
         features = {
             # 基础统计特征
-            'x_std': np.std(accel_data['x']),
-            'z_std': np.std(accel_data['z']),
-            'y_gyro_std': np.std(gyro_data['y']),
-            'x_range': np.max(accel_data['x']) - np.min(accel_data['x']),
-            'z_range': np.max(accel_data['z']) - np.min(accel_data['z']),
-            'y_gyro_range': np.max(gyro_data['y']) - np.min(gyro_data['y']),
+            'x_std': stds[0],
+            'z_std': stds[1],
+            'y_gyro_std': stds[2],
+            'x_range': ranges[0],
+            'z_range': ranges[1],
+            'y_gyro_range': ranges[2],
             
             # 时间特征
-            'duration': time_data[-1] - time_data[0] if len(time_data) > 1 else 0,
+            'duration': time_data[-1] - time_data[0] if n > 1 else 0,
             
             # 峰值特征
-            'peak_count_x': len([v for v in accel_data['x'] if abs(v) > np.std(accel_data['x']) * 2]),
-            'peak_count_z': len([v for v in accel_data['z'] if abs(v) > np.std(accel_data['z']) * 2]),
+            'peak_count_x': int(peak_counts[0]),
+            'peak_count_z': int(peak_counts[1]),
             
             # 运动模式特征
             'max_intensity': 0,
@@ -117,24 +1119,16 @@ class SequentialMotionDetector:
         }
         
         # 计算最大运动强度
-        intensities = []
-        for i in range(len(accel_data['x'])):
-            intensity = abs(accel_data['x'][i]) + abs(accel_data['z'][i]) + abs(gyro_data['y'][i])/100
-            intensities.append(intensity)
-        
-        features['max_intensity'] = max(intensities) if intensities else 0
+        if n > 0:
+            features['max_intensity'] = float((abs_axes[:, 0] + abs_axes[:, 1] + abs_axes[:, 2] / 100).max())
         
-        # 计算变化尖锐度（跺脚应该更尖锐）
-        if len(accel_data['x']) > 4:
-            x_diff2 = np.diff(np.diff(accel_data['x']))
-            z_diff2 = np.diff(np.diff(accel_data['z']))
-            features['transition_sharpness'] = np.var(x_diff2) + np.var(z_diff2)
-        
-        # 计算运动平滑度（踢腿应该更平滑）
-        if len(accel_data['x']) > 4:
-            x_smooth = 1.0 / (1.0 + np.var(np.diff(accel_data['x'])))
-            z_smooth = 1.0 / (1.0 + np.var(np.diff(accel_data['z'])))
-            features['motion_smoothness'] = (x_smooth + z_smooth) / 2
+        if n > 4:
+            diff1 = np.diff(axes[:, :2], axis=0)
+            diff2 = np.diff(diff1, axis=0)
+            # 计算变化尖锐度（跺脚应该更尖锐）
+            features['transition_sharpness'] = diff2.var(axis=0).sum()
+            # 计算运动平滑度（踢腿应该更平滑）
+            features['motion_smoothness'] = (1.0 / (1.0 + diff1.var(axis=0))).mean()
         
         return features
     
@@ -143,17 +1137,11 @@ class SequentialMotionDetector:
         if len(motion_data) < 10:
             return None
         
-        # 提取所有数据
-        accel_x = [d['accel']['x'] for d in motion_data]
-        accel_z = [d['accel']['z'] for d in motion_data]
-        gyro_y = [d['gyro']['y'] for d in motion_data]
-        time_data = [d['timestamp'] for d in motion_data]
-        
-        accel_data = {'x': accel_x, 'z': accel_z}
-        gyro_data = {'y': gyro_y}
-        
         # 提取完整运动特征
-        features = self.extract_motion_features(accel_data, gyro_data, time_data)
+        start = time.perf_counter()
+        features = self.extract_motion_features(motion_data.imu, motion_data.timestamps)
+        feature_done = time.perf_counter()
+        self.last_motion_features = features
         
         logger.info(f"🔍 分析完整动作序列:")
         logger.info(f"   持续时间: {features['duration']:.2f}秒")
@@ -162,121 +1150,82 @@ class SequentialMotionDetector:
         logger.info(f"   运动特征: 最大强度={features['max_intensity']:.2f}, 尖锐度={features['transition_sharpness']:.3f}, 平滑度={features['motion_smoothness']:.3f}")
         
         # 基于完整序列分类
-        return self.classify_complete_motion(features)
+        result = self.classify_complete_motion(features)
+        if self.metrics:
+            self.metrics.observe("feature", feature_done - start)
+            self.metrics.observe("classify", time.perf_counter() - feature_done)
+        return result
     
     def classify_complete_motion(self, features):
         """基于完整运动序列分类"""
-        
-        stomp_score = 0
-        kick_score = 0
-        reasons = []
-        
-        # 特征1: 持续时间
-        duration = features['duration']
-        stomp_duration_range = self.motion_patterns['stomp']['total_duration_range']
-        kick_duration_range = self.motion_patterns['kick']['total_duration_range']
-        
-        if stomp_duration_range[0] <= duration <= stomp_duration_range[1]:
-            stomp_score += 2.0
-            reasons.append(f"持续时间{duration:.2f}s符合跺脚范围")
-        
-        if kick_duration_range[0] <= duration <= kick_duration_range[1]:
-            kick_score += 2.0
-            reasons.append(f"持续时间{duration:.2f}s符合踢腿范围")
-        
-        # 特征2: Z轴范围（关键区分特征）
-        z_range = features['z_range']
-        if z_range > self.motion_patterns['stomp']['z_range_threshold']:
-            stomp_score += 3.0
-            reasons.append(f"Z轴范围{z_range:.2f}G大，偏向跺脚")
-        elif z_range < self.motion_patterns['kick']['z_range_threshold']:
-            kick_score += 2.5
-            reasons.append(f"Z轴范围{z_range:.2f}G小，偏向踢腿")
-        
-        # 特征3: 最终角速度
-        gyro_std = features['y_gyro_std']
-        stomp_gyro_range = self.motion_patterns['stomp']['final_gyro_range']
-        kick_gyro_range = self.motion_patterns['kick']['final_gyro_range']
-        
-        if stomp_gyro_range[0] <= gyro_std <= stomp_gyro_range[1]:
-            stomp_score += 2.5
-            reasons.append(f"角速度{gyro_std:.1f}°/s符合跺脚范围")
-        
-        if kick_gyro_range[0] <= gyro_std <= kick_gyro_range[1]:
-            kick_score += 2.5
-            reasons.append(f"角速度{gyro_std:.1f}°/s符合踢腿范围")
-        
-        # 特征4: 运动尖锐度 vs 平滑度
-        sharpness = features['transition_sharpness']
-        smoothness = features['motion_smoothness']
-        
-        if sharpness > 0.5:  # 跺脚更尖锐
-            stomp_score += 2.0
-            reasons.append(f"运动尖锐度{sharpness:.3f}高，偏向跺脚")
-        
-        if smoothness > 0.3:  # 踢腿更平滑
-            kick_score += 1.5
-            reasons.append(f"运动平滑度{smoothness:.3f}高，偏向踢腿")
-        
-        # 特征5: 峰值强度
-        max_intensity = features['max_intensity']
-        if max_intensity > self.motion_patterns['stomp']['peak_intensity_threshold']:
-            stomp_score += 1.5
-            reasons.append(f"峰值强度{max_intensity:.2f}高，偏向跺脚")
-        
-        # 决策
-        total_score = stomp_score + kick_score
-        if total_score < 4.0:  # 总分太低，可能是噪声
+        return self.classifier.classify(features)
+    
+    def partial_motion_features(self):
+        """当前部分序列的特征，定义与extract_motion_features一致"""
+        features = self.partial_features.features()
+        if self.partial_peak_counts:
+            # 峰值计数: 按当前标准差统计已收集的样本(O(n)，只在规则用到时计算)
+            abs_xz = np.abs(self.motion_data_buffer.imu[:, [AX, AZ]])
+            peaks = (abs_xz > np.array([features['x_std'], features['z_std']]) * 2).sum(axis=0)
+            features['peak_count_x'] = int(peaks[0])
+            features['peak_count_z'] = int(peaks[1])
+        return features
+    
+    def classify_partial_motion(self, imu, current_time, motion_duration):
+        """提前决策: 增量更新部分序列特征并分类，置信度足够且不在冷却期时返回结果"""
+        self.partial_features.update(current_time, imu)
+        if motion_duration < self.early_min_duration or self.partial_features.count < 10:
             return None
         
-        if stomp_score > kick_score and stomp_score > 5.0:
-            confidence = min(stomp_score / 10.0, 0.95)
-            return {
-                "action": "stomp",
-                "confidence": confidence,
-                "scores": {"stomp": stomp_score, "kick": kick_score},
-                "reasons": reasons,
-                "features": features
-            }
-        elif kick_score > stomp_score and kick_score > 5.0:
-            confidence = min(kick_score / 10.0, 0.95)
-            return {
-                "action": "kick", 
-                "confidence": confidence,
-                "scores": {"stomp": stomp_score, "kick": kick_score},
-                "reasons": reasons,
-                "features": features
-            }
+        start = time.perf_counter()
+        result = self.classifier.classify(self.partial_motion_features())
+        if self.metrics:
+            self.metrics.observe("classify", time.perf_counter() - start)
+        if (not result or result["confidence"] < self.early_confidence_threshold or
+                current_time - self.last_detection_time <= self.cooldown_time):
+            return None
         
-        return None
+        # 本序列已决策，剩余部分继续收集直到运动结束，但不再发出事件
+        self.motion_decided = True
+        self.last_detection_time = current_time
+        self.detection_stats[result["action"]] = self.detection_stats.get(result["action"], 0) + 1
+        result["timestamp"] = current_time
+        result["motion_start"] = self.motion_start_time
+        result["early"] = True
+        if self.motion_sink:
+            self.motion_sink(self.motion_start_time, current_time, result["features"], result, True)
+        logger.info(f"⚡ 提前识别: {result['action']} (置信度: {result['confidence']:.2f}, 运动开始后{motion_duration * 1000:.0f}ms)")
+        return result
     
-    def process_motion_sequence(self, accel_data, gyro_data, timestamp):
-        """处理运动序列"""
-        global last_detection_time, detection_stats
-        
-        current_time = timestamp
+    def process_motion_sequence(self, imu, timestamp):
+        """处理单个样本(六轴数值序列)"""
+        self.sample_buffer.append(timestamp, imu)
+        return self._advance(imu, timestamp, len(self.sample_buffer))
+    
+    def process_motion_batch(self, timestamps, imu_block):
+        """批量处理样本: 一次写入缓冲区，再逐样本推进状态机，返回检测结果列表"""
+        buffered = len(self.sample_buffer)
+        self.sample_buffer.extend(timestamps, imu_block)
+        results = []
+        for current_time, imu in zip(timestamps.tolist(), imu_block.tolist()):
+            buffered += 1
+            result = self._advance(imu, current_time, buffered)
+            if result:
+                results.append(result)
+        return results
+    
+    def _advance(self, imu, current_time, buffered):
+        """运动序列状态机，处理一个已写入缓冲区的样本"""
+        detection_stats = self.detection_stats
         detection_stats["total_processed"] += 1
         
-        # 添加数据到缓冲区
-        accel_buffer.append(accel_data)
-        gyro_buffer.append(gyro_data)
-        time_buffer.append(current_time)
+        # 增量更新当前窗口统计
+        self.window_stats.update(imu)
         
-        if len(accel_buffer) < 20:
+        if buffered < 20:
             return None
         
-        # 提取当前窗口特征
-        window_size = 15
-        recent_accel = {
-            'x': [a["x"] for a in list(accel_buffer)[-window_size:]],
-            'z': [a["z"] for a in list(accel_buffer)[-window_size:]]
-        }
-        recent_gyro = {
-            'y': [g["y"] for g in list(gyro_buffer)[-window_size:]]
-        }
-        recent_time = list(time_buffer)[-window_size:]
-        
-        current_features = self.extract_motion_features(recent_accel, recent_gyro, recent_time)
+        current_features = self.window_stats.features()
         
         # 状态机处理
         if self.motion_state == "idle":
@@ -284,21 +1233,35 @@ class SequentialMotionDetector:
             if self.detect_motion_start(current_features):
                 self.motion_state = "building"
                 self.motion_start_time = current_time
-                self.motion_data_buffer = []
+                self.motion_data_buffer.clear()
+                self.partial_features.reset()
+                self.partial_tracking = self.early_decision
+                self.motion_decided = False
                 logger.info("🎬 检测到运动开始")
+                if self.provisional_events and current_time - self.last_detection_time > self.cooldown_time:
+                    return {
+                        "action": "motion_started",
+                        "provisional": True,
+                        "confidence": 0.0,
+                        "timestamp": current_time,
+                        "scores": {},
+                        "reasons": [],
+                    }
         
         elif self.motion_state == "building":
             # 收集运动数据
-            motion_point = {
-                'timestamp': current_time,
-                'accel': accel_data.copy(),
-                'gyro': gyro_data.copy()
-            }
-            self.motion_data_buffer.append(motion_point)
+            self.motion_data_buffer.append(current_time, imu)
             
             # 检查是否运动结束或超时
             motion_duration = current_time - self.motion_start_time
             
+            # 运动中途开启的提前决策缺少已收集样本的部分特征，从下一次运动开始才生效
+            self.partial_tracking = self.partial_tracking and self.early_decision
+            if self.partial_tracking and not self.motion_decided:
+                result = self.classify_partial_motion(imu, current_time, motion_duration)
+                if result:
+                    return result
+            
             if motion_duration > self.max_motion_duration:
                 # 运动超时，强制分析
                 logger.info(f"⏰ 运动超时({motion_duration:.1f}s)，开始分析")
@@ -308,132 +1271,1606 @@ class SequentialMotionDetector:
                 # 运动自然结束
                 logger.info(f"🛑 检测到运动结束({motion_duration:.1f}s)，开始分析")
                 self.motion_state = "analyzing"
+
+            # 提前决策模式在运动结束的样本上立即分析；默认模式保持原有行为，在下一个样本上分析
+            if self.motion_state == "analyzing" and self.early_decision:
+                return self.finish_motion(current_time)
         
         elif self.motion_state == "analyzing":
-            # 分析完整运动
-            result = self.analyze_complete_motion(self.motion_data_buffer)
-            
-            # 重置状态
-            self.motion_state = "idle"
-            self.motion_data_buffer = []
-            
-            if result and current_time - last_detection_time > COOLDOWN_TIME:
-                last_detection_time = current_time
-                detection_stats[result["action"]] = detection_stats.get(result["action"], 0) + 1
-                
-                logger.info(f"🎯 完整动作识别: {result['action']} (置信度: {result['confidence']:.2f})")
-                logger.info(f"   得分: 跺脚={result['scores']['stomp']:.1f}, 踢腿={result['scores']['kick']:.1f}")
-                logger.info(f"   主要原因: {'; '.join(result['reasons'][:3])}")
-                
-                return result
+            return self.finish_motion(current_time)
         
         return None
+    
+    def finish_motion(self, current_time):
+        """分析刚结束的运动序列并回到idle，不在冷却期时返回检测结果"""
+        # 已提前决策的序列不再重复分析
+        self.last_motion_features = None
+        result = None if self.motion_decided else self.analyze_complete_motion(self.motion_data_buffer)
+        
+        # 重置状态
+        self.motion_state = "idle"
+        self.motion_data_buffer.clear()
+        
+        emitted = bool(result) and current_time - self.last_detection_time > self.cooldown_time
+        if self.motion_sink and self.last_motion_features is not None:
+            self.motion_sink(self.motion_start_time, current_time, self.last_motion_features, result, emitted)
+        
+        if not emitted:
+            return None
+        detection_stats = self.detection_stats
+        self.last_detection_time = current_time
+        detection_stats[result["action"]] = detection_stats.get(result["action"], 0) + 1
+        result["timestamp"] = current_time
+        result["motion_start"] = self.motion_start_time
+        
+        logger.info(f"🎯 完整动作识别: {result['action']} (置信度: {result['confidence']:.2f})")
+        logger.info(f"   得分: {', '.join(f'{k}={v:.1f}' for k, v in result['scores'].items())}")
+        logger.info(f"   主要原因: {'; '.join(result['reasons'][:3])}")
+        return result
 
-# 创建序列检测器
-detector = SequentialMotionDetector()
+class IMUDevice:
+    """单个IMU设备: 连接配置以及独立的检测器和缓冲区"""
+    def __init__(self, device_id, name=None, address=None,
+                 service_uuid=SERVICE_UUID, characteristic_uuid=CHARACTERISTIC_UUID,
+                 parser=None, classifier=None, imu_filter=None):
+        self.device_id = device_id
+        self.name = name
+        self.address = address
+        self.service_uuid = service_uuid
+        self.characteristic_uuid = characteristic_uuid
+        self.parser = parser or IMUFrameParser()
+        self.filter = imu_filter  # 可选的IMUFilter，在检测前处理解析后的样本
+        self.detector = SequentialMotionDetector(classifier)
+        self.metrics = PipelineMetrics()
+        self.detector.metrics = self.metrics
+        self.connected = False
+        
+        # BLE回调只把原始通知放入有界队列，由消费任务批量处理
+        self.frame_queue = asyncio.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.dropped_frames = 0
+        
+        # 原始通知录制和训练会话存储(可选)
+        self.recorder = None
+        self.session = None
+        
+        # BLE连接管理器(连接后创建)
+        self.connection = None
+        
+        # 多进程检测时设备所在的工作进程(WorkerHandle)，为None时在主进程中检测
+        self.worker = None
+        
+        # 校准: 当前生效的校准结果，以及进行中的静止采集
+        self.calibration = None
+        self.calibration_collector = None
+        
+        # 传感器数据订阅: ClientConnection -> SensorSubscription，以及按来源缓存的样本(只在有订阅时写入)
+        self.subscriptions = {}
+        self.sensor_buffers = {}
+        self.stream_task = None
+        
+        # 客户端自己的检测器: ClientConnection -> DetectionSession，这些客户端不再接收共享检测器的事件
+        self.detection_sessions = {}
+
+    def enqueue_frame(self, data, arrival_time=None):
+        """放入一个原始通知，队列满时丢弃最旧的通知并计数"""
+        if self.frame_queue.full():
+            self.frame_queue.get_nowait()
+            self.dropped_frames += 1
+            if self.dropped_frames % 100 == 1:
+                logger.warning(f"[{self.device_id}] 通知队列已满，已丢弃 {self.dropped_frames} 个最旧的通知")
+        if arrival_time is None:
+            arrival_time = time.monotonic()
+        self.frame_queue.put_nowait((arrival_time, time.perf_counter(), data))
+
+    def get_stats(self):
+        """设备的检测统计和状态(多进程检测时检测状态来自工作进程最近一次回传)"""
+        stats = {
+            "stats": self.detector.detection_stats,
+            "buffer_size": len(self.detector.sample_buffer),
+            "motion_state": self.detector.motion_state,
+            "connected": self.connected,
+            "queue_depth": self.frame_queue.qsize(),
+            "queue_capacity": self.frame_queue.maxsize,
+            "dropped_frames": self.dropped_frames,
+            "calibration": self.calibration,
+            "connection": self.connection.get_stats() if self.connection else None,
+            "clock": self.parser.clock.get_stats() if self.parser.clock else None,
+            "params": {name: getattr(self.detector, name) for name in DETECTOR_PARAMS},
+            "detection_sessions": len(self.detection_sessions)
+        }
+        if self.worker and self.worker.state:
+            stats.update(self.worker.state)
+        return stats
+
+    @property
+    def calibration_key(self):
+        """校准结果按设备地址保存(无地址时用名称或ID)"""
+        return self.address or self.name or self.device_id
+
+# 所有IMU设备，按设备ID索引
+devices = {}
+
+def load_device_config(path=DEVICES_CONFIG_FILE):
+    """读取设备配置文件，文件不存在时使用单设备默认配置"""
+    if not os.path.exists(path):
+        logger.warning(f"未找到设备配置文件 {path}，使用默认设备 {DEVICE_NAME} ({DEVICE_ADDRESS})")
+        return [IMUDevice("default", DEVICE_NAME, DEVICE_ADDRESS)]
+    
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    
+    # 分类器规则表: 顶层classifier对所有设备生效，设备条目中的classifier覆盖它
+    base_dir = os.path.dirname(os.path.abspath(path))
+    default_classifier = config.get("classifier")
+    
+    result = []
+    for entry in config.get("devices", []):
+        if not entry.get("address") and not entry.get("name"):
+            raise ValueError(f"设备配置缺少name或address: {entry}")
+        device_id = entry.get("id") or entry.get("address") or entry.get("name")
+        if any(d.device_id == device_id for d in result):
+            raise ValueError(f"设备ID重复: {device_id}")
+        parser = IMUFrameParser(
+            header_size=entry.get("header_size", 10),
+            samples_per_frame=entry.get("samples_per_frame", 1),
+            sample_stride=entry.get("sample_stride", 12),
+            sample_rate=entry.get("sample_rate")
+        )
+        parser.clock = load_clock(entry.get("clock"), parser)
+        result.append(IMUDevice(
+            device_id,
+            name=entry.get("name"),
+            address=entry.get("address"),
+            service_uuid=entry.get("service_uuid", SERVICE_UUID),
+            characteristic_uuid=entry.get("characteristic_uuid", CHARACTERISTIC_UUID),
+            parser=parser,
+            classifier=load_classifier(entry.get("classifier", default_classifier), base_dir),
+            imu_filter=load_filter(entry.get("filter"), parser)
+        ))
+    
+    if not result:
+        raise ValueError(f"设备配置文件中没有设备: {path}")
+    return result
+
+def load_filter(spec, parser):
+    """从设备配置创建滤波阶段: spec为true或参数字典，未配置时不滤波"""
+    if not spec:
+        return None
+    options = dict(spec) if isinstance(spec, dict) else {}
+    options.setdefault("sample_rate", parser.sample_rate)
+    return IMUFilter(**options)
+
+def load_clock(spec, parser):
+    """从设备配置创建样本时钟: spec为来源名("nominal"/"counter"/"timestamp")或参数字典，未配置或arrival时使用到达时间"""
+    if not spec:
+        return None
+    options = {"source": spec} if isinstance(spec, str) else dict(spec)
+    if options.get("source", "nominal") == "arrival":
+        return None
+    options.setdefault("sample_rate", parser.sample_rate)
+    return SampleClock(samples_per_frame=parser.samples_per_frame, **options)
+
+def select_devices(data):
+    """根据命令中的device_id选择设备，未指定时返回全部设备"""
+    device_id = data.get("device_id")
+    if device_id is None:
+        return list(devices.values())
+    device = devices.get(device_id)
+    return [device] if device else []
+
+def wall_time(timestamp):
+    """把内部的单调时钟时间换算为墙钟时间"""
+    return timestamp + WALL_CLOCK_OFFSET
+
+def build_event_message(device, result, verbosity="full", stats=None):
+    """把检测结果转换为发送给Unity的JSON事件，verbosity决定附带的诊断字段(stats默认为设备共享检测器的统计)"""
+    event = {
+        "motion_type": result["action"],
+        "device_id": device.device_id,
+        "confidence": result["confidence"],
+        "timestamp": wall_time(result["timestamp"])
+    }
+    if verbosity != "minimal":
+        event["scores"] = result["scores"]
+    if verbosity == "full":
+        event["reasons"] = result["reasons"]
+        event["stats"] = device.detector.detection_stats if stats is None else stats
+        event["algorithm"] = "Sequential Motion Detection"
+    return json.dumps(event)
+
+def build_event_frame(device, result):
+    """把检测结果打包为紧凑的二进制事件帧"""
+    device_id = device.device_id.encode("utf-8")[:255]
+    header = EVENT_FRAME_HEADER.pack(EVENT_FRAME_MAGIC, EVENT_FRAME_VERSION,
+                                     ACTION_CODES.get(result["action"], 0), len(device_id),
+                                     result["confidence"], wall_time(result["timestamp"]))
+    return header + device_id
+
+def encode_event(device, result, encoding, stats=None):
+    """按客户端的事件编码("binary"或JSON详细程度)生成事件消息"""
+    if encoding == "binary":
+        return build_event_frame(device, result)
+    return build_event_message(device, result, encoding, stats)
 
 # 处理IMU数据的函数
-def process_imu_data(data):
-    """处理来自IMU的原始数据并转换为JSON格式"""
+def process_imu_data(device, data):
+    """处理来自IMU的一个原始通知，返回需要发送的JSON事件列表"""
+    return process_imu_frames(device, [data], [time.monotonic()])
+
+def process_imu_frames(device, frames, arrival_times):
+    """批量处理原始通知帧(按到达顺序)，返回需要发送的JSON事件列表"""
+    messages = []
+    for result in detect_imu_frames(device, frames, arrival_times):
+        # 如果检测到动作，则发送动作类型
+        logger.info(f"[{device.device_id}] 发送动作事件: {result['action']}")
+        messages.append(build_event_message(device, result))
+    return messages
+
+def detect_imu_frames(device, frames, arrival_times):
+    """解析原始通知帧并送入检测器，返回检测结果列表"""
     try:
-        # 记录原始数据
-        current_time = time.time()
-        
-        # 根据你的IMU数据格式调整这里的解析逻辑
-        if len(data) >= 22:
-            accel_x = int.from_bytes(data[10:12], byteorder='big', signed=True)
-            accel_y = int.from_bytes(data[12:14], byteorder='big', signed=True)
-            accel_z = int.from_bytes(data[14:16], byteorder='big', signed=True)
-            
-            gyro_x = int.from_bytes(data[16:18], byteorder='big', signed=True)
-            gyro_y = int.from_bytes(data[18:20], byteorder='big', signed=True)
-            gyro_z = int.from_bytes(data[20:22], byteorder='big', signed=True)
-            
-            # 转换为适当单位
-            accel_scale = 1.0 / 32768.0 * 16.0  # 假设±16G量程
-            gyro_scale = 1.0 / 32768.0 * 2000.0  # 假设±2000°/s量程
-            
-            accel_data = {
-                "x": accel_x * accel_scale,
-                "y": accel_y * accel_scale,
-                "z": accel_z * accel_scale
-            }
-            
-            gyro_data = {
-                "x": gyro_x * gyro_scale,
-                "y": gyro_y * gyro_scale,
-                "z": gyro_z * gyro_scale
-            }
-            
-            # 使用新的序列检测算法
-            detection_result = detector.process_motion_sequence(accel_data, gyro_data, current_time)
-            
-            # 如果检测到动作，则发送动作类型
-            if detection_result:
-                logger.info(f"发送动作事件: {detection_result['action']}")
-                return json.dumps({
-                    "motion_type": detection_result["action"],
-                    "confidence": detection_result["confidence"],
-                    "timestamp": current_time,
-                    "scores": detection_result["scores"],
-                    "reasons": detection_result["reasons"],
-                    "stats": detection_stats,
-                    "algorithm": "Sequential Motion Detection"
-                })
-            return None
+        parser = device.parser
+        detector = device.detector
+        
+        start = time.perf_counter()
+        if len(frames) == 1 and parser.samples_per_frame == 1 and parser.clock is None:
+            # 最常见的单帧单样本: struct直接解码，不经过NumPy
+            data = frames[0]
+            if len(data) < parser.min_frame_size:
+                logger.warning(f"[{device.device_id}] 数据长度不足: {len(data)} 字节")
+                return []
+            imu = parser.parse_frame(data)
+            parsed = time.perf_counter()
+            if device.calibration_collector:
+                device.calibration_collector.add(np.array([imu]))
+            if device.session:
+                device.session.add_sample(arrival_times[0], imu)
+            sensor_buffers = device.sensor_buffers
+            if "raw" in sensor_buffers:
+                sensor_buffers["raw"].append(arrival_times[0], imu)
+            if device.filter:
+                imu = device.filter.process(np.array([imu]))[0]
+                filtered = time.perf_counter()
+                device.metrics.observe("filter", filtered - parsed)
+                parsed = filtered
+            if "filtered" in sensor_buffers:
+                sensor_buffers["filtered"].append(arrival_times[0], imu)
+            result = detector.process_motion_sequence(imu, arrival_times[0])
+            results = [result] if result else []
+            for session in device.detection_sessions.values():
+                session.process_sample(imu, arrival_times[0])
         else:
-            logger.warning(f"数据长度不足: {len(data)} 字节")
-            return None
+            dropped = parser.clock.dropped_samples if parser.clock else 0
+            timestamps, imu = parser.parse_batch(frames, arrival_times)
+            parsed = time.perf_counter()
+            if len(timestamps) < len(frames) * parser.samples_per_frame:
+                logger.warning(f"[{device.device_id}] 跳过了长度不足的数据帧")
+            if parser.clock and parser.clock.dropped_samples > dropped and detector.motion_state == "building":
+                logger.warning(f"[{device.device_id}] 运动序列中丢失了 "
+                               f"{parser.clock.dropped_samples - dropped} 个样本，特征可能不准确")
+            if device.calibration_collector:
+                device.calibration_collector.add(imu)
+            if device.session:
+                device.session.add_samples(timestamps, imu)
+            sensor_buffers = device.sensor_buffers
+            if "raw" in sensor_buffers:
+                sensor_buffers["raw"].extend(timestamps, imu)
+            if device.filter:
+                imu = device.filter.process(imu)
+                filtered = time.perf_counter()
+                device.metrics.observe("filter", filtered - parsed)
+                parsed = filtered
+            if "filtered" in sensor_buffers:
+                sensor_buffers["filtered"].extend(timestamps, imu)
+            results = detector.process_motion_batch(timestamps, imu)
+            for session in device.detection_sessions.values():
+                session.process_batch(timestamps, imu)
+        
+        device.metrics.observe("parse", parsed - start)
+        device.metrics.observe("detect", time.perf_counter() - parsed)
+        return results
     except Exception as e:
-        logger.error(f"处理IMU数据出错: {e}")
-        return None
+        logger.error(f"[{device.device_id}] 处理IMU数据出错: {e}")
+        return []
+
+def recording_sidecar_path(path):
+    return os.path.splitext(path)[0] + RECORDING_SIDECAR_SUFFIX
 
-# 校准函数 - 保持原有功能
-async def calibrate_imu(websocket):
-    """校准IMU传感器"""
-    global accel_buffer, gyro_buffer
+def recording_config(device):
+    """设备当前的检测配置，回放时据此重建与实时检测相同的处理流程"""
+    classifier = device.detector.classifier
+    return {
+        "filter": device.filter.config if device.filter else None,
+        "offset": device.parser.offset.tolist(),
+        "detector": {name: getattr(device.detector, name) for name in DETECTOR_PARAMS},
+        "classifier": classifier.model if isinstance(classifier, LinearClassifier) else classifier.config,
+        "calibration": device.calibration,
+    }
+
+class FrameRecorder:
+    """把原始通知帧及到达时间(单调时钟)追加写入紧凑二进制录制文件
+
+    单调时钟在重启后重新计数，每次打开文件都在附属JSON中追加一段锚点，读取时按段换算为墙钟时间。
+    """
+    def __init__(self, path, device):
+        self.path = path
+        self.sidecar_path = recording_sidecar_path(path)
+        parser = device.parser
+        clock_fields = parser.clock.header_fields() if parser.clock else (0, 0, 0, 0, 0.0)
+        header = RECORDING_HEADER.pack(RECORDING_MAGIC, parser.header_size, parser.samples_per_frame,
+                                       parser.sample_stride, parser.sample_rate or 0.0,
+                                       device.device_id.encode("utf-8")[:32], *clock_fields)
+        self.sidecar = {"device_id": device.device_id, "segments": []}
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                if f.read(RECORDING_HEADER.size) != header:
+                    raise ValueError(f"录制文件与设备 {device.device_id} 的格式不一致: {path}")
+            self.first_frame = Recording(path).count
+            if os.path.exists(self.sidecar_path):
+                with open(self.sidecar_path, encoding="utf-8") as f:
+                    self.sidecar = json.load(f)
+            elif self.first_frame:
+                # 没有附属文件的旧录制: 到达时间已是墙钟时间
+                self.sidecar["segments"].append({"frame": 0, "wall_time": 0.0, "monotonic_time": 0.0})
+            self._file = open(path, "ab", buffering=64 * 1024)
+        else:
+            self.first_frame = 0
+            self._file = open(path, "ab", buffering=64 * 1024)
+            self._file.write(header)
+        self.frames_written = 0
+        self._last_flush = time.monotonic()
+        self.sidecar["segments"].append({"frame": self.first_frame, "wall_time": time.time(),
+                                         "monotonic_time": time.monotonic(), "config": recording_config(device)})
+        self._write_sidecar()
+
+    def mark_config(self, device):
+        """检测配置变化(校准、调整阈值)时开始新的一段，之后写入的帧按新配置回放"""
+        segment = dict(self.sidecar["segments"][-1])
+        segment["frame"] = self.first_frame + self.frames_written
+        segment["config"] = recording_config(device)
+        self.sidecar["segments"].append(segment)
+        self._write_sidecar()
+
+    def _write_sidecar(self):
+        tmp_path = self.sidecar_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.sidecar, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.sidecar_path)
+
+    def write_batch(self, arrival_times, frames):
+        pack = RECORD_HEADER.pack
+        parts = []
+        for arrival_time, data in zip(arrival_times, frames):
+            parts.append(pack(arrival_time, len(data)))
+            parts.append(data)
+        self._file.write(b''.join(parts))
+        self.frames_written += len(frames)
+        
+        now = time.monotonic()
+        if now - self._last_flush > RECORDING_FLUSH_INTERVAL:
+            self._file.flush()
+            self._last_flush = now
+
+    def close(self):
+        self._file.close()
+
+class Recording:
+    """内存映射方式读取录制文件"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self._mmap
+        if len(buf) < RECORDING_HEADER.size:
+            raise ValueError(f"不是有效的录制文件: {path}")
+        magic, header_size, samples_per_frame, sample_stride, sample_rate, device_id, *clock_fields = \
+            RECORDING_HEADER.unpack_from(buf, 0)
+        if magic != RECORDING_MAGIC:
+            raise ValueError(f"不是有效的录制文件: {path}")
+        self.device_id = device_id.rstrip(b"\0").decode("utf-8")
+        self.header_size = header_size
+        self.samples_per_frame = samples_per_frame
+        self.sample_stride = sample_stride
+        self.sample_rate = sample_rate or None
+        self.clock_fields = tuple(clock_fields)
+        self._index_records()
+        # 附属文件中的分段锚点；没有附属文件的旧录制到达时间已是墙钟时间
+        self.segments = []
+        sidecar_path = recording_sidecar_path(path)
+        if os.path.exists(sidecar_path):
+            with open(sidecar_path, encoding="utf-8") as f:
+                self.segments = json.load(f)["segments"]
+
+    def config_ranges(self):
+        """按检测配置分段的帧范围: [(起始帧, 结束帧, 配置)]，没有记录配置的旧录制配置为None"""
+        starts = {}
+        for segment in self.segments:
+            if segment["frame"] < self.count:
+                starts[segment["frame"]] = segment  # 同一帧开始的多段只有最后一段生效
+        segments = [starts[frame] for frame in sorted(starts)] or [{"frame": 0}]
+        bounds = [s["frame"] for s in segments[1:]] + [self.count]
+        return [(s["frame"] if i else 0, end, s.get("config")) for i, (s, end) in enumerate(zip(segments, bounds))]
+
+    def wall_times(self):
+        """每帧的到达时间换算为墙钟时间(Unix秒)，各段使用各自的锚点"""
+        offsets = np.zeros(self.count)
+        for segment in self.segments:
+            offsets[segment["frame"]:] = segment["wall_time"] - segment["monotonic_time"]
+        return self.arrival_times + offsets
+
+    def _index_records(self):
+        """建立记录索引: 等长记录直接用跨步视图，否则逐条扫描"""
+        buf = self._mmap
+        start = RECORDING_HEADER.size
+        size = len(buf)
+        self.frame_size = None
+        self.count = 0
+        if size - start < RECORD_HEADER.size:
+            self.arrival_times = np.empty(0, dtype=np.float64)
+            self._offsets = []
+            return
+        
+        _, first_len = RECORD_HEADER.unpack_from(buf, start)
+        stride = RECORD_HEADER.size + first_len
+        count = (size - start) // stride
+        lengths = np.ndarray((count,), dtype='<u2', buffer=buf, offset=start + 8, strides=(stride,))
+        if (lengths == first_len).all():
+            # 等长记录(常见情况): 时间戳和数据都是文件上的跨步视图
+            self.frame_size = first_len
+            self.count = count
+            self.arrival_times = np.ndarray((count,), dtype='<f8', buffer=buf, offset=start, strides=(stride,))
+            return
+        
+        # 变长记录: 逐条扫描，忽略末尾写了一半的记录
+        offsets = []
+        times = []
+        pos = start
+        while pos + RECORD_HEADER.size <= size:
+            arrival_time, length = RECORD_HEADER.unpack_from(buf, pos)
+            if pos + RECORD_HEADER.size + length > size:
+                break
+            times.append(arrival_time)
+            offsets.append((pos + RECORD_HEADER.size, length))
+            pos += RECORD_HEADER.size + length
+        self.count = len(offsets)
+        self.arrival_times = np.array(times, dtype=np.float64)
+        self._offsets = offsets
+
+    def frames(self, start=0, end=None):
+        """逐帧返回[start, end)范围内的原始通知(内存视图)"""
+        view = memoryview(self._mmap)
+        end = self.count if end is None else end
+        if self.frame_size is not None:
+            stride = RECORD_HEADER.size + self.frame_size
+            pos = RECORDING_HEADER.size + RECORD_HEADER.size
+            for i in range(start, end):
+                yield view[pos + i * stride:pos + i * stride + self.frame_size]
+        else:
+            for pos, length in self._offsets[start:end]:
+                yield view[pos:pos + length]
+
+    def make_device(self):
+        """按录制文件头和录制开始时的检测配置创建设备(解析布局、滤波、校准和分类器与录制时一致)"""
+        parser = IMUFrameParser(self.header_size, self.samples_per_frame, self.sample_stride, self.sample_rate)
+        parser.clock = SampleClock.from_header(*self.clock_fields, self.sample_rate, self.samples_per_frame)
+        config = self.config_ranges()[0][2]
+        if config is None:
+            return IMUDevice(self.device_id, parser=parser)
+        device = IMUDevice(self.device_id, parser=parser, classifier=load_classifier(config["classifier"]),
+                           imu_filter=IMUFilter(**config["filter"]) if config["filter"] else None)
+        device.calibration = config["calibration"]
+        apply_recording_config(device, config)
+        return device
+
+    def decode(self, parser, arrival_times=None, start=0, end=None):
+        """解码[start, end)范围内的帧，返回(时间戳, 六轴)；arrival_times为这些帧的到达时间，默认为录制值"""
+        end = self.count if end is None else end
+        if arrival_times is None:
+            arrival_times = self.arrival_times[start:end]
+        if self.frame_size is not None and self.frame_size >= parser.min_frame_size and parser.clock is None:
+            stride = RECORD_HEADER.size + self.frame_size
+            imu = parser.decode(self._mmap, end - start, RECORDING_HEADER.size + RECORD_HEADER.size + start * stride,
+                                stride)
+            return parser.sample_times(arrival_times), imu
+        return parser.parse_batch(list(self.frames(start, end)), arrival_times)
+
+def apply_recording_config(device, config):
+    """回放到配置变化的段时应用录制的校准偏移和检测参数"""
+    configure_detector(device, {"offset": config["offset"], **config["detector"]})
+
+def replay_offline(path, chunk_size=4096):
+    """尽可能快地回放录制文件，返回(设备, 事件列表, 样本数, 检测耗时)"""
+    recording = Recording(path)
+    device = recording.make_device()
+    # 换算到本进程的单调时钟，事件中的时间戳还原为录制时的墙钟时间
+    arrival_times = recording.wall_times() - WALL_CLOCK_OFFSET
+    detector = device.detector
     
-    logger.info("开始校准IMU传感器...")
-    await websocket.send(json.dumps({"status": "calibration_started"}))
+    events = []
+    samples = 0
+    elapsed = 0.0
+    for i, (first, last, config) in enumerate(recording.config_ranges()):
+        if i and config:
+            apply_recording_config(device, config)
+        timestamps, imu = recording.decode(device.parser, arrival_times[first:last], first, last)
+        samples += len(timestamps)
+        start = time.perf_counter()
+        if device.filter:
+            imu = device.filter.process(imu)
+        for j in range(0, len(timestamps), chunk_size):
+            for result in detector.process_motion_batch(timestamps[j:j + chunk_size], imu[j:j + chunk_size]):
+                events.append(build_event_message(device, result))
+        elapsed += time.perf_counter() - start
+    return device, events, samples, elapsed
+
+async def replay_realtime(device, recording, speed=1.0):
+    """按录制时的节奏(可加速)把原始通知送入设备队列，走与实时数据相同的处理流程
+
+    到达时间按录制时的锚点换算为墙钟时间再映射到本进程的单调时钟，发出的事件带录制时的墙钟时间戳。
+    """
+    device.connected = True
+    notify_bridge_state()
+    times = recording.wall_times().tolist()
+    configs = {first: config for first, _, config in recording.config_ranges()[1:] if config}
+    wall_start = time.monotonic()
+    for i, (arrival_time, data) in enumerate(zip(times, recording.frames())):
+        delay = (arrival_time - times[0]) / speed - (time.monotonic() - wall_start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if i in configs:
+            # 录制中途的校准或阈值调整，按录制节奏回放时队列中几乎没有积压，在此切换即可
+            apply_recording_config(device, configs[i])
+        device.enqueue_frame(bytes(data), arrival_time - WALL_CLOCK_OFFSET)
+    device.connected = False
+    notify_bridge_state()
+    logger.info(f"[{device.device_id}] 回放结束: {recording.count} 个通知")
+
+class SessionWriter:
+    """训练会话的列式存储: 检测路径只把样本和运动序列追加到内存中的列缓冲区，写满的块交给后台线程写入NPZ
+
+    每个块是一个独立的NPZ文件，manifest.json只由后台线程更新(先写临时文件再替换)，
+    写入过程中崩溃最多丢失未写出的块。样本时间戳为单调时钟，manifest中的clock_anchor是会话开始时
+    同时读取的(墙钟时间, 单调时钟时间)，用于换算为墙钟时间。
+    """
+    def __init__(self, path, device_id, metadata=None, chunk_samples=SESSION_CHUNK_SAMPLES,
+                 max_pending=SESSION_MAX_PENDING, clock_anchor=None):
+        self.path = path
+        self.device_id = device_id
+        self.metadata = metadata or {}
+        self.clock_anchor = clock_anchor or (time.time(), time.monotonic())
+        self.chunk_samples = chunk_samples
+        self.max_pending = max_pending
+        self.samples_written = 0
+        self.motions_written = 0
+        self.dropped_chunks = 0
+        self._new_sample_chunk()
+        self._motions = []
+        self._last_flush = time.monotonic()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._manifest = None
+
+    def __reduce__(self):
+        # 多进程检测时由工作进程写入: 只传配置，在子进程中重新创建
+        return (SessionWriter, (self.path, self.device_id, self.metadata, self.chunk_samples, self.max_pending,
+                                self.clock_anchor))
+
+    def _new_sample_chunk(self):
+        self._timestamps = np.empty(self.chunk_samples, dtype=np.float64)
+        self._imu = np.empty((self.chunk_samples, 6), dtype=np.float32)
+        self._count = 0
+
+    def add_samples(self, timestamps, imu):
+        """追加一批样本(解析并校准后、滤波前)"""
+        n = len(timestamps)
+        i = 0
+        while i < n:
+            take = min(n - i, self.chunk_samples - self._count)
+            self._timestamps[self._count:self._count + take] = timestamps[i:i + take]
+            self._imu[self._count:self._count + take] = imu[i:i + take]
+            self._count += take
+            i += take
+            if self._count == self.chunk_samples:
+                self._flush_samples()
+        if time.monotonic() - self._last_flush > SESSION_FLUSH_INTERVAL:
+            self.flush()
+
+    def add_sample(self, timestamp, imu):
+        """追加单个样本"""
+        self._timestamps[self._count] = timestamp
+        self._imu[self._count] = imu
+        self._count += 1
+        if self._count == self.chunk_samples:
+            self._flush_samples()
+        if time.monotonic() - self._last_flush > SESSION_FLUSH_INTERVAL:
+            self.flush()
+
+    def add_motion(self, motion_start, end_time, features, result, emitted):
+        """追加一个分析过的运动序列: 特征、各动作得分、分类结果以及是否发出了事件(用作检测器的motion_sink)"""
+        self._motions.append((motion_start, end_time, features, result, emitted))
+        if len(self._motions) >= SESSION_CHUNK_MOTIONS:
+            self._flush_motions()
+
+    def _flush_samples(self):
+        if self._count:
+            n = self._count
+            self._submit("samples", {"timestamp": self._timestamps[:n], "imu": self._imu[:n]})
+            self.samples_written += n
+            self._new_sample_chunk()
+
+    def _flush_motions(self):
+        if not self._motions:
+            return
+        motions, self._motions = self._motions, []
+        # 特征和得分按名称对齐为矩阵，缺失的项为NaN
+        feature_names = list(dict.fromkeys(k for m in motions for k in m[2]))
+        action_names = list(dict.fromkeys(k for m in motions if m[3] for k in m[3]["scores"]))
+        features = np.full((len(motions), len(feature_names)), np.nan)
+        scores = np.full((len(motions), len(action_names)), np.nan)
+        for row, (_, _, motion_features, result, _) in enumerate(motions):
+            for col, name in enumerate(feature_names):
+                if name in motion_features:
+                    features[row, col] = motion_features[name]
+            if result:
+                for col, name in enumerate(action_names):
+                    scores[row, col] = result["scores"].get(name, np.nan)
+        self._submit("motions", {
+            "motion_start": np.array([m[0] for m in motions], dtype=np.float64),
+            "timestamp": np.array([m[1] for m in motions], dtype=np.float64),
+            "action": np.array([m[3]["action"] if m[3] else "" for m in motions]),
+            "confidence": np.array([m[3]["confidence"] if m[3] else 0.0 for m in motions]),
+            "emitted": np.array([m[4] for m in motions], dtype=bool),
+            "early": np.array([bool(m[3] and m[3].get("early")) for m in motions], dtype=bool),
+            "features": features,
+            "feature_names": np.array(feature_names),
+            "scores": scores,
+            "action_names": np.array(action_names),
+        })
+        self.motions_written += len(motions)
+
+    def flush(self):
+        """把未满的块交给后台线程"""
+        self._flush_samples()
+        self._flush_motions()
+        self._last_flush = time.monotonic()
+
+    def _submit(self, kind, columns):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"session-{self.device_id}", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait((kind, columns))
+        except queue.Full:
+            # 磁盘跟不上时丢弃新块，不阻塞检测路径
+            self.dropped_chunks += 1
+            logger.warning(f"[{self.device_id}] 会话写入积压，已丢弃 {self.dropped_chunks} 个数据块")
+
+    def _run(self):
+        """后台写入线程: 逐块写NPZ并更新manifest"""
+        os.makedirs(self.path, exist_ok=True)
+        self._manifest = {
+            "device_id": self.device_id,
+            "started_at": self.clock_anchor[0],
+            "clock_anchor": {"wall_time": self.clock_anchor[0], "monotonic_time": self.clock_anchor[1]},
+            **self.metadata,
+            "chunks": {"samples": [], "motions": []},
+        }
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, columns = item
+            chunks = self._manifest["chunks"][kind]
+            name = f"{kind}_{len(chunks):05d}.npz"
+            try:
+                tmp_path = os.path.join(self.path, name + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **columns)
+                os.replace(tmp_path, os.path.join(self.path, name))
+                times = columns["timestamp"]
+                chunks.append({"file": name, "start": float(times[0]), "end": float(times[-1]), "count": len(times)})
+                self._write_manifest()
+            except OSError as e:
+                logger.error(f"[{self.device_id}] 写入会话数据失败: {e}")
+
+    def _write_manifest(self):
+        self._manifest["dropped_chunks"] = self.dropped_chunks
+        tmp_path = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, "manifest.json"))
+
+    def close(self):
+        """写出剩余数据并等待后台线程结束(退出时不丢弃积压的块)"""
+        self.flush()
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            logger.info(f"[{self.device_id}] 会话已保存: {self.path} "
+                        f"({self.samples_written} 个样本, {self.motions_written} 个运动序列)")
+
+class SessionStore:
+    """读取会话目录: 按manifest中的时间范围只加载需要的块"""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.device_id = self.manifest["device_id"]
+
+    def wall_time(self, timestamps):
+        """把会话中的时间戳(单调时钟)换算为墙钟时间"""
+        anchor = self.manifest["clock_anchor"]
+        return np.asarray(timestamps) + (anchor["wall_time"] - anchor["monotonic_time"])
+
+    def _chunks(self, kind, start, end):
+        for chunk in self.manifest["chunks"][kind]:
+            if (start is None or chunk["end"] >= start) and (end is None or chunk["start"] <= end):
+                with np.load(os.path.join(self.path, chunk["file"])) as data:
+                    yield {key: data[key] for key in data.files}
+
+    def samples(self, start=None, end=None):
+        """返回[start, end]内的(时间戳(N,), 六轴(N, 6))"""
+        timestamps = [np.empty(0)]
+        imu = [np.empty((0, 6), dtype=np.float32)]
+        for chunk in self._chunks("samples", start, end):
+            keep = np.ones(len(chunk["timestamp"]), dtype=bool)
+            if start is not None:
+                keep &= chunk["timestamp"] >= start
+            if end is not None:
+                keep &= chunk["timestamp"] <= end
+            timestamps.append(chunk["timestamp"][keep])
+            imu.append(chunk["imu"][keep])
+        return np.concatenate(timestamps), np.concatenate(imu)
+
+    def motions(self, start=None, end=None, emitted_only=False):
+        """返回运动结束时间在[start, end]内的运动序列列字典；特征和得分矩阵按各块名称的并集对齐"""
+        chunks = list(self._chunks("motions", start, end))
+        feature_names = list(dict.fromkeys(n for c in chunks for n in c["feature_names"].tolist()))
+        action_names = list(dict.fromkeys(n for c in chunks for n in c["action_names"].tolist()))
+        columns = {key: [] for key in ("motion_start", "timestamp", "action", "confidence", "emitted", "early",
+                                       "features", "scores")}
+        for chunk in chunks:
+            keep = np.ones(len(chunk["timestamp"]), dtype=bool)
+            if start is not None:
+                keep &= chunk["timestamp"] >= start
+            if end is not None:
+                keep &= chunk["timestamp"] <= end
+            if emitted_only:
+                keep &= chunk["emitted"]
+            for key in ("motion_start", "timestamp", "action", "confidence", "emitted", "early"):
+                columns[key].append(chunk[key][keep])
+            for key, names in (("features", feature_names), ("scores", action_names)):
+                matrix = np.full((int(keep.sum()), len(names)), np.nan)
+                chunk_names = chunk["feature_names" if key == "features" else "action_names"].tolist()
+                matrix[:, [names.index(n) for n in chunk_names]] = chunk[key][keep]
+                columns[key].append(matrix)
+        result = {key: np.concatenate(values) if values else np.empty(0) for key, values in columns.items()}
+        if not chunks:
+            result["features"] = np.empty((0, len(feature_names)))
+            result["scores"] = np.empty((0, len(action_names)))
+        result["feature_names"] = feature_names
+        result["action_names"] = action_names
+        return result
+
+class CalibrationCollector:
+    """静止采集: 收集解析后的样本，够数时完成future(不轮询)"""
+    def __init__(self, samples=CALIBRATION_SAMPLES):
+        self.samples = samples
+        self.count = 0
+        self._blocks = []
+        self.done = asyncio.get_running_loop().create_future()
+
+    def add(self, imu):
+        if self.done.done():
+            return
+        self._blocks.append(np.array(imu, dtype=np.float64))
+        self.count += len(imu)
+        if self.count >= self.samples:
+            self.done.set_result(np.concatenate(self._blocks)[:self.samples])
+
+def compute_calibration(imu, previous_bias=None, filtered=None):
+    """由静止数据计算各轴零偏和噪声底，并推导运动强度阈值
+
+    数据已扣除previous_bias，因此新零偏 = 旧零偏 + 残余零偏。加速度只校正零偏，保留1G重力。
+    filtered为同一段数据经设备滤波阶段后的样本(检测器看到的数据)，给出时噪声底和阈值按它计算。
+    """
+    mean = imu.mean(axis=0)
+    noise = imu.std(axis=0)
+    if (noise[:3] > CALIBRATION_MAX_NOISE[0]).any() or (noise[3:] > CALIBRATION_MAX_NOISE[1]).any():
+        raise ValueError(f"校准期间设备未保持静止(噪声: 加速度{noise[:3].max():.3f}G, 角速度{noise[3:].max():.1f}°/s)")
+    if filtered is not None:
+        noise = np.asarray(filtered).std(axis=0)
     
-    # 清空缓冲区
-    accel_buffer.clear()
-    gyro_buffer.clear()
+    bias = np.empty(6)
+    gravity = np.linalg.norm(mean[:3])
+    bias[:3] = mean[:3] - mean[:3] / gravity * 1.0 if gravity > 0 else mean[:3]
+    bias[3:] = mean[3:]
+    if previous_bias is not None:
+        bias += previous_bias
     
-    # 等待缓冲区填满静止数据
-    while len(accel_buffer) < WINDOW_SIZE:
-        await asyncio.sleep(0.1)
+    # 与detect_motion_start相同的强度定义: X标准差 + Z标准差 + Y角速度标准差/100
+    intensity_noise = noise[AX] + noise[AZ] + noise[GY] / 100
+    return {
+        "bias": bias.tolist(),
+        "noise_floor": noise.tolist(),
+        "motion_intensity_threshold": float(intensity_noise * NOISE_THRESHOLD_FACTOR),
+        "samples": len(imu),
+        "calibrated_at": time.time()
+    }
+
+def apply_calibration(device, calibration):
+    """在解析阶段扣除零偏，并使用由噪声底推导的运动强度阈值
+
+    阈值同样作用于设备上打开的独立检测器: 校准结果反映的是当前传感器的噪声底，替换客户端之前覆盖的阈值。
+    """
+    for session in device.detection_sessions.values():
+        session.overrides.pop("motion_intensity_threshold", None)
+    device.calibration = calibration
+    configure_detector(device, {
+        "offset": (-np.asarray(calibration["bias"])).tolist(),
+        "motion_intensity_threshold": calibration["motion_intensity_threshold"]
+    })
+
+def load_calibrations(path=None):
+    """读取校准文件: 设备地址 -> 校准结果"""
+    path = path or CALIBRATION_FILE
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_calibration(device, path=None):
+    """把设备的校准结果写入校准文件(按设备地址)"""
+    path = path or CALIBRATION_FILE
+    calibrations = load_calibrations(path)
+    calibrations[device.calibration_key] = device.calibration
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(calibrations, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+async def calibrate_device(device):
+    """采集一段静止数据并计算、应用、保存校准结果"""
+    collector = CalibrationCollector()
+    device.calibration_collector = collector
+    try:
+        imu = await asyncio.wait_for(collector.done, CALIBRATION_TIMEOUT)
+    finally:
+        device.calibration_collector = None
+    previous_bias = np.asarray(device.calibration["bias"]) if device.calibration else None
+    # 噪声底在滤波之后测量: 用设备滤波配置的新滤波器处理采集到的样本，不影响检测中的滤波状态
+    filtered = IMUFilter(**device.filter.config).process(imu) if device.filter else None
+    apply_calibration(device, compute_calibration(imu, previous_bias, filtered))
+    save_calibration(device)
+    logger.info(f"[{device.device_id}] 校准完成: 零偏={np.round(device.calibration['bias'], 4).tolist()}, "
+                f"运动强度阈值={device.calibration['motion_intensity_threshold']:.3f}")
+    return device.calibration
+
+# 校准函数
+async def calibrate_imu(websocket, targets):
+    """校准IMU传感器: 各设备并行静止采集，样本够数即完成"""
+    targets = [d for d in targets if d.connected]
+    logger.info(f"开始校准IMU传感器: {[d.device_id for d in targets]}")
+    await websocket.send(json.dumps({"status": "calibration_started",
+                                     "devices": [d.device_id for d in targets]}))
     
-    # 校准完成
-    logger.info("IMU校准完成")
-    await websocket.send(json.dumps({"status": "calibration_completed"}))
+    outcomes = await asyncio.gather(*(calibrate_device(d) for d in targets), return_exceptions=True)
+    results = {}
+    errors = {}
+    for device, outcome in zip(targets, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            errors[device.device_id] = f"{CALIBRATION_TIMEOUT:g}秒内未收到足够的数据"
+        elif isinstance(outcome, Exception):
+            errors[device.device_id] = str(outcome)
+        else:
+            results[device.device_id] = outcome
+    for device_id, error in errors.items():
+        logger.warning(f"[{device_id}] 校准失败: {error}")
+    
+    await websocket.send(json.dumps({"status": "calibration_completed",
+                                     "devices": list(results),
+                                     "calibration": results,
+                                     "errors": errors}))
 
 # BLE通知回调
-def notification_handler(sender, data):
-    """处理来自BLE设备的通知"""
-    processed_data = process_imu_data(data)
-    if processed_data:
-        # 发送到所有连接的WebSocket客户端
-        websocket_send_task = asyncio.create_task(broadcast_message(processed_data))
-
-async def broadcast_message(message):
-    """广播消息到所有WebSocket客户端"""
-    if connected_clients:
-        disconnected_clients = set()
-        for client in connected_clients.copy():
+def make_notification_handler(device):
+    """为设备创建BLE通知回调"""
+    def notification_handler(sender, data):
+        """处理来自BLE设备的通知: 只入队，尽快返回"""
+        device.enqueue_frame(data)
+    return notification_handler
+
+async def consume_frames(device):
+    """设备的通知消费任务: 批量取出原始通知，检测后发送事件"""
+    frame_queue = device.frame_queue
+    metrics = device.metrics
+    while True:
+        batch = [await frame_queue.get()]
+        while len(batch) < FRAME_BATCH_SIZE and not frame_queue.empty():
+            batch.append(frame_queue.get_nowait())
+        
+        dequeued = time.perf_counter()
+        for _, enqueued, _ in batch:
+            metrics.observe("queue_wait", dequeued - enqueued)
+        arrival_times = [item[0] for item in batch]
+        frames = [item[2] for item in batch]
+        
+        if device.recorder:
+            device.recorder.write_batch(arrival_times, frames)
+        
+        if device.worker:
+            # 多进程检测: 原始通知写入共享环形缓冲区，由工作进程解析和检测，事件由DetectionWorkerPool发送
+            dropped = device.worker.submit(arrival_times, [item[1] for item in batch], frames)
+            if dropped:
+                previous = device.dropped_frames
+                device.dropped_frames += dropped
+                if previous == 0 or previous // 100 != device.dropped_frames // 100:
+                    logger.warning(f"[{device.device_id}] 工作进程环形缓冲区已满，已丢弃 {device.dropped_frames} 个通知")
+            if device.calibration_collector or device.subscriptions or device.detection_sessions:
+                # 校准采集、传感器数据流和客户端自己的检测器需要解析后的样本，只在需要时在主进程解析(每批一次)
+                timestamps, imu = device.parser.parse_batch(frames, arrival_times)
+                if device.calibration_collector:
+                    device.calibration_collector.add(imu)
+                if device.subscriptions or device.detection_sessions:
+                    sensor_buffers = device.sensor_buffers
+                    if "raw" in sensor_buffers:
+                        sensor_buffers["raw"].extend(timestamps, imu)
+                    if device.filter:
+                        imu = device.filter.process(imu)
+                    if "filtered" in sensor_buffers:
+                        sensor_buffers["filtered"].extend(timestamps, imu)
+                    for session in device.detection_sessions.values():
+                        session.process_batch(timestamps, imu)
+            await asyncio.sleep(0)
+            continue
+        
+        for result in detect_imu_frames(device, frames, arrival_times):
+            logger.info(f"[{device.device_id}] 发送动作事件: {result['action']}")
+            
+            # 触发事件的通知: 第一个到达时间不早于该样本时间戳的通知
+            i = min(bisect.bisect_left(arrival_times, result["timestamp"]), len(batch) - 1)
+            received = batch[i][1]
+            
+            # 放入各客户端的发送队列，实际发送完成时记录端到端延迟
+            fanout_start = time.perf_counter()
+            broadcast_event(device, result, on_sent=lambda received=received:
+                            metrics.observe("end_to_end", time.perf_counter() - received))
+            metrics.observe("broadcast", time.perf_counter() - fanout_start)
+        
+        # 让出事件循环，批量处理期间不阻塞其他设备和发送任务
+        await asyncio.sleep(0)
+
+class SharedFrameRing:
+    """共享内存中的单生产者/单消费者通知环形缓冲区
+
+    前128字节为控制区: 写序号(偏移0，只由主进程写)和读序号(偏移64，只由工作进程写)，各占一个缓存行；
+    之后是定长槽。序号只增不减，槽位为序号对槽数取模，两侧都不需要加锁。
+    """
+    CONTROL_SIZE = 128
+    _index = struct.Struct('<Q')
+
+    def __init__(self, name=None, slots=WORKER_RING_SLOTS, slot_size=WORKER_SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_frame_size = slot_size - SLOT_HEADER.size
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=self.CONTROL_SIZE + slots * slot_size)
+            self._shm.buf[:self.CONTROL_SIZE] = bytes(self.CONTROL_SIZE)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+
+    def __reduce__(self):
+        # 传给工作进程时只传名称，由子进程重新映射
+        return (SharedFrameRing, (self.name, self.slots, self.slot_size))
+
+    def _load(self, offset):
+        return self._index.unpack_from(self._buf, offset)[0]
+
+    def pending(self):
+        return self._load(0) - self._load(64)
+
+    def put_batch(self, arrival_times, enqueued_times, frames):
+        """写入一批通知(先写槽再推进写序号)，返回写入的数量；空间不足或超长的通知不写入"""
+        buf = self._buf
+        write = self._load(0)
+        free = self.slots - (write - self._load(64))
+        pack_into = SLOT_HEADER.pack_into
+        written = 0
+        for arrival_time, enqueued, data in zip(arrival_times, enqueued_times, frames):
+            if written >= free or len(data) > self.max_frame_size:
+                continue
+            pos = self.CONTROL_SIZE + (write + written) % self.slots * self.slot_size
+            pack_into(buf, pos, arrival_time, enqueued, len(data))
+            start = pos + SLOT_HEADER.size
+            buf[start:start + len(data)] = data
+            written += 1
+        if written:
+            self._index.pack_into(buf, 0, write + written)
+        return written
+
+    def get_batch(self, max_count=FRAME_BATCH_SIZE):
+        """取出最多max_count个通知，返回(到达时间列表, 入队时间列表, 通知列表)"""
+        buf = self._buf
+        read = self._load(64)
+        count = min(self._load(0) - read, max_count)
+        arrival_times = []
+        enqueued_times = []
+        frames = []
+        unpack_from = SLOT_HEADER.unpack_from
+        for i in range(count):
+            pos = self.CONTROL_SIZE + (read + i) % self.slots * self.slot_size
+            arrival_time, enqueued, length = unpack_from(buf, pos)
+            start = pos + SLOT_HEADER.size
+            arrival_times.append(arrival_time)
+            enqueued_times.append(enqueued)
+            frames.append(bytes(buf[start:start + length]))
+        if count:
+            self._index.pack_into(buf, 64, read + count)
+        return arrival_times, enqueued_times, frames
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+def detection_worker(worker_id, specs, commands, events):
+    """检测工作进程: 从共享环形缓冲区批量取通知，解析、滤波、检测，把事件和统计经管道传回主进程
+
+    specs为(设备ID, 环形缓冲区, 解析器, 滤波器, 检测器, 会话存储)列表；commands接收主进程的唤醒和配置消息。
+    退出时先写完会话，最后回传"done"确认。
+    """
+    logging.getLogger(__name__).setLevel(logging.WARNING)
+    # 单独收到SIGTERM时与Ctrl+C一样退出循环，在finally中写出会话
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    workers = []
+    for device_id, ring, parser, imu_filter, detector, session in specs:
+        device = IMUDevice(device_id, parser=parser, imu_filter=imu_filter)
+        device.detector = detector
+        detector.metrics = device.metrics
+        device.session = session
+        workers.append((device, ring))
+    by_id = {device.device_id: device for device, _ in workers}
+    events.send(("ready", None, worker_id, None))
+    
+    def send_stats():
+        for device, ring in workers:
+            events.send(("stats", device.device_id, {
+                "stats": device.detector.detection_stats,
+                "buffer_size": len(device.detector.sample_buffer),
+                "motion_state": device.detector.motion_state,
+                "clock": device.parser.clock.get_stats() if device.parser.clock else None,
+                "ring_pending": ring.pending(),
+                "worker": worker_id
+            }, {stage: device.metrics.histograms[stage] for stage in WORKER_STAGES}))
+    
+    last_stats = time.monotonic()
+    running = True
+    try:
+        while running:
+            if commands.poll(WORKER_STATS_INTERVAL):
+                # 一次取完积压的消息: 唤醒消息只表示有新通知，配置消息立即生效
+                while running and commands.poll():
+                    message = commands.recv()
+                    if message[0] == "stop":
+                        running = False
+                    elif message[0] == "configure":
+                        _, device_id, attrs = message
+                        configure_detector(by_id[device_id], attrs)
+            
+            for device, ring in workers:
+                while True:
+                    arrival_times, enqueued_times, frames = ring.get_batch()
+                    if not frames:
+                        break
+                    for result in detect_imu_frames(device, frames, arrival_times):
+                        # 触发事件的通知: 第一个到达时间不早于该样本时间戳的通知
+                        i = min(bisect.bisect_left(arrival_times, result["timestamp"]), len(frames) - 1)
+                        events.send(("event", device.device_id, result, enqueued_times[i]))
+            
+            now = time.monotonic()
+            if now - last_stats >= WORKER_STATS_INTERVAL:
+                send_stats()
+                last_stats = now
+        send_stats()
+    except (EOFError, BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        for device, ring in workers:
+            ring.close()
+            if device.session:
+                device.session.close()
+        try:
+            events.send(("done", None, worker_id, None))
+        except (BrokenPipeError, OSError):
+            pass
+
+class DetectionWorkerPool:
+    """多进程检测: 主进程只做BLE和WebSocket I/O，解析和检测在工作进程中进行"""
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        # spawn: 子进程不继承事件循环和BLE状态(Windows上也只能spawn)
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = []
+        self._outboxes = []  # 每个工作进程的待发命令，由各自的发送线程写入管道，管道满时不阻塞事件循环
+        self._wake_pending = []
+        self._events = []
+        self._done = []  # 工作进程已确认结束(或管道已关闭)
+        self._rings = []
+        self._loop = None
+        self._reader = None
+        self._ready = None
+        self._starting = 0
+        self._closing = False
+
+    def start(self, device_list):
+        """按轮询把设备分配到工作进程并启动"""
+        self._loop = asyncio.get_running_loop()
+        self._ready = self._loop.create_future()
+        shards = [[] for _ in range(self.num_workers)]
+        for i, device in enumerate(device_list):
+            ring = SharedFrameRing()
+            self._rings.append(ring)
+            device.worker = WorkerHandle(self, i % self.num_workers, ring)
+            shards[i % self.num_workers].append(
+                (device.device_id, ring, device.parser, device.filter, device.detector, device.session))
+        
+        for worker_id, specs in enumerate(shards):
+            if not specs:
+                continue
+            command_reader, command_writer = self._context.Pipe(duplex=False)
+            event_reader, event_writer = self._context.Pipe(duplex=False)
+            process = self._context.Process(target=detection_worker, name=f"imu-detect-{worker_id}",
+                                            args=(worker_id, specs, command_reader, event_writer), daemon=True)
+            process.start()
+            command_reader.close()
+            event_writer.close()
+            outbox = queue.SimpleQueue()
+            wake_pending = threading.Event()
+            threading.Thread(target=self._write_commands, args=(command_writer, outbox, wake_pending),
+                             name=f"imu-detect-commands-{worker_id}", daemon=True).start()
+            self._processes.append(process)
+            self._outboxes.append(outbox)
+            self._wake_pending.append(wake_pending)
+            self._events.append(event_reader)
+            self._done.append(threading.Event())
+            logger.info(f"检测工作进程 {worker_id} 已启动 (pid {process.pid}): {[s[0] for s in specs]}")
+        self._starting = len(self._processes)
+        
+        # 事件管道由独立线程读取，再交给事件循环(Windows的事件循环不支持add_reader)
+        self._reader = threading.Thread(target=self._read_events, name="imu-detect-events", daemon=True)
+        self._reader.start()
+
+    async def wait_ready(self, timeout=30):
+        """等待所有工作进程完成导入和初始化(spawn需重新导入本模块)，之前写入的通知可能因缓冲区满被丢弃"""
+        await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+
+    def send(self, worker_id, message):
+        """把命令交给工作进程的发送线程(不等待)"""
+        self._outboxes[worker_id].put(message)
+
+    def wake(self, worker_id):
+        """通知工作进程有新通知，已有未发出的唤醒时不重复发送"""
+        wake_pending = self._wake_pending[worker_id]
+        if not wake_pending.is_set():
+            wake_pending.set()
+            self._outboxes[worker_id].put(("frames",))
+
+    def _write_commands(self, conn, outbox, wake_pending):
+        """发送线程: 按顺序把命令写入管道，收到None时关闭管道"""
+        try:
+            while True:
+                message = outbox.get()
+                if message is None:
+                    break
+                if message[0] == "frames":
+                    wake_pending.clear()
+                conn.send(message)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _read_events(self):
+        pending = list(self._events)
+        while pending:
+            for conn in mp_connection.wait(pending):
+                done = self._done[self._events.index(conn)]
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    pending.remove(conn)
+                    done.set()
+                    self._post(self._worker_exited)
+                    continue
+                if message[0] == "done":
+                    done.set()
+                    continue
+                self._post(self._dispatch, message)
+
+    def _post(self, callback, *args):
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass  # 退出时事件循环已关闭
+
+    def _worker_exited(self):
+        if self._closing:
+            return
+        if not self._ready.done():
+            self._ready.set_exception(RuntimeError("检测工作进程启动失败"))
+        else:
+            logger.error("检测工作进程意外退出，其设备的检测已停止")
+
+    def _dispatch(self, message):
+        kind, device_id, payload, extra = message
+        if kind == "ready":
+            self._starting -= 1
+            if self._starting == 0 and not self._ready.done():
+                self._ready.set_result(True)
+                logger.info(f"{len(self._processes)} 个检测工作进程已就绪")
+            return
+        device = devices.get(device_id)
+        if device is None:
+            return
+        if kind == "event":
+            logger.info(f"[{device_id}] 发送动作事件: {payload['action']}")
+            metrics = device.metrics
+            fanout_start = time.perf_counter()
+            broadcast_event(device, payload, on_sent=lambda received=extra:
+                            metrics.observe("end_to_end", time.perf_counter() - received))
+            metrics.observe("broadcast", time.perf_counter() - fanout_start)
+        elif kind == "stats":
+            device.worker.state = payload
+            device.detector.detection_stats = payload["stats"]
+            device.metrics.histograms.update(extra)
+
+    def close(self, timeout=WORKER_SHUTDOWN_TIMEOUT):
+        """通知工作进程退出，等待各自确认(会话已写完)后再回收，超时未确认的才强制终止"""
+        self._closing = True
+        for outbox in self._outboxes:
+            outbox.put(("stop",))
+            outbox.put(None)
+        deadline = time.monotonic() + timeout
+        for worker_id, (process, done) in enumerate(zip(self._processes, self._done)):
+            if not done.wait(max(deadline - time.monotonic(), 0)):
+                logger.warning(f"检测工作进程 {worker_id} 未在 {timeout:.0f}s 内确认退出，强制终止")
+                process.terminate()
+            process.join(timeout=2)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        for ring in self._rings:
+            ring.close()
+
+class WorkerHandle:
+    """设备在工作进程池中的位置: 共享环形缓冲区和所属工作进程"""
+    def __init__(self, pool, worker_id, ring):
+        self.pool = pool
+        self.worker_id = worker_id
+        self.ring = ring
+        self.state = None  # 工作进程最近回传的检测状态
+
+    def submit(self, arrival_times, enqueued_times, frames):
+        """写入环形缓冲区并唤醒工作进程，返回因缓冲区满或通知超长而丢弃的数量"""
+        written = self.ring.put_batch(arrival_times, enqueued_times, frames)
+        if written:
+            self.pool.wake(self.worker_id)
+        return len(frames) - written
+
+def configure_detector(device, attrs):
+    """修改设备的检测参数("offset"为解析偏移，其余为检测器属性)，使用工作进程时同步过去"""
+    for name, value in attrs.items():
+        if name == "offset":
+            device.parser.set_offset(value)
+        else:
+            setattr(device.detector, name, value)
+    if device.worker:
+        device.worker.pool.send(device.worker.worker_id, ("configure", device.device_id, attrs))
+    if device.recorder:
+        device.recorder.mark_config(device)
+    # 客户端未覆盖的参数跟随共享检测器
+    for session in device.detection_sessions.values():
+        session.sync()
+
+def parse_detector_params(data):
+    """取出命令中的检测参数并转换类型，值无效时抛出ValueError"""
+    attrs = {}
+    for name, kind in DETECTOR_PARAMS.items():
+        if name not in data:
+            continue
+        value = data[name]
+        if kind is bool:
+            if isinstance(value, bool):
+                parsed = value
+            else:
+                parsed = BOOL_STRINGS.get(str(value).strip().lower())
+        elif isinstance(value, (int, float, str)) and not isinstance(value, bool):
             try:
-                await client.send(message)
-            except:
-                disconnected_clients.add(client)
+                parsed = float(value)
+            except ValueError:
+                parsed = None
+            if parsed is not None and not math.isfinite(parsed):
+                parsed = None
+        else:
+            parsed = None
+        if parsed is None:
+            raise ValueError(f"参数 {name} 的值无效: {value!r}")
+        attrs[name] = parsed
+    return attrs
+
+class ClientConnection:
+    """WebSocket客户端及其有界发送队列，由独立的写任务发送，慢客户端不影响其他客户端"""
+    def __init__(self, websocket, policy=None):
+        self.websocket = websocket
+        remote = websocket.remote_address
+        self.address = f"{remote[0]}:{remote[1]}" if remote else "unknown"
+        self.policy = policy or default_client_policy
+        self.event_format = "json"
+        self.verbosity = "minimal"
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._queue = deque()
+        self._ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, message, key=None, on_sent=None):
+        """放入发送队列(不等待)；key相同的未发送消息在coalesce策略下被新消息替换"""
+        if self.closed:
+            return False
+        pending = self._queue
+        if key is not None and self.policy == "coalesce":
+            for i, item in enumerate(pending):
+                if item[0] == key:
+                    del pending[i]
+                    self.coalesced += 1
+                    break
+        if len(pending) >= CLIENT_QUEUE_SIZE:
+            if self.policy == "disconnect":
+                logger.warning(f"客户端 {self.address} 发送队列已满，断开连接")
+                self.close()
+                return False
+            pending.popleft()
+            self.dropped += 1
+        pending.append((key, message, on_sent))
+        self._ready.set()
+        return True
+
+    async def _write_loop(self):
+        pending = self._queue
+        try:
+            while True:
+                if not pending:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                _, message, on_sent = pending.popleft()
+                await self.websocket.send(message)
+                if on_sent:
+                    on_sent()
+        except websockets.exceptions.ConnectionClosed:
+            self.closed = True
+        except Exception as e:
+            # 其他发送错误不能让写任务静默退出(之后的消息只会堆积在队列里)，记录并断开连接
+            logger.error(f"客户端 {self.address} 发送失败，断开连接: {e}")
+            self.close()
+
+    def close(self):
+        """停止写任务并关闭连接"""
+        if not self._writer.done() and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if not self.closed:
+            self.closed = True
+            self._close_task = asyncio.create_task(self.websocket.close())
+
+    @property
+    def event_encoding(self):
+        """动作事件的编码: "binary"或JSON详细程度"""
+        return "binary" if self.event_format == "binary" else self.verbosity
+
+    def get_stats(self):
+        return {
+            "address": self.address,
+            "policy": self.policy,
+            "event_format": self.event_format,
+            "verbosity": self.verbosity,
+            "queue_depth": len(self._queue),
+            "dropped": self.dropped,
+            "coalesced": self.coalesced
+        }
+
+class SensorSubscription:
+    """客户端对一个设备传感器数据的订阅，服务端按要求的来源和频率降采样并打包"""
+    def __init__(self, client, device, rate=SENSOR_DEFAULT_RATE, mode="decimate", source="filtered"):
+        if mode not in SENSOR_MODES:
+            raise ValueError(f"未知的降采样方式: {mode}")
+        if source not in SENSOR_SOURCES:
+            raise ValueError(f"未知的数据来源: {source}")
+        if rate <= 0:
+            raise ValueError(f"输出频率必须大于0: {rate}")
+        self.client = client
+        self.device_id = device.device_id
+        self.rate = float(rate)
+        self.mode = mode
+        self.source = source
+        self.read_total = 0  # 已读取到的来源缓冲区累计样本数
+        self._device_id_bytes = device.device_id.encode("utf-8")[:255]
+        self._last_bin = None
+        self._pending_times = np.empty(0, dtype=np.float64)
+        self._pending_imu = np.empty((0, 6), dtype=np.float32)
+
+    def read(self, buffer):
+        """取出上次读取之后的新样本，返回(时间戳, 六轴)或None；超过缓冲区容量的积压只取最近的部分"""
+        new = min(buffer.total - self.read_total, len(buffer))
+        self.read_total = buffer.total
+        if new <= 0:
+            return None
+        window = buffer.window(new)
+        return window['timestamp'], window['imu']
+
+    def downsample(self, timestamps, imu):
+        """按输出频率把时间轴划分为区间，抽取每个区间的第一个样本或对区间求平均"""
+        if self.mode == "decimate":
+            bins = np.floor(timestamps * self.rate).astype(np.int64)
+            keep = np.empty(len(bins), dtype=bool)
+            keep[0] = True
+            np.not_equal(bins[1:], bins[:-1], out=keep[1:])
+            if self._last_bin is not None:
+                keep &= bins > self._last_bin
+            self._last_bin = int(bins[-1]) if self._last_bin is None else max(self._last_bin, int(bins[-1]))
+            return timestamps[keep], imu[keep]
         
-        for client in disconnected_clients:
-            connected_clients.discard(client)
+        # 平均: 最后一个区间可能还没收完，留到下一个节拍
+        timestamps = np.concatenate([self._pending_times, timestamps])
+        imu = np.concatenate([self._pending_imu, imu])
+        bins = np.floor(timestamps * self.rate).astype(np.int64)
+        done = bins < bins[-1]
+        self._pending_times = timestamps[~done]
+        self._pending_imu = imu[~done]
+        if not done.any():
+            return timestamps[:0], imu[:0]
+        timestamps, imu, bins = timestamps[done], imu[done], bins[done]
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        counts = np.diff(np.r_[starts, len(bins)])
+        return (np.add.reduceat(timestamps, starts) / counts,
+                np.add.reduceat(imu, starts, axis=0, dtype=np.float64) / counts[:, None])
+
+    def pack(self, timestamps, imu):
+        """打包为二进制帧"""
+        base_time = float(timestamps[0])
+        records = np.empty((len(timestamps), 7), dtype='<f4')
+        records[:, 0] = timestamps - base_time
+        records[:, 1:] = imu
+        header = SENSOR_FRAME_HEADER.pack(SENSOR_FRAME_MAGIC, SENSOR_FRAME_VERSION,
+                                          len(self._device_id_bytes), len(timestamps), wall_time(base_time))
+        return header + self._device_id_bytes + records.tobytes()
+
+class DetectionSession:
+    """客户端自己的检测器: 与设备共享解析和滤波后的样本，阈值、冷却时间和统计独立，事件只发给该客户端
+    只有客户端设置过的参数(overrides)固定不变，其余参数跟随设备共享的检测器(包括校准结果)"""
+    def __init__(self, client, device):
+        self.client = client
+        self.device = device
+        self.overrides = {}
+        self.detector = SequentialMotionDetector(device.detector.classifier)
+        self.sync()
+
+    def configure(self, attrs):
+        self.overrides.update(attrs)
+        self.sync()
+
+    def sync(self):
+        """按共享检测器的当前参数更新，客户端覆盖的参数除外"""
+        shared = self.device.detector
+        for name in DETECTOR_PARAMS:
+            setattr(self.detector, name, self.overrides.get(name, getattr(shared, name)))
+
+    def process_sample(self, imu, timestamp):
+        result = self.detector.process_motion_sequence(imu, timestamp)
+        if result:
+            self.send(result)
+
+    def process_batch(self, timestamps, imu):
+        for result in self.detector.process_motion_batch(timestamps, imu):
+            self.send(result)
+
+    def send(self, result):
+        logger.info(f"[{self.device.device_id}] 发送动作事件给 {self.client.address}: {result['action']}")
+        self.client.send(encode_event(self.device, result, self.client.event_encoding,
+                                      self.detector.detection_stats))
+
+    def get_stats(self):
+        detector = self.detector
+        return {
+            "stats": detector.detection_stats,
+            "motion_state": detector.motion_state,
+            "params": {name: getattr(detector, name) for name in DETECTOR_PARAMS},
+            "overrides": dict(self.overrides)
+        }
+
+async def stream_sensor_data(device):
+    """设备的传感器数据流任务: 每个节拍读取各订阅来源的新样本，降采样后分发给订阅者"""
+    key = ("sensor", device.device_id)
+    try:
+        while device.subscriptions:
+            await asyncio.sleep(SENSOR_TICK_INTERVAL)
+            for subscription in list(device.subscriptions.values()):
+                samples = subscription.read(device.sensor_buffers[subscription.source])
+                if samples is None:
+                    continue
+                sub_times, sub_imu = subscription.downsample(*samples)
+                if len(sub_times):
+                    subscription.client.send(subscription.pack(sub_times, sub_imu), key=key)
+    finally:
+        device.stream_task = None
+
+def prune_sensor_buffers(device):
+    """释放已没有订阅者的来源缓冲区"""
+    sources = {subscription.source for subscription in device.subscriptions.values()}
+    for source in list(device.sensor_buffers):
+        if source not in sources:
+            del device.sensor_buffers[source]
+
+def subscribe_sensor(client, device, rate=SENSOR_DEFAULT_RATE, mode="decimate", source="filtered"):
+    """订阅设备的传感器数据，必要时创建来源缓冲区并启动数据流任务"""
+    subscription = SensorSubscription(client, device, rate, mode, source)
+    buffer = device.sensor_buffers.get(source)
+    if buffer is None:
+        buffer = device.sensor_buffers[source] = IMURingBuffer(SENSOR_BUFFER_SIZE)
+    subscription.read_total = buffer.total
+    device.subscriptions[client] = subscription
+    prune_sensor_buffers(device)
+    if device.stream_task is None:
+        device.stream_task = asyncio.create_task(stream_sensor_data(device))
+
+def unsubscribe_sensor(client, targets):
+    for device in targets:
+        device.subscriptions.pop(client, None)
+        prune_sensor_buffers(device)
+
+def open_detection_session(client, device):
+    """为客户端创建设备的独立检测器(已有时直接返回)，参数跟随设备的共享检测器"""
+    session = device.detection_sessions.get(client)
+    if session is None:
+        session = device.detection_sessions[client] = DetectionSession(client, device)
+        logger.info(f"[{device.device_id}] 客户端 {client.address} 使用独立检测器")
+    return session
+
+def close_detection_sessions(client, targets):
+    """关闭客户端的独立检测器，之后重新接收设备共享检测器的事件"""
+    for device in targets:
+        device.detection_sessions.pop(client, None)
+
+def broadcast_message(message, key=None, on_sent=None):
+    """广播消息到所有WebSocket客户端(消息只序列化一次，所有客户端共享)"""
+    for client in list(connected_clients.values()):
+        client.send(message, key, on_sent)
+
+def broadcast_event(device, result, on_sent=None):
+    """按各客户端协商的格式广播共享检测器的动作事件，每种编码只生成一次(使用独立检测器的客户端除外)"""
+    encoded = {}
+    sessions = device.detection_sessions
+    for client in list(connected_clients.values()):
+        if client in sessions:
+            continue
+        encoding = client.event_encoding
+        message = encoded.get(encoding)
+        if message is None:
+            message = encoded[encoding] = encode_event(device, result, encoding)
+        client.send(message, on_sent=on_sent)
 
 # WebSocket连接处理函数
 async def websocket_handler(websocket):
     """处理WebSocket连接"""
     logger.info(f"WebSocket客户端连接: {websocket.remote_address}")
-    connected_clients.add(websocket)
+    client = ClientConnection(websocket)
+    connected_clients[websocket] = client
     
     # 发送连接成功消息
     try:
@@ -441,6 +2878,8 @@ async def websocket_handler(websocket):
             "status": "connected",
             "message": "序列动作检测算法已启用",
             "algorithm": "Sequential Motion Detection",
+            "devices": list(devices),
+            "bridge_state": bridge_state(),
             "features": [
                 "完整动作序列分析",
                 "避免中间过程误触发",
@@ -457,137 +2896,679 @@ async def websocket_handler(websocket):
             try:
                 data = json.loads(message)
                 if "command" in data:
-                    if data["command"] == "ping":
+                    targets = select_devices(data)
+                    if data.get("device_id") is not None and not targets:
+                        await websocket.send(json.dumps({"error": f"未知设备: {data.get('device_id')}"}))
+                    elif data["command"] == "ping":
                         await websocket.send(json.dumps({"response": "pong"}))
+                    elif data["command"] == "get_status":
+                        # 就绪状态和启动耗时(启动期间设备尚未加载时也可查询)
+                        await websocket.send(json.dumps({"status": "bridge_state", **bridge_state(),
+                                                         "startup_ms": startup.snapshot()}))
                     elif data["command"] == "calibrate":
-                        await calibrate_imu(websocket)
+                        await calibrate_imu(websocket, targets)
+                    elif data["command"] == "get_metrics":
+                        await websocket.send(json.dumps({
+                            "metrics": {d.device_id: d.metrics.snapshot() for d in targets},
+                            "clients": [c.get_stats() for c in connected_clients.values()]
+                        }))
+                    elif data["command"] == "set_send_policy":
+                        # 客户端选择自己的慢客户端策略(如观察面板使用coalesce)
+                        policy = data.get("policy")
+                        if policy in SLOW_CLIENT_POLICIES:
+                            client.policy = policy
+                            await websocket.send(json.dumps({"status": "send_policy_updated", "policy": policy}))
+                        else:
+                            await websocket.send(json.dumps({"error": f"未知的发送策略: {policy}"}))
+                    elif data["command"] == "set_event_format":
+                        # 客户端协商动作事件编码: binary为紧凑二进制帧，json可选附带scores或完整诊断信息
+                        event_format = data.get("format", client.event_format)
+                        verbosity = data.get("verbosity", client.verbosity)
+                        if event_format not in EVENT_FORMATS:
+                            await websocket.send(json.dumps({"error": f"未知的事件格式: {event_format}"}))
+                        elif verbosity not in EVENT_VERBOSITY:
+                            await websocket.send(json.dumps({"error": f"未知的详细程度: {verbosity}"}))
+                        else:
+                            client.event_format = event_format
+                            client.verbosity = verbosity
+                            await websocket.send(json.dumps({
+                                "status": "event_format_updated",
+                                "format": event_format,
+                                "verbosity": verbosity,
+                                "action_codes": ACTION_CODES
+                            }))
                     elif data["command"] == "get_stats":
+                        # session: 本客户端独立检测器的统计和参数(没有时为空)
                         await websocket.send(json.dumps({
-                            "stats": detection_stats,
-                            "buffer_size": len(accel_buffer),
-                            "motion_state": detector.motion_state
+                            "devices": {d.device_id: d.get_stats() for d in targets},
+                            "session": {d.device_id: d.detection_sessions[client].get_stats()
+                                        for d in targets if client in d.detection_sessions}
                         }))
                     elif data["command"] == "set_thresholds":
-                        # 允许Unity调整序列检测器的阈值
-                        if "motion_intensity_threshold" in data:
-                            detector.motion_intensity_threshold = float(data["motion_intensity_threshold"])
-                        if "min_motion_duration" in data:
-                            detector.min_motion_duration = float(data["min_motion_duration"])
-                        if "max_motion_duration" in data:
-                            detector.max_motion_duration = float(data["max_motion_duration"])
-                        if "cooldown_time" in data:
-                            global COOLDOWN_TIME
-                            COOLDOWN_TIME = float(data["cooldown_time"])
+                        # 调整序列检测器的阈值(可通过device_id指定设备)
+                        # 默认修改所有客户端共享的检测器，scope为client时只作用于本客户端的独立检测器
+                        try:
+                            attrs = parse_detector_params(data)
+                        except ValueError as e:
+                            await websocket.send(json.dumps({"error": str(e)}))
+                            continue
+                        scope = data.get("scope", "device")
+                        if scope not in THRESHOLD_SCOPES:
+                            await websocket.send(json.dumps({"error": f"未知的参数范围: {scope}"}))
+                            continue
+                        for device in targets:
+                            if scope == "device":
+                                configure_detector(device, attrs)
+                            else:
+                                open_detection_session(client, device).configure(attrs)
                         
-                        logger.info(f"更新序列检测参数")
-                        await websocket.send(json.dumps({"status": "thresholds_updated"}))
+                        logger.info(f"更新序列检测参数({scope}): {[d.device_id for d in targets]}")
+                        await websocket.send(json.dumps({"status": "thresholds_updated", "scope": scope}))
+                    elif data["command"] == "open_session":
+                        # 使用独立检测器(参数跟随共享检测器)，不改变参数
+                        for device in targets:
+                            open_detection_session(client, device)
+                        await websocket.send(json.dumps({"status": "session_opened",
+                                                         "devices": [d.device_id for d in targets]}))
+                    elif data["command"] == "close_session":
+                        close_detection_sessions(client, targets)
+                        await websocket.send(json.dumps({"status": "session_closed"}))
+                    elif data["command"] == "subscribe_sensor":
+                        # 订阅传感器数据(二进制帧)，可指定输出频率、降采样方式和来源(滤波后/原始)
+                        try:
+                            for device in targets:
+                                subscribe_sensor(client, device,
+                                                 float(data.get("rate", SENSOR_DEFAULT_RATE)),
+                                                 data.get("mode", "decimate"),
+                                                 data.get("source", "filtered"))
+                        except ValueError as e:
+                            await websocket.send(json.dumps({"error": str(e)}))
+                        else:
+                            await websocket.send(json.dumps({"status": "sensor_subscribed",
+                                                             "devices": [d.device_id for d in targets]}))
+                    elif data["command"] == "unsubscribe_sensor":
+                        unsubscribe_sensor(client, targets)
+                        await websocket.send(json.dumps({"status": "sensor_unsubscribed"}))
                     elif data["command"] == "debug_mode":
-                        # 添加调试模式命令
+                        # 调试模式: 以默认频率订阅/取消订阅传感器数据
                         debug_mode = data.get("enabled", False)
                         if debug_mode:
+                            for device in targets:
+                                subscribe_sensor(client, device)
                             logger.info("调试模式已启用，将发送传感器数据")
                         else:
+                            unsubscribe_sensor(client, targets)
                             logger.info("调试模式已禁用")
             except json.JSONDecodeError:
                 logger.warning(f"收到非JSON消息: {message}")
     except websockets.exceptions.ConnectionClosed:
         logger.info("WebSocket连接已关闭")
     finally:
-        connected_clients.remove(websocket)
+        connected_clients.pop(websocket, None)
+        unsubscribe_sensor(client, devices.values())
+        close_detection_sessions(client, devices.values())
+        client.close()
 
-# 扫描并连接BLE设备
-async def scan_and_connect():
-    """扫描并连接到BLE设备"""
-    logger.info(f"开始扫描BLE设备: {DEVICE_NAME}")
-    
-    device = None
-    
-    # 尝试直接使用地址连接
-    logger.info(f"尝试直接使用地址连接: {DEVICE_ADDRESS}")
-    device = await BleakScanner.find_device_by_address(DEVICE_ADDRESS)
-    
-    # 如果通过地址没找到，尝试扫描
-    if not device:
-        logger.info("通过地址未找到设备，开始扫描...")
-        # 尝试扫描设备
-        for _ in range(3):  # 尝试3次
-            devices = await BleakScanner.discover()
-            logger.info(f"发现了 {len(devices)} 个蓝牙设备")
-            for d in devices:
-                logger.info(f"发现设备: {d.name} ({d.address})")
-                if d.address == DEVICE_ADDRESS or (d.name and DEVICE_NAME.lower() in d.name.lower()):
-                    device = d
-                    break
-            
-            if device:
-                break
-            
-            logger.info("未找到设备，重试中...")
-            await asyncio.sleep(2)
-    
-    if not device:
-        logger.error(f"无法找到设备: {DEVICE_NAME} 或地址 {DEVICE_ADDRESS}")
+class StartupReport:
+    """启动耗时: 各阶段第一次完成时距启动计时起点的时间"""
+    def __init__(self, started=STARTUP_STARTED):
+        self.started = started
+        self.marks = {}
+
+    def mark(self, name):
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.started
+
+    def elapsed_ms(self, name):
+        return self.marks[name] * 1000
+
+    def snapshot(self):
+        return {name: round(seconds * 1000, 1) for name, seconds in self.marks.items()}
+
+startup = StartupReport()
+last_bridge_state = None
+
+def bridge_state():
+    """桥接服务的就绪状态: starting(加载设备) / connecting(还没有设备连上) / partial(部分设备已连接) / ready"""
+    if "devices_loaded" not in startup.marks:
+        state = "starting"
+    else:
+        connected = sum(d.connected for d in devices.values())
+        state = "ready" if connected == len(devices) else "partial" if connected else "connecting"
+    return {
+        "state": state,
+        "devices": {d.device_id: d.connection.state if d.connection else ("connected" if d.connected else "idle")
+                    for d in devices.values()}
+    }
+
+def notify_bridge_state():
+    """就绪状态或设备连接状态变化时广播给所有客户端，首次全部连上时输出启动耗时"""
+    global last_bridge_state
+    state = bridge_state()
+    if state == last_bridge_state:
         return
-    
-    logger.info(f"正在连接到设备: {getattr(device, 'name', 'Unknown')} ({device.address})")
-    
-    client = BleakClient(device)
-    
+    last_bridge_state = state
+    if state["state"] in ("partial", "ready"):
+        startup.mark("first_device_connected")
+    if state["state"] == "ready" and "all_devices_connected" not in startup.marks:
+        startup.mark("all_devices_connected")
+        logger.info("⏱ 启动耗时: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in startup.snapshot().items()))
+    broadcast_message(json.dumps({"status": "bridge_state", **state}))
+
+def load_bleak():
+    """按需导入bleak: 启动时在线程中导入(Windows的WinRT后端较慢)，与WebSocket监听和设备加载并行"""
+    import bleak
+    return bleak
+
+# 多个设备同时扫描时互斥，避免蓝牙适配器并发扫描冲突；连接和数据接收互不影响
+scan_lock = asyncio.Lock()
+# 已被某个设备占用的蓝牙地址，避免同型号设备按名称匹配到同一个
+claimed_addresses = set()
+# 最近一次全量扫描(时间, 结果)，以及正在等待查找的设备数
+last_scan = (float("-inf"), [])
+scan_waiters = 0
+
+class BleakBackend:
+    """真实蓝牙后端(bleak)；测试时可替换为fake_ble.FakeBLEBackend"""
+    async def find_device_by_address(self, address, timeout=SCAN_TIMEOUT):
+        return await load_bleak().BleakScanner.find_device_by_address(address, timeout=timeout)
+
+    async def discover(self, timeout=SCAN_TIMEOUT):
+        return await load_bleak().BleakScanner.discover(timeout=timeout)
+
+    def create_client(self, ble_device, disconnected_callback):
+        return load_bleak().BleakClient(ble_device, disconnected_callback=disconnected_callback)
+
+def match_scanned_device(device, scanned):
+    """判断扫描结果是否为目标设备: 优先按地址匹配，其次按名称匹配(跳过其他设备的地址)"""
+    if device.address and scanned.address.upper() == device.address.upper():
+        return True
+    if not device.name or not scanned.name or device.name.lower() not in scanned.name.lower():
+        return False
+    other_addresses = {d.address.upper() for d in devices.values() if d is not device and d.address}
+    return (scanned.address not in claimed_addresses and
+            scanned.address.upper() not in other_addresses)
+
+async def find_ble_device(device, backend):
+    """查找设备: 先查最近的全量扫描结果，再按地址直接查找，最后扫描一次；重试由连接管理器按退避间隔进行
+
+    多个设备同时等待查找时(如启动时)不逐个按地址查找，而是做一次全量扫描供所有设备共用。
+    """
+    global last_scan, scan_waiters
+    scan_waiters += 1
     try:
-        await client.connect()
-        logger.info("✅ 设备连接成功")
+        # 让同时启动的其他设备先登记，再决定按地址查找还是全量扫描
+        await asyncio.sleep(0)
+        async with scan_lock:
+            scanned_at, scanned_devices = last_scan
+            if time.monotonic() - scanned_at < SCAN_CACHE_TTL:
+                for d in scanned_devices:
+                    if match_scanned_device(device, d):
+                        logger.info(f"[{device.device_id}] 在最近的扫描结果中找到设备: {d.address}")
+                        return d
+            
+            if device.address and scan_waiters == 1:
+                logger.info(f"[{device.device_id}] 尝试直接使用地址连接: {device.address}")
+                found = await backend.find_device_by_address(device.address)
+                if found:
+                    return found
+                logger.info(f"[{device.device_id}] 通过地址未找到设备，开始扫描...")
+            
+            scanned_devices = await backend.discover()
+            last_scan = (time.monotonic(), scanned_devices)
+            logger.info(f"发现了 {len(scanned_devices)} 个蓝牙设备")
+            for d in scanned_devices:
+                logger.debug(f"发现设备: {d.name} ({d.address})")
+                if match_scanned_device(device, d):
+                    return d
+        return None
+    finally:
+        scan_waiters -= 1
+
+class BLEConnectionManager:
+    """设备的BLE连接管理: 缓存设备和特征handle，断线按退避间隔自动重连，统计通知中断和包速率"""
+    def __init__(self, device, backend=None):
+        self.device = device
+        self.backend = backend or BleakBackend()
+        self._state = "idle"
+        self.client = None
         
-        # 获取设备服务和特征并存储特征的handle
-        target_char_handle = None
-        target_service_uuid = None
+        # 缓存: 重连时跳过扫描和服务查找
+        self.ble_device = None
+        self.char_handle = None
+        self._cached_failures = 0
+        self._disconnected = asyncio.Event()
         
-        for service in client.services:
-            logger.info(f"发现服务: {service.uuid}")
-            for char in service.characteristics:
-                logger.info(f"  特征: {char.uuid}, 属性: {char.properties}, handle: {char.handle}")
-                
-                # 找到我们想要的特征（在正确的服务下）
-                if service.uuid.lower() == SERVICE_UUID.lower() and char.uuid.lower() == CHARACTERISTIC_UUID.lower():
-                    target_char_handle = char.handle
-                    target_service_uuid = service.uuid
-                    logger.info(f"找到目标特征，handle: {target_char_handle}")
-        
-        if target_char_handle is None:
-            logger.error("未找到目标特征")
-            return
-            
-        # 订阅特征
-        logger.info(f"正在订阅特征: handle={target_char_handle}")
-        await client.start_notify(target_char_handle, notification_handler)
-        logger.info("🎬 序列动作检测算法已启动")
+        # 连接统计
+        self.started_at = None
+        self.time_to_first_sample = None
+        self.connects = 0
+        self.connect_failures = 0
+        self.dropped_at = None
+        self.last_recovery_time = None
+        self.recovery = LatencyHistogram()
+        
+        # 通知统计
+        self.notifications = 0
+        self.last_notification = None
+        self.gaps = 0
+        self.max_gap = 0.0
+        self.packet_rate = 0.0
+        self.baseline_rate = None
+        self.rate_drops = 0
+
+    @property
+    def state(self):
+        """连接状态: idle, scanning, connecting, connected, waiting(等待重试)"""
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        if state != self._state:
+            self._state = state
+            notify_bridge_state()
+
+    def on_notification(self, sender, data):
+        """BLE通知回调: 记录间隔和首个样本时间，然后入队"""
+        now = time.monotonic()
+        if self.last_notification is None:
+            if self.time_to_first_sample is None:
+                self.time_to_first_sample = now - self.started_at
+                startup.mark("first_sample")
+                logger.info(f"[{self.device.device_id}] 启动到首个样本: {self.time_to_first_sample * 1000:.0f}ms")
+            if self.dropped_at is not None:
+                self.last_recovery_time = now - self.dropped_at
+                self.recovery.observe(self.last_recovery_time)
+                self.dropped_at = None
+                logger.info(f"[{self.device.device_id}] 断线恢复耗时: {self.last_recovery_time * 1000:.0f}ms")
+        else:
+            gap = now - self.last_notification
+            if gap > NOTIFICATION_GAP_THRESHOLD:
+                self.gaps += 1
+                self.max_gap = max(self.max_gap, gap)
+                logger.warning(f"[{self.device.device_id}] 通知中断 {gap * 1000:.0f}ms")
+        self.last_notification = now
+        self.notifications += 1
+        self.device.enqueue_frame(data)
+
+    def _on_disconnect(self, client):
+        self._disconnected.set()
+
+    async def _connect(self):
+        """连接一次: 优先使用缓存的设备和特征handle"""
+        device = self.device
+        if self.ble_device is None or self._cached_failures >= CACHED_CONNECT_ATTEMPTS:
+            self.state = "scanning"
+            self.ble_device = None
+            self.char_handle = None
+            self._cached_failures = 0
+            ble_device = await find_ble_device(device, self.backend)
+            if not ble_device:
+                raise ConnectionError(f"无法找到设备: {device.name} 或地址 {device.address}")
+            self.ble_device = ble_device
+        
+        self.state = "connecting"
+        claimed_addresses.add(self.ble_device.address)
+        logger.info(f"[{device.device_id}] 正在连接到设备: {getattr(self.ble_device, 'name', 'Unknown')} ({self.ble_device.address})")
+        self.client = self.backend.create_client(self.ble_device, self._on_disconnect)
+        await self.client.connect()
         
-        # 保持脚本运行
+        if self.char_handle is None:
+            # 按UUID直接查找目标服务下的特征，不遍历全部服务
+            service = self.client.services.get_service(device.service_uuid)
+            char = service.get_characteristic(device.characteristic_uuid) if service else None
+            if char is None:
+                raise ConnectionError("未找到目标特征")
+            self.char_handle = char.handle
+            logger.info(f"[{device.device_id}] 找到目标特征，handle: {self.char_handle}")
+        
+        await self.client.start_notify(self.char_handle, self.on_notification)
+
+    async def _close_client(self):
+        client, self.client = self.client, None
+        if client:
+            try:
+                await client.disconnect()
+            except Exception as e:
+                logger.debug(f"[{self.device.device_id}] 断开连接时出错: {e}")
+        if self.ble_device:
+            claimed_addresses.discard(self.ble_device.address)
+
+    async def _monitor(self):
+        """连接期间每个统计窗口计算包速率；长时间无通知时主动断开重连"""
+        connected_at = time.monotonic()
+        last_count = self.notifications
         while True:
-            await asyncio.sleep(1)
+            await asyncio.sleep(RATE_WINDOW)
+            now = time.monotonic()
+            count = self.notifications
+            self.packet_rate = (count - last_count) / RATE_WINDOW
+            last_count = count
             
-    except Exception as e:
-        logger.error(f"连接或通信错误: {e}")
+            if self.baseline_rate and self.packet_rate < self.baseline_rate * RATE_DROP_RATIO:
+                self.rate_drops += 1
+                logger.warning(f"[{self.device.device_id}] 包速率下降: {self.packet_rate:.0f}/s (基线 {self.baseline_rate:.0f}/s)")
+            elif self.packet_rate > 0:
+                # 基线为正常速率的指数滑动平均，掉速期间不更新
+                self.baseline_rate = (self.packet_rate if self.baseline_rate is None
+                                      else 0.9 * self.baseline_rate + 0.1 * self.packet_rate)
+            
+            if now - (self.last_notification or connected_at) > STALL_TIMEOUT:
+                logger.warning(f"[{self.device.device_id}] {STALL_TIMEOUT:g}秒未收到通知，重新连接")
+                self._disconnected.set()
+                return
+
+    async def run(self):
+        """保持连接: 断线或连接失败后按指数退避重试，直到任务被取消"""
+        device = self.device
+        self.started_at = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                self._disconnected.clear()
+                try:
+                    await self._connect()
+                except Exception as e:
+                    self.connect_failures += 1
+                    if self.ble_device is not None:
+                        self._cached_failures += 1
+                    await self._close_client()
+                    delay = min(RECONNECT_BACKOFF_INITIAL * 2 ** attempt, RECONNECT_BACKOFF_MAX)
+                    attempt += 1
+                    self.state = "waiting"
+                    logger.warning(f"[{device.device_id}] 连接失败: {e}，{delay:.1f}秒后重试")
+                    await asyncio.sleep(delay)
+                    continue
+                
+                attempt = 0
+                self._cached_failures = 0
+                self.connects += 1
+                device.connected = True
+                self.state = "connected"
+                logger.info(f"[{device.device_id}] ✅ 设备连接成功，🎬 序列动作检测算法已启动")
+                
+                monitor = asyncio.create_task(self._monitor())
+                try:
+                    await self._disconnected.wait()
+                finally:
+                    monitor.cancel()
+                    device.connected = False
+                    self.state = "waiting"
+                    self.dropped_at = time.monotonic()
+                    self.last_notification = None
+                    self.packet_rate = 0.0
+                    await self._close_client()
+                logger.warning(f"[{device.device_id}] 设备已断开，开始重连")
+        finally:
+            device.connected = False
+            self.state = "idle"
+            await self._close_client()
+            logger.info(f"[{device.device_id}] 已断开连接")
+
+    def get_stats(self):
+        return {
+            "state": self.state,
+            "address": self.ble_device.address if self.ble_device else None,
+            "connects": self.connects,
+            "reconnects": max(self.connects - 1, 0),
+            "connect_failures": self.connect_failures,
+            "time_to_first_sample_ms": (self.time_to_first_sample * 1000
+                                        if self.time_to_first_sample is not None else None),
+            "last_recovery_ms": self.last_recovery_time * 1000 if self.last_recovery_time is not None else None,
+            "recovery": self.recovery.snapshot(),
+            "notifications": self.notifications,
+            "notification_gaps": self.gaps,
+            "max_gap_ms": self.max_gap * 1000,
+            "packet_rate": self.packet_rate,
+            "baseline_rate": self.baseline_rate,
+            "rate_drops": self.rate_drops
+        }
+
+# 扫描并连接BLE设备
+async def scan_and_connect(device, backend=None):
+    """扫描并连接到BLE设备，断线后自动重连"""
+    logger.info(f"[{device.device_id}] 开始扫描BLE设备: {device.name or device.address}")
+    device.connection = BLEConnectionManager(device, backend)
+    await device.connection.run()
+
+def prometheus_label(value):
+    """转义Prometheus标签值中的反斜杠、双引号和换行(设备ID、动作名来自配置文件)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus_metrics():
+    """以Prometheus文本格式输出所有设备的阶段延迟和计数"""
+    lines = [
+        "# HELP imu_bridge_stage_latency_seconds Per-stage processing latency",
+        "# TYPE imu_bridge_stage_latency_seconds histogram",
+    ]
+    for device in devices.values():
+        for stage, h in device.metrics.histograms.items():
+            labels = f'device="{prometheus_label(device.device_id)}",stage="{prometheus_label(stage)}"'
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, h.counts):
+                cumulative += n
+                lines.append(f'imu_bridge_stage_latency_seconds_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'imu_bridge_stage_latency_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f'imu_bridge_stage_latency_seconds_sum{{{labels}}} {h.total:.9f}')
+            lines.append(f'imu_bridge_stage_latency_seconds_count{{{labels}}} {h.count}')
+    
+    gauges = [
+        ("imu_bridge_queue_depth", "gauge", "Raw notifications waiting in the device queue",
+         lambda d: d.frame_queue.qsize()),
+        ("imu_bridge_dropped_frames_total", "counter", "Notifications dropped because the queue was full",
+         lambda d: d.dropped_frames),
+        ("imu_bridge_samples_total", "counter", "IMU samples processed by the detector",
+         lambda d: d.detector.detection_stats["total_processed"]),
+        ("imu_bridge_connected", "gauge", "Whether the BLE device is connected",
+         lambda d: int(d.connected)),
+    ]
+    connection_gauges = [
+        ("imu_bridge_ble_reconnects_total", "counter", "BLE reconnections after a dropout",
+         lambda c: max(c.connects - 1, 0)),
+        ("imu_bridge_ble_connect_failures_total", "counter", "Failed BLE connection attempts",
+         lambda c: c.connect_failures),
+        ("imu_bridge_ble_notification_gaps_total", "counter", "Notification gaps longer than the gap threshold",
+         lambda c: c.gaps),
+        ("imu_bridge_ble_rate_drops_total", "counter", "Windows where the packet rate fell below the baseline",
+         lambda c: c.rate_drops),
+        ("imu_bridge_ble_packet_rate", "gauge", "Notifications per second in the last window",
+         lambda c: c.packet_rate),
+        ("imu_bridge_ble_time_to_first_sample_seconds", "gauge", "Startup to first notification",
+         lambda c: c.time_to_first_sample),
+        ("imu_bridge_ble_last_recovery_seconds", "gauge", "Dropout to first notification after reconnecting",
+         lambda c: c.last_recovery_time),
+    ]
+    clock_gauges = [
+        ("imu_bridge_dropped_samples_total", "counter", "Samples missing according to the device sample clock",
+         lambda c: c["dropped_samples"]),
+        ("imu_bridge_clock_resyncs_total", "counter", "Sample clock re-anchored after a late notification",
+         lambda c: c["resyncs"]),
+    ]
+    for name, kind, help_text, value in gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for device in devices.values():
+            lines.append(f'{name}{{device="{prometheus_label(device.device_id)}"}} {value(device)}')
+    for name, kind, help_text, value in connection_gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for device in devices.values():
+            if device.connection and value(device.connection) is not None:
+                lines.append(f'{name}{{device="{prometheus_label(device.device_id)}"}} {value(device.connection)}')
+    for name, kind, help_text, value in clock_gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for device in devices.values():
+            clock = device.get_stats()["clock"]
+            if clock:
+                lines.append(f'{name}{{device="{prometheus_label(device.device_id)}"}} {value(clock)}')
+    
+    lines.append("# HELP imu_bridge_detections_total Detected motions")
+    lines.append("# TYPE imu_bridge_detections_total counter")
+    for device in devices.values():
+        for action, n in device.detector.detection_stats.items():
+            if action != "total_processed":
+                lines.append(f'imu_bridge_detections_total{{device="{prometheus_label(device.device_id)}",'
+                             f'action="{prometheus_label(action)}"}} {n}')
+    lines.append("# HELP imu_bridge_client_dropped_total Messages dropped for a slow WebSocket client")
+    lines.append("# TYPE imu_bridge_client_dropped_total counter")
+    for client in connected_clients.values():
+        lines.append(f'imu_bridge_client_dropped_total{{client="{prometheus_label(client.address)}"}} {client.dropped}')
+    lines.append("# HELP imu_bridge_websocket_clients Connected WebSocket clients")
+    lines.append("# TYPE imu_bridge_websocket_clients gauge")
+    lines.append(f"imu_bridge_websocket_clients {len(connected_clients)}")
+    return "\n".join(lines) + "\n"
+
+async def metrics_http_handler(reader, writer):
+    """极简HTTP处理: GET /metrics 返回Prometheus文本"""
+    try:
+        request_line = await reader.readline()
+        # 读掉请求头
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+            body = render_prometheus_metrics().encode("utf-8")
+            status = "200 OK"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
     finally:
-        await client.disconnect()
-        logger.info("已断开连接")
+        writer.close()
+
+def start_recording(device, record_dir):
+    """为设备在录制目录下创建新的录制文件"""
+    os.makedirs(record_dir, exist_ok=True)
+    safe_id = re.sub(r'[^0-9A-Za-z_-]', '_', device.device_id)
+    path = os.path.join(record_dir, f"{safe_id}_{time.strftime('%Y%m%d_%H%M%S')}.imurec")
+    device.recorder = FrameRecorder(path, device)
+    logger.info(f"[{device.device_id}] 录制原始通知到: {path}")
+
+def start_session(device, session_dir):
+    """为设备在会话目录下创建新的会话存储，并记录检测器分析过的每个运动序列"""
+    safe_id = re.sub(r'[^0-9A-Za-z_-]', '_', device.device_id)
+    path = os.path.join(session_dir, f"{safe_id}_{time.strftime('%Y%m%d_%H%M%S')}")
+    device.session = SessionWriter(path, device.device_id, {
+        "sample_rate": device.parser.sample_rate,
+        "calibration": device.calibration,
+        "actions": list(device.detector.classifier.actions),
+    })
+    device.detector.motion_sink = device.session.add_motion
+    logger.info(f"[{device.device_id}] 保存训练会话到: {path}")
+
+def install_shutdown_handler():
+    """SIGTERM与Ctrl+C走相同的退出路径: 取消主任务，由main的finally关闭工作进程并写出录制和会话"""
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, task.cancel)
+    except NotImplementedError:
+        # Windows的事件循环不支持add_signal_handler
+        signal.signal(signal.SIGTERM, lambda signum, frame: loop.call_soon_threadsafe(task.cancel))
 
 # 主函数
-async def main():
+async def main(config_path=DEVICES_CONFIG_FILE, record_dir=None, replay_paths=None, replay_speed=1.0,
+               metrics_port=METRICS_PORT, fake_ble=False, workers=0, session_dir=None):
     """主函数"""
+    pool = None
+    install_shutdown_handler()
     try:
-        # 启动WebSocket服务器
+        # 先启动WebSocket服务器: Unity立即能连上并收到启动状态，设备加载和bleak导入随后并行进行
+        # (numpy和websockets此时已在模块级导入完成，监听前的耗时主要就是这部分导入)
         websocket_server = await websockets.serve(websocket_handler, "localhost", WEBSOCKET_PORT)
-        logger.info(f"WebSocket服务器已启动: ws://localhost:{WEBSOCKET_PORT}")
+        startup.mark("websocket_listening")
+        logger.info(f"WebSocket服务器已启动: ws://localhost:{WEBSOCKET_PORT} "
+                    f"(启动后{startup.elapsed_ms('websocket_listening'):.0f}ms)")
+        
+        if metrics_port:
+            await asyncio.start_server(metrics_http_handler, "localhost", metrics_port)
+            logger.info(f"指标服务已启动: http://localhost:{metrics_port}/metrics")
         
-        # 扫描并连接BLE设备
-        ble_task = asyncio.create_task(scan_and_connect())
+        bleak_import = None
+        if not replay_paths and not fake_ble:
+            bleak_import = asyncio.create_task(asyncio.to_thread(load_bleak))
+        
+        if replay_paths:
+            # 回放模式: 设备来自录制文件，不连接BLE
+            recordings = [Recording(path) for path in replay_paths]
+            for recording in recordings:
+                devices[recording.device_id] = recording.make_device()
+        else:
+            # 加载设备配置
+            for device in load_device_config(config_path):
+                devices[device.device_id] = device
+            
+            # 应用已保存的校准结果
+            calibrations = load_calibrations()
+            for device in devices.values():
+                if device.calibration_key in calibrations:
+                    apply_calibration(device, calibrations[device.calibration_key])
+                    logger.info(f"[{device.device_id}] 已加载校准结果")
+        logger.info(f"已加载 {len(devices)} 个设备: {list(devices)}")
+        
+        if record_dir:
+            for device in devices.values():
+                start_recording(device, record_dir)
+        if session_dir:
+            for device in devices.values():
+                start_session(device, session_dir)
+        
+        if workers:
+            # 多进程检测: 在加载校准之后启动，工作进程拿到的解析器已带零偏
+            pool = DetectionWorkerPool(min(workers, len(devices)))
+            pool.start(list(devices.values()))
+            await pool.wait_ready()
+        startup.mark("devices_loaded")
+        notify_bridge_state()
+        
+        if bleak_import:
+            await bleak_import
+            startup.mark("bleak_imported")
+        
+        # 每个设备独立扫描并连接，互不阻塞；各自的消费任务处理通知
+        consumer_tasks = [asyncio.create_task(consume_frames(device)) for device in devices.values()]
+        if replay_paths:
+            ble_tasks = [asyncio.create_task(replay_realtime(devices[r.device_id], r, replay_speed))
+                         for r in recordings]
+        else:
+            backend = None
+            if fake_ble:
+                # 本地模拟的BLE设备，不需要蓝牙硬件
+                import fake_ble as fake_ble_module
+                backend = fake_ble_module.make_backend(devices.values())
+            ble_tasks = [asyncio.create_task(scan_and_connect(device, backend)) for device in devices.values()]
         
         # 保持服务器运行
-        await asyncio.gather(websocket_server.wait_closed(), ble_task)
-    except KeyboardInterrupt:
+        await asyncio.gather(websocket_server.wait_closed(), *ble_tasks, *consumer_tasks)
+    except (KeyboardInterrupt, asyncio.CancelledError):
         logger.info("程序被中断")
     except Exception as e:
         logger.error(f"主函数错误: {e}")
+    finally:
+        if pool:
+            pool.close()
+        for device in devices.values():
+            if device.recorder:
+                device.recorder.close()
+            if device.session:
+                device.session.close()
+
+def run_offline_replay(paths):
+    """离线快速回放: 逐行输出事件JSON，最后输出吞吐量"""
+    for path in paths:
+        device, events, samples, elapsed = replay_offline(path)
+        for message in events:
+            print(message)
+        rate = samples / elapsed if elapsed > 0 else float("inf")
+        logger.info(f"[{device.device_id}] 回放 {path}: {samples} 个样本, {len(events)} 个事件, "
+                    f"耗时 {elapsed:.3f}s ({rate:.0f} 样本/秒)")
+
+startup.mark("imports")  # 模块级导入(含numpy、websockets)和定义完成
 
 # 运行主函数
 if __name__ == "__main__":
@@ -603,7 +3584,36 @@ if __name__ == "__main__":
         print("   ✅ 增加冷却时间，避免重复检测")
         print("="*60)
         
-        asyncio.run(main())
+        parser = argparse.ArgumentParser(description="IMU序列动作检测BLE桥接")
+        parser.add_argument("--config", default=DEVICES_CONFIG_FILE, help="设备配置文件(JSON)")
+        parser.add_argument("--record", metavar="DIR", help="把原始通知录制到该目录")
+        parser.add_argument("--replay", nargs="+", metavar="FILE", help="回放录制文件而不连接BLE设备")
+        parser.add_argument("--realtime", action="store_true", help="回放时按录制节奏送入WebSocket服务，否则离线尽快回放")
+        parser.add_argument("--speed", type=float, default=1.0, help="实时回放的速度倍数")
+        parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="指标HTTP端口，0表示不启动")
+        parser.add_argument("--slow-client-policy", choices=SLOW_CLIENT_POLICIES, default=default_client_policy,
+                            help="客户端发送队列满时的处理策略")
+        parser.add_argument("--fake-ble", action="store_true",
+                            help="使用本地模拟的BLE设备(含定时断线)，用于离线测试连接管理")
+        parser.add_argument("--early-decision", action="store_true",
+                            help="提前决策(实验性): 运动进行中置信度达到阈值(默认0.9)即发出事件，不等运动结束；"
+                                 "合成数据上跺脚约2.6s识别(比完整序列模式快约0.5s)，踢腿与完整序列模式基本相同(约3.0s)")
+        parser.add_argument("--provisional-events", action="store_true",
+                            help="检测到运动开始时先发出临时的motion_started事件")
+        parser.add_argument("--session", metavar="DIR",
+                            help="把每次训练的样本、运动序列特征和检测结果按列保存到该目录(分块NPZ)")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="检测工作进程数，0表示在主进程中检测；设备按轮询分配到各工作进程")
+        args = parser.parse_args()
+        
+        default_client_policy = args.slow_client_policy
+        default_early_decision = args.early_decision
+        default_provisional_events = args.provisional_events
+        if args.replay and not args.realtime:
+            run_offline_replay(args.replay)
+        else:
+            asyncio.run(main(args.config, args.record, args.replay, args.speed, args.metrics_port, args.fake_ble,
+                             args.workers, args.session))
     except KeyboardInterrupt:
         print("\n程序被用户中断")
     except Exception as e:
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from imu_protocol import ACCEL_SCALE, CHARACTERISTIC_UUID, GYRO_SCALE, SERVICE_UUID
+
+logger = logging.getLogger("fake_ble")
+
+# 合成数据的默认场景: 静止 → 跺脚 → 静止 → 踢腿 → 静止 → 噪声，循环多次(基准测试使用同一场景)
+DEFAULT_SCENARIO = [("idle", 2.0), ("stomp", 1.5), ("idle", 2.0), ("kick", 2.0), ("idle", 1.0), ("noise", 1.0)]
+
+# 默认的模拟故障: 启动后10秒断线1.5秒，25秒时通知暂停1秒，40秒时速率减半5秒，之后每60秒重复
+DEFAULT_DROPOUTS = ((10.0, 1.5),)
+DEFAULT_STALLS = ((25.0, 1.0),)
+DEFAULT_SLOWDOWNS = ((40.0, 5.0, 0.3),)
+DEFAULT_PERIOD = 60.0
+
+def generate_segment(kind, n, rate, rng):
+    """生成一段合成IMU信号，返回(n, 6)数组(单位: G, °/s)"""
+    t = np.arange(n) / rate
+    imu = np.zeros((n, 6))
+    imu[:, 2] = 1.0  # 重力
+    imu += rng.normal(0, [0.02, 0.02, 0.02, 2.0, 2.0, 2.0], size=(n, 6))
+
+    if kind == "stomp":
+        # 跺脚: Z轴尖锐冲击，X轴和Y角速度幅度中等
+        imu[:, 2] += 2.5 * np.sin(t * 20)
+        imu[:, 0] += 0.5 * np.sin(t * 13)
+        imu[:, 4] += 60 * np.sin(t * 9)
+    elif kind == "kick":
+        # 踢腿: X轴平滑摆动，Y角速度大
+        imu[:, 0] += 0.8 * np.sin(t * 4)
+        imu[:, 2] += 0.6 * np.sin(t * 3)
+        imu[:, 4] += 150 * np.sin(t * 5)
+    elif kind == "noise":
+        # 噪声: 各轴宽带随机抖动
+        imu += rng.normal(0, [0.3, 0.3, 0.3, 40.0, 40.0, 40.0], size=(n, 6))
+    elif kind != "idle":
+        raise ValueError(f"未知的信号类型: {kind}")
+    return imu
+
+def generate_imu_stream(scenario=DEFAULT_SCENARIO, cycles=20, rate=100.0, seed=0):
+    """生成合成IMU数据流，返回(到达时间, 原始通知帧列表, 六轴样本, 动作片段列表)"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    motions = []
+    start = 0
+    for _ in range(cycles):
+        for kind, duration in scenario:
+            n = int(duration * rate)
+            parts.append(generate_segment(kind, n, rate, rng))
+            if kind in ("stomp", "kick"):
+                motions.append((kind, start, start + n))
+            start += n
+    imu = np.concatenate(parts)
+
+    # 按im600通知格式打包: 10字节帧头 + 6个大端int16
+    scale = np.array([ACCEL_SCALE] * 3 + [GYRO_SCALE] * 3)
+    raw = np.clip(np.round(imu / scale), -32768, 32767).astype('>i2')
+    header = bytes(10)
+    frames = [header + row.tobytes() for row in raw]
+    arrival_times = np.arange(len(frames)) / rate
+    return arrival_times, frames, imu, motions
+
+class FakeCharacteristic:
+    def __init__(self, uuid, handle):
+        self.uuid = uuid
+        self.handle = handle
+        self.properties = ["notify"]
+
+class FakeService:
+    def __init__(self, uuid, characteristics):
+        self.uuid = uuid
+        self.characteristics = characteristics
+
+    def get_characteristic(self, spec):
+        for char in self.characteristics:
+            if char.handle == spec or (isinstance(spec, str) and char.uuid.lower() == spec.lower()):
+                return char
+        return None
+
+class FakeServiceCollection:
+    def __init__(self, services):
+        self.services = {s.uuid.lower(): s for s in services}
+
+    def __iter__(self):
+        return iter(self.services.values())
+
+    def get_service(self, uuid):
+        return self.services.get(uuid.lower())
+
+class FakeBLEDevice:
+    """扫描结果(对应bleak的BLEDevice)"""
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+
+class FakePeripheral:
+    """模拟的IMU外设: 按固定速率发送合成通知，按时间表断线、暂停通知或降低速率
+
+    时间表中的时间为启动后的秒数，period不为空时整个时间表循环重复。
+    """
+    def __init__(self, name, address, service_uuid=SERVICE_UUID, characteristic_uuid=CHARACTERISTIC_UUID,
+                 rate=100.0, dropouts=DEFAULT_DROPOUTS, stalls=DEFAULT_STALLS, slowdowns=DEFAULT_SLOWDOWNS,
+                 period=DEFAULT_PERIOD, connect_delay=0.05, seed=0):
+        self.device = FakeBLEDevice(name, address)
+        self.rate = rate
+        self.dropouts = dropouts
+        self.stalls = stalls
+        self.slowdowns = slowdowns
+        self.period = period
+        self.connect_delay = connect_delay
+        self.seed = seed
+        self.characteristic = FakeCharacteristic(characteristic_uuid, 0x2A)
+        self.services = FakeServiceCollection([FakeService(service_uuid, [self.characteristic])])
+        self.started_at = time.monotonic()
+        self._frames = None
+
+    @property
+    def frames(self):
+        """合成的通知帧(与基准测试相同的场景)，循环使用"""
+        if self._frames is None:
+            _, self._frames, _, _ = generate_imu_stream(cycles=5, rate=self.rate, seed=self.seed)
+        return self._frames
+
+    def _elapsed(self):
+        elapsed = time.monotonic() - self.started_at
+        return elapsed % self.period if self.period else elapsed
+
+    def _active(self, schedule):
+        elapsed = self._elapsed()
+        for entry in schedule:
+            if entry[0] <= elapsed < entry[0] + entry[1]:
+                return entry
+        return None
+
+    def available(self):
+        """断线期间既不广播也不能连接"""
+        return self._active(self.dropouts) is None
+
+    def stalled(self):
+        return self._active(self.stalls) is not None
+
+    def rate_factor(self):
+        slowdown = self._active(self.slowdowns)
+        return slowdown[2] if slowdown else 1.0
+
+class FakeBleakClient:
+    """模拟的BleakClient: 支持connect/start_notify/disconnect和断线回调"""
+    def __init__(self, peripheral, disconnected_callback=None):
+        self.peripheral = peripheral
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.services = None
+        self._stream_task = None
+
+    async def connect(self):
+        await asyncio.sleep(self.peripheral.connect_delay)
+        if not self.peripheral.available():
+            raise ConnectionError("模拟设备不可用")
+        self.is_connected = True
+        self.services = self.peripheral.services
+
+    async def start_notify(self, handle, callback):
+        if not self.is_connected:
+            raise ConnectionError("未连接")
+        if handle != self.peripheral.characteristic.handle:
+            raise ValueError(f"未知的特征handle: {handle}")
+        self._stream_task = asyncio.create_task(self._stream(callback))
+
+    async def _stream(self, callback):
+        peripheral = self.peripheral
+        frames = peripheral.frames
+        characteristic = peripheral.characteristic
+        index = 0
+        next_time = time.monotonic()
+        while self.is_connected:
+            if not peripheral.available():
+                self._drop()
+                return
+            if not peripheral.stalled():
+                callback(characteristic, bytearray(frames[index % len(frames)]))
+                index += 1
+            next_time += 1.0 / (peripheral.rate * peripheral.rate_factor())
+            await asyncio.sleep(max(next_time - time.monotonic(), 0))
+
+    def _drop(self):
+        """外设断线: 与真实设备一样触发断线回调"""
+        self.is_connected = False
+        logger.info(f"模拟设备断线: {self.peripheral.device.address}")
+        if self.disconnected_callback:
+            self.disconnected_callback(self)
+
+    async def disconnect(self):
+        self.is_connected = False
+        if self._stream_task and self._stream_task is not asyncio.current_task():
+            self._stream_task.cancel()
+
+class FakeBLEBackend:
+    """与ble_bridge.BleakBackend接口相同的模拟后端"""
+    def __init__(self, peripherals, scan_delay=0.2):
+        self.peripherals = {p.device.address.upper(): p for p in peripherals}
+        self.scan_delay = scan_delay
+
+    async def find_device_by_address(self, address, timeout=None):
+        await asyncio.sleep(self.scan_delay)
+        peripheral = self.peripherals.get(address.upper())
+        return peripheral.device if peripheral and peripheral.available() else None
+
+    async def discover(self, timeout=None):
+        await asyncio.sleep(self.scan_delay)
+        return [p.device for p in self.peripherals.values() if p.available()]
+
+    def create_client(self, ble_device, disconnected_callback):
+        return FakeBleakClient(self.peripherals[ble_device.address.upper()], disconnected_callback)
+
+def make_backend(devices, **options):
+    """为配置中的每个设备创建一个模拟外设(无地址的设备使用生成的地址)"""
+    peripherals = []
+    for i, device in enumerate(devices):
+        peripherals.append(FakePeripheral(
+            device.name or device.device_id,
+            device.address or f"FA:KE:00:00:00:{i:02X}",
+            device.service_uuid,
+            device.characteristic_uuid,
+            rate=device.parser.sample_rate or 100.0,
+            seed=i,
+            **options
+        ))
+    return FakeBLEBackend(peripherals)
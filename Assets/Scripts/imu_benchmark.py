@@ -0,0 +1,195 @@
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import ble_bridge
+from ble_bridge import IMUDevice, MotionSequenceBuffer, SequentialMotionDetector, FRAME_BATCH_SIZE, process_imu_frames
+from fake_ble import generate_imu_stream
+
+logger = logging.getLogger("imu_benchmark")
+
+# 分配统计只在前若干次调用上进行(tracemalloc很慢)
+ALLOC_SAMPLE_LIMIT = 2000
+
+def time_calls(func, args_list):
+    """逐次调用并记录每次耗时(纳秒)"""
+    latencies = np.empty(len(args_list), dtype=np.int64)
+    perf_counter_ns = time.perf_counter_ns
+    for i, args in enumerate(args_list):
+        t0 = perf_counter_ns()
+        func(*args)
+        latencies[i] = perf_counter_ns() - t0
+    return latencies
+
+def measure_allocations(func, args_list):
+    """用tracemalloc统计每次调用的临时分配峰值和保留的内存块"""
+    args_list = args_list[:ALLOC_SAMPLE_LIMIT]
+    tracemalloc.start()
+    transient = 0
+    blocks_before = sys.getallocatedblocks()
+    for args in args_list:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        transient += peak - before
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+    return transient, blocks_after - blocks_before, len(args_list)
+
+def run_stage(name, make_stage):
+    """运行一个流水线阶段: 一遍计时，一遍(新状态)统计分配
+
+    make_stage返回(函数, 参数列表, 每次调用的样本数)，样本数为常数或与参数列表等长的序列(最后一批可能不满)。
+    """
+    func, args_list, samples_per_call = make_stage()
+    counts = np.broadcast_to(np.asarray(samples_per_call, dtype=np.int64), (len(args_list),))
+    start = time.perf_counter()
+    latencies = time_calls(func, args_list)
+    elapsed = time.perf_counter() - start
+    samples = int(counts.sum())
+
+    func, args_list, _ = make_stage()
+    transient, retained_blocks, calls = measure_allocations(func, args_list)
+    alloc_samples = max(int(counts[:calls].sum()), 1)
+
+    per_sample_us = latencies / 1000.0 / counts
+    result = {
+        "calls": len(args_list),
+        "samples": samples,
+        "throughput_sps": samples / elapsed if elapsed > 0 else None,
+        "latency_us": {
+            "p50": float(np.percentile(per_sample_us, 50)),
+            "p99": float(np.percentile(per_sample_us, 99)),
+            "max": float(per_sample_us.max()),
+        },
+        "alloc_bytes_per_sample": transient / alloc_samples,
+        "retained_blocks_per_sample": retained_blocks / alloc_samples,
+    }
+    logger.info(f"{name:>16}: {result['throughput_sps']:>12.0f} 样本/秒  "
+                f"p50={result['latency_us']['p50']:.2f}us  p99={result['latency_us']['p99']:.2f}us  "
+                f"max={result['latency_us']['max']:.1f}us  分配={result['alloc_bytes_per_sample']:.0f}B/样本")
+    return result
+
+def detection_latency(arrival_times, imu, motions, early_decision):
+    """动作开始到识别事件的延迟: 事件对应的运动序列须开始于该动作片段内(允许提前0.3秒)"""
+    detector = SequentialMotionDetector()
+    detector.early_decision = early_decision
+    results = [r for r in detector.process_motion_batch(arrival_times, imu) if not r.get("provisional")]
+    latencies = {}
+    for kind, start, end in motions:
+        for r in results:
+            if (r["action"] == kind and
+                    arrival_times[start] - 0.3 <= r["motion_start"] <= arrival_times[end - 1]):
+                latencies.setdefault(kind, []).append(r["timestamp"] - arrival_times[start])
+                break
+    return {kind: {"detected": len(values), "p50_ms": float(np.median(values)) * 1000,
+                   "max_ms": float(np.max(values)) * 1000}
+            for kind, values in latencies.items()}
+
+def benchmark(rate=100.0, cycles=20, seed=0, batch_size=FRAME_BATCH_SIZE):
+    """对检测流水线的各阶段做基准测试，返回可序列化的结果字典"""
+    arrival_times, frames, imu, motions = generate_imu_stream(cycles=cycles, rate=rate, seed=seed)
+    times = arrival_times.tolist()
+    parsed = [IMUDevice("bench").parser.parse_frame(f) for f in frames]
+
+    def parse_stage():
+        parser = IMUDevice("bench").parser
+        return parser.parse_frame, [(f,) for f in frames], 1
+
+    def parse_batch_stage():
+        parser = IMUDevice("bench").parser
+        args = [(frames[i:i + batch_size], times[i:i + batch_size])
+                for i in range(0, len(frames), batch_size)]
+        return parser.parse_batch, args, [len(a[0]) for a in args]
+
+    def detect_stage():
+        detector = IMUDevice("bench").detector
+        return detector.process_motion_sequence, list(zip(parsed, times)), 1
+
+    def analyze_stage():
+        detector = IMUDevice("bench").detector
+        args = []
+        for kind, start, end in motions:
+            buffer = MotionSequenceBuffer()
+            for i in range(start, end):
+                buffer.append(times[i], imu[i])
+            args.append((buffer,))
+        return detector.analyze_complete_motion, args, [end - start for _, start, end in motions]
+
+    def end_to_end_stage():
+        device = IMUDevice("bench")
+        return process_imu_frames, [(device, [f], [t]) for f, t in zip(frames, times)], 1
+
+    def end_to_end_batch_stage():
+        device = IMUDevice("bench")
+        args = [(device, frames[i:i + batch_size], times[i:i + batch_size])
+                for i in range(0, len(frames), batch_size)]
+        return process_imu_frames, args, [len(a[1]) for a in args]
+
+    stages = {
+        "parse": parse_stage,
+        "parse_batch": parse_batch_stage,
+        "detect": detect_stage,
+        "analyze": analyze_stage,
+        "end_to_end": end_to_end_stage,
+        "end_to_end_batch": end_to_end_batch_stage,
+    }
+
+    # 检测日志会淹没计时结果，测试期间只保留警告
+    logging.getLogger(ble_bridge.__name__).setLevel(logging.WARNING)
+    results = {name: run_stage(name, make_stage) for name, make_stage in stages.items()}
+
+    # 检测结果核对: 合成数据中每个动作片段对应的识别数量
+    device = IMUDevice("bench")
+    events = [json.loads(m)["motion_type"] for m in process_imu_frames(device, frames, times)]
+    
+    # 动作开始到识别事件的延迟: 完整序列模式 vs 提前决策模式
+    latency = {
+        "sequence": detection_latency(arrival_times, imu, motions, early_decision=False),
+        "early": detection_latency(arrival_times, imu, motions, early_decision=True),
+    }
+    for mode, stats in latency.items():
+        logger.info(f"{mode:>16}: " + "  ".join(f"{k} p50={v['p50_ms']:.0f}ms ({v['detected']}个)" for k, v in stats.items()))
+
+    return {
+        "config": {
+            "rate": rate,
+            "cycles": cycles,
+            "seed": seed,
+            "batch_size": batch_size,
+            "samples": len(frames),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "stages": results,
+        "events": {
+            "expected": {k: sum(1 for m in motions if m[0] == k) for k in ("stomp", "kick")},
+            "detected": {k: events.count(k) for k in ("stomp", "kick")},
+        },
+        "detection_latency": latency,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IMU检测流水线基准测试")
+    parser.add_argument("--rate", type=float, default=100.0, help="合成数据采样率(Hz)")
+    parser.add_argument("--cycles", type=int, default=20, help="场景循环次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--batch-size", type=int, default=FRAME_BATCH_SIZE, help="批量阶段每批通知数")
+    parser.add_argument("--output", help="把JSON结果写入文件(默认输出到标准输出)")
+    args = parser.parse_args()
+
+    report = benchmark(args.rate, args.cycles, args.seed, args.batch_size)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        logger.info(f"结果已写入: {args.output}")
+    else:
+        print(text)
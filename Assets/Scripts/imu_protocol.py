@@ -0,0 +1,9 @@
+# im600 IMU的BLE协议常量: 桥接脚本和模拟设备(fake_ble)共用
+# 模拟设备不导入ble_bridge，桥接脚本作为__main__运行时不会被再次导入为另一个模块
+
+SERVICE_UUID = "0000ae30-0000-1000-8000-00805f9b34fb"  # 服务UUID
+CHARACTERISTIC_UUID = "0000ae02-0000-1000-8000-00805f9b34fb"  # 通知特征UUID
+
+# 原始数据换算系数
+ACCEL_SCALE = 1.0 / 32768.0 * 16.0  # 假设±16G量程
+GYRO_SCALE = 1.0 / 32768.0 * 2000.0  # 假设±2000°/s量程
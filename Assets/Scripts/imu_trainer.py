@@ -0,0 +1,172 @@
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+
+import ble_bridge
+from ble_bridge import LinearClassifier, load_classifier
+from imu_tuner import MATCH_TOLERANCE, SegmentingDetector, load_session
+
+logger = logging.getLogger("imu_trainer")
+
+# 模型使用的特征: 不含峰值计数(提前决策时峰值计数需要逐样本重新统计整个部分序列)
+MODEL_FEATURES = ["duration", "x_std", "z_std", "y_gyro_std", "x_range", "z_range", "y_gyro_range",
+                  "max_intensity", "transition_sharpness", "motion_smoothness"]
+NO_ACTION = "none"
+
+def label_segments(segments, labels):
+    """按运动开始时间把分段与标注贪心匹配，未匹配的分段标为无动作"""
+    used = [False] * len(labels)
+    names = []
+    for start, _, _ in segments:
+        name = NO_ACTION
+        for i, (action, label_start, label_end) in enumerate(labels):
+            if not used[i] and label_start - MATCH_TOLERANCE <= start <= label_end + MATCH_TOLERANCE:
+                used[i] = True
+                name = action
+                break
+        names.append(name)
+    return names
+
+def collect_samples(paths, filter_spec=None, detector_params=None):
+    """用检测器的分段逻辑切出录制文件中的运动序列，返回(特征字典列表, 标签列表)"""
+    features, names = [], []
+    for path in paths:
+        timestamps, imu, window_columns, labels = load_session(path, filter_spec=filter_spec)
+        detector = SegmentingDetector(window_columns, {})
+        for name, value in (detector_params or {}).items():
+            setattr(detector, name, value)
+        detector.process_motion_batch(timestamps, imu)
+        features.extend(f for _, _, f in detector.segments)
+        names.extend(label_segments(detector.segments, labels))
+        logger.info(f"{path}: {len(detector.segments)} 个运动序列，{len(labels)} 个标注")
+    return features, names
+
+def fit_logistic(X, y, n_classes, l2=1e-2, iterations=2000, learning_rate=0.5):
+    """带L2正则的多项逻辑回归(全批量梯度下降)，按类别频率加权，返回标准化后特征上的(权重, 偏置)"""
+    n, d = X.shape
+    onehot = np.eye(n_classes)[y]
+    counts = np.bincount(y, minlength=n_classes)
+    sample_weight = (n / (n_classes * np.maximum(counts, 1)))[y][:, None] / n
+    W = np.zeros((d, n_classes))
+    b = np.zeros(n_classes)
+    for _ in range(iterations):
+        logits = X @ W + b
+        logits -= logits.max(axis=1, keepdims=True)
+        p = np.exp(logits)
+        p /= p.sum(axis=1, keepdims=True)
+        error = (p - onehot) * sample_weight
+        W -= learning_rate * (X.T @ error + l2 * W)
+        b -= learning_rate * error.sum(axis=0)
+    return W, b
+
+def train(features, names, actions, l2=1e-2, min_confidence=0.5):
+    """训练模型，返回可写入JSON并由LinearClassifier加载的模型字典"""
+    classes = list(actions) + [NO_ACTION]
+    X = np.array([[f[name] for name in MODEL_FEATURES] for f in features], dtype=np.float64)
+    y = np.array([classes.index(name) for name in names])
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    W, b = fit_logistic((X - mean) / scale, y, len(classes), l2)
+    return {
+        "type": "logistic",
+        "actions": list(actions),
+        "feature_names": MODEL_FEATURES,
+        "mean": mean.tolist(),
+        "scale": scale.tolist(),
+        "weights": W.tolist(),
+        "bias": b.tolist(),
+        "min_confidence": min_confidence,
+        "max_confidence": 0.95,
+        "trained": {
+            "samples": len(y),
+            "class_counts": {c: int((y == i).sum()) for i, c in enumerate(classes)},
+            "l2": l2,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+    }
+
+def evaluate(classifier, features, names):
+    """评估分类器: 准确率和各动作的精确率/召回率(无动作的序列被识别为动作即为误报)"""
+    predicted = []
+    for f in features:
+        result = classifier.classify(f)
+        predicted.append(result["action"] if result else NO_ACTION)
+    report = {"accuracy": float(np.mean([p == t for p, t in zip(predicted, names)])) if names else 0.0}
+    for action in classifier.actions:
+        hits = sum(p == t == action for p, t in zip(predicted, names))
+        detected = predicted.count(action)
+        labeled = names.count(action)
+        report[action] = {
+            "precision": hits / detected if detected else 0.0,
+            "recall": hits / labeled if labeled else 0.0,
+        }
+    # 单次推理耗时(特征字典 -> 结果)
+    start = time.perf_counter()
+    repeats = max(1, 2000 // max(len(features), 1))
+    for _ in range(repeats):
+        for f in features:
+            classifier.classify(f)
+    report["inference_us"] = (time.perf_counter() - start) / max(repeats * len(features), 1) * 1e6
+    return report
+
+def split(names, holdout, seed):
+    """按类别分层随机划分训练集和验证集下标"""
+    rng = np.random.default_rng(seed)
+    train_idx, test_idx = [], []
+    for name in sorted(set(names)):
+        idx = [i for i, n in enumerate(names) if n == name]
+        rng.shuffle(idx)
+        k = int(round(len(idx) * holdout))
+        test_idx.extend(idx[:k])
+        train_idx.extend(idx[k:])
+    return sorted(train_idx), sorted(test_idx)
+
+def log_report(name, report):
+    actions = "  ".join(f"{k} 精确率={v['precision']:.3f} 召回率={v['recall']:.3f}"
+                        for k, v in report.items() if isinstance(v, dict))
+    logger.info(f"{name:>6}: 准确率={report['accuracy']:.3f}  {actions}  推理={report['inference_us']:.1f}us")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="在标注录制文件上训练轻量动作分类模型(多项逻辑回归)")
+    parser.add_argument("recordings", nargs="+", help="录制文件(.imurec)，标注文件为同名的.labels.json")
+    parser.add_argument("--output", default="motion_model.json", help="模型输出文件(设备配置中classifier指向该文件)")
+    parser.add_argument("--classifier", help="作为基线比较的分类规则表JSON文件(默认使用内置规则)")
+    parser.add_argument("--filter", help="滤波参数JSON(同设备配置中的filter，如'{\"sample_rate\": 100}')，默认使用录制时的滤波配置")
+    parser.add_argument("--detector", help="分段参数JSON(如'{\"motion_intensity_threshold\": 0.12}')")
+    parser.add_argument("--l2", type=float, default=1e-2, help="L2正则系数")
+    parser.add_argument("--min-confidence", type=float, default=0.5, help="低于该概率不触发事件")
+    parser.add_argument("--holdout", type=float, default=0.25, help="验证集比例(0表示不验证)")
+    parser.add_argument("--seed", type=int, default=0, help="划分验证集的随机种子")
+    args = parser.parse_args()
+
+    logging.getLogger(ble_bridge.__name__).setLevel(logging.WARNING)
+    features, names = collect_samples(args.recordings, json.loads(args.filter) if args.filter else None,
+                                      json.loads(args.detector) if args.detector else None)
+    baseline = load_classifier(args.classifier)
+    actions = baseline.actions
+    unknown = sorted(set(names) - set(actions) - {NO_ACTION})
+    if unknown:
+        raise SystemExit(f"标注中有分类器未声明的动作: {unknown}")
+    logger.info(f"共 {len(names)} 个运动序列: " + ", ".join(f"{c}={names.count(c)}" for c in actions + [NO_ACTION]))
+
+    if args.holdout > 0:
+        train_idx, test_idx = split(names, args.holdout, args.seed)
+        model = LinearClassifier(train([features[i] for i in train_idx], [names[i] for i in train_idx],
+                                       actions, args.l2, args.min_confidence))
+        test_features = [features[i] for i in test_idx]
+        test_names = [names[i] for i in test_idx]
+        logger.info(f"验证集 {len(test_idx)} 个运动序列:")
+        log_report("规则", evaluate(baseline, test_features, test_names))
+        log_report("模型", evaluate(model, test_features, test_names))
+
+    # 用全部数据训练最终模型
+    result = train(features, names, actions, args.l2, args.min_confidence)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    log_report("全部", evaluate(LinearClassifier(result), features, names))
+    logger.info(f"模型已写入: {args.output}")
@@ -0,0 +1,268 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import ble_bridge
+from ble_bridge import (Recording, RuleClassifier, SequentialMotionDetector, SlidingWindowStats, load_classifier,
+                        load_filter)
+
+logger = logging.getLogger("imu_tuner")
+
+# 默认参数网格: 检测器的分段参数 + 冷却时间 + 分类规则边界("rules.<规则序号>.<min|max|above|below>")
+DEFAULT_GRID = {
+    "detector": {
+        "motion_intensity_threshold": [0.08, 0.10, 0.12, 0.15, 0.20],
+        "min_motion_duration": [0.5],
+        "max_motion_duration": [2.0, 2.5, 3.0],
+        "cooldown_time": [1.5, 2.5],
+    },
+    "classifier": {
+        "rules.2.above": [2.5, 3.0, 3.5],
+        "rules.3.below": [1.0, 1.5, 2.0],
+    }
+}
+
+# 检测时间落在标注区间前后该范围内视为同一次动作(秒)
+MATCH_TOLERANCE = 0.5
+
+def load_labels(path):
+    """读取标注文件: {"events": [{"action": "stomp", "start": 秒, "end": 秒}, ...]}，时间为墙钟时间(Unix秒)"""
+    with open(path, encoding="utf-8") as f:
+        events = json.load(f)["events"]
+    return sorted(((e["action"], float(e["start"]), float(e["end"])) for e in events), key=lambda e: e[1])
+
+def precompute_window_features(imu, window_size=15):
+    """对整段数据计算一次当前窗口特征(与参数无关)，各参数组合共用"""
+    stats = SlidingWindowStats(window_size)
+    columns = np.empty((len(imu), 6))
+    for i, sample in enumerate(imu.tolist()):
+        stats.update(sample)
+        features = stats.features()
+        columns[i] = (features['x_std'], features['z_std'], features['y_gyro_std'],
+                      features['x_range'], features['z_range'], features['y_gyro_range'])
+    return columns
+
+class PrecomputedWindowStats:
+    """按样本顺序回放预先计算的窗口特征，替代检测器中的SlidingWindowStats"""
+    def __init__(self, columns):
+        self._columns = [column.tolist() for column in columns.T]
+        self._index = 0
+
+    def update(self, imu):
+        self._index += 1
+
+    def features(self):
+        i = self._index - 1
+        x_std, z_std, y_gyro_std, x_range, z_range, y_gyro_range = (c[i] for c in self._columns)
+        return {
+            'x_std': x_std,
+            'z_std': z_std,
+            'y_gyro_std': y_gyro_std,
+            'x_range': x_range,
+            'z_range': z_range,
+            'y_gyro_range': y_gyro_range,
+        }
+
+class SegmentingDetector(SequentialMotionDetector):
+    """只做分段的检测器: 记录每个完整运动序列的特征而不分类，序列特征按边界缓存"""
+    def __init__(self, window_columns, feature_cache):
+        super().__init__()
+        self.window_stats = PrecomputedWindowStats(window_columns)
+        self.feature_cache = feature_cache
+        self.segments = []  # (运动开始时间, 分析时间, 特征字典)
+        self._current_time = 0.0
+
+    def _advance(self, imu, current_time, buffered):
+        self._current_time = current_time
+        return super()._advance(imu, current_time, buffered)
+
+    def analyze_complete_motion(self, motion_data):
+        if len(motion_data) < 10:
+            return None
+        timestamps = motion_data.timestamps
+        key = (len(motion_data), timestamps[0], timestamps[-1])
+        features = self.feature_cache.get(key)
+        if features is None:
+            features = self.extract_motion_features(motion_data.imu, timestamps)
+            self.feature_cache[key] = features
+        self.segments.append((float(timestamps[0]), self._current_time, features))
+        return None
+
+def build_bounds(classifier, classifier_grid):
+    """把分类规则网格展开为(参数组合列表, 下界矩阵, 上界矩阵)，矩阵每行一组阈值"""
+    names = list(classifier_grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*classifier_grid.values())]
+    lower = np.tile(classifier.lower, (len(combos), 1))
+    upper = np.tile(classifier.upper, (len(combos), 1))
+    for row, combo in enumerate(combos):
+        for name, value in combo.items():
+            _, index, bound = name.split(".")
+            index = int(index)
+            if bound in ("min", "above"):
+                if classifier.lower_open[index] != (bound == "above"):
+                    raise ValueError(f"规则{index}没有{bound}边界")
+                lower[row, index] = value
+            elif bound in ("max", "below"):
+                if classifier.upper_open[index] != (bound == "below"):
+                    raise ValueError(f"规则{index}没有{bound}边界")
+                upper[row, index] = value
+            else:
+                raise ValueError(f"未知的规则参数: {name}")
+    return combos, lower, upper
+
+def match_detections(detections, labels):
+    """把检测结果与标注贪心匹配，返回(正确数, 检测延迟列表)；延迟为识别时间减去标注的动作开始时间"""
+    used = [False] * len(labels)
+    hits = 0
+    latencies = []
+    for action, start, analyzed_at in detections:
+        for i, (label_action, label_start, label_end) in enumerate(labels):
+            if (not used[i] and label_action == action and
+                    label_start - MATCH_TOLERANCE <= start <= label_end + MATCH_TOLERANCE):
+                used[i] = True
+                hits += 1
+                latencies.append(analyzed_at - label_start)
+                break
+    return hits, latencies
+
+# 工作进程状态: 由initializer设置一次，避免每个任务重复传输录制数据
+_sessions = None
+_classifier = None
+_feature_cache = {}
+
+def _init_worker(sessions, classifier_spec):
+    global _sessions, _classifier
+    _sessions = sessions
+    _classifier = load_classifier(classifier_spec)
+    logging.getLogger(ble_bridge.__name__).setLevel(logging.WARNING)
+
+def evaluate_detector_config(detector_params, cooldowns, combos, lower, upper):
+    """评估一组分段参数: 所有会话分段一次，再对所有分类阈值组合和冷却时间批量分类"""
+    classifier = _classifier
+    totals = {}
+    for session_index, (timestamps, imu, window_columns, labels) in enumerate(_sessions):
+        cache = _feature_cache.setdefault(session_index, {})
+        detector = SegmentingDetector(window_columns, cache)
+        detector.set_classifier(classifier)
+        for name, value in detector_params.items():
+            setattr(detector, name, value)
+        detector.process_motion_batch(timestamps, imu)
+        segments = detector.segments
+
+        if segments:
+            X = np.array([classifier.feature_vector(f) for _, _, f in segments])
+            # (阈值组合, 运动序列, 动作)的得分一次算完
+            decisions, _ = classifier.decide(classifier.score(X, lower, upper))
+        else:
+            decisions = np.empty((len(combos), 0), dtype=np.int64)
+
+        for row in range(len(combos)):
+            for cooldown in cooldowns:
+                detections = []
+                last_detection_time = 0
+                for (start, analyzed_at, _), action in zip(segments, decisions[row].tolist()):
+                    if action >= 0 and analyzed_at - last_detection_time > cooldown:
+                        last_detection_time = analyzed_at
+                        detections.append((classifier.actions[action], start, analyzed_at))
+                hits, latencies = match_detections(detections, labels)
+                total = totals.setdefault((row, cooldown), [0, 0, 0, []])
+                total[0] += hits
+                total[1] += len(detections)
+                total[2] += len(labels)
+                total[3].extend(latencies)
+
+    results = []
+    for (row, cooldown), (hits, detected, labeled, latencies) in totals.items():
+        precision = hits / detected if detected else 0.0
+        recall = hits / labeled if labeled else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        results.append({
+            "params": {**detector_params, "cooldown_time": cooldown, **combos[row]},
+            "precision": precision,
+            "recall": recall,
+            "f1": f1,
+            "detected": detected,
+            "labeled": labeled,
+            "latency_ms": {
+                "mean": float(np.mean(latencies)) * 1000 if latencies else None,
+                "p90": float(np.percentile(latencies, 90)) * 1000 if latencies else None,
+            },
+        })
+    return results
+
+def load_session(path, labels_path=None, filter_spec=None):
+    """解码录制文件(经过滤波阶段)并预计算窗口特征，返回(时间戳, 六轴数据, 窗口特征, 标注)
+
+    校准偏移和滤波默认与录制时一致，filter_spec指定时替换录制的滤波配置。
+    """
+    recording = Recording(path)
+    device = recording.make_device()
+    parser = device.parser
+    timestamps, imu = recording.decode(parser, recording.wall_times())
+    imu_filter = device.filter if filter_spec is None else load_filter(filter_spec, parser)
+    if imu_filter:
+        imu = imu_filter.process(imu)
+    labels = load_labels(labels_path or os.path.splitext(path)[0] + ".labels.json")
+    return timestamps, imu, precompute_window_features(imu), labels
+
+def tune(paths, grid=DEFAULT_GRID, classifier_spec=None, workers=None, filter_spec=None):
+    """对标注过的录制文件做参数网格搜索，返回按F1和延迟排序的结果列表"""
+    start = time.perf_counter()
+    sessions = [load_session(path, filter_spec=filter_spec) for path in paths]
+    logger.info(f"已加载 {len(sessions)} 个会话，共 {sum(len(s[0]) for s in sessions)} 个样本，"
+                f"预计算耗时 {time.perf_counter() - start:.2f}s")
+
+    classifier = load_classifier(classifier_spec)
+    if not isinstance(classifier, RuleClassifier):
+        raise ValueError("网格搜索只支持规则表分类器，训练模型请使用imu_trainer.py")
+    combos, lower, upper = build_bounds(classifier, grid.get("classifier", {}))
+    detector_grid = dict(grid.get("detector", {}))
+    cooldowns = detector_grid.pop("cooldown_time", [ble_bridge.COOLDOWN_TIME])
+    detector_configs = [dict(zip(detector_grid, values)) for values in itertools.product(*detector_grid.values())]
+    logger.info(f"参数组合: {len(detector_configs)} 组分段参数 × {len(combos)} 组分类阈值 × {len(cooldowns)} 个冷却时间")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(sessions, classifier_spec)) as pool:
+        futures = [pool.submit(evaluate_detector_config, params, cooldowns, combos, lower, upper)
+                   for params in detector_configs]
+        for future in futures:
+            results.extend(future.result())
+
+    results.sort(key=lambda r: (-r["f1"], r["latency_ms"]["mean"] if r["latency_ms"]["mean"] is not None else float("inf")))
+    logger.info(f"网格搜索完成: {len(results)} 组参数，耗时 {time.perf_counter() - start:.2f}s")
+    return results
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="基于标注录制文件的检测参数网格搜索")
+    parser.add_argument("recordings", nargs="+", help="录制文件(.imurec)，标注文件为同名的.labels.json")
+    parser.add_argument("--grid", help="参数网格JSON文件(格式同DEFAULT_GRID)")
+    parser.add_argument("--classifier", help="分类规则表JSON文件(默认使用内置规则)")
+    parser.add_argument("--filter", help="滤波参数JSON(同设备配置中的filter，如'{\"sample_rate\": 100}')，默认使用录制时的滤波配置")
+    parser.add_argument("--workers", type=int, help="工作进程数(默认CPU核数)")
+    parser.add_argument("--top", type=int, default=10, help="输出的最佳参数组数")
+    parser.add_argument("--output", help="把全部结果以JSON写入文件")
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as f:
+            grid = json.load(f)
+
+    results = tune(args.recordings, grid, args.classifier, args.workers,
+                   json.loads(args.filter) if args.filter else None)
+    for r in results[:args.top]:
+        latency = r["latency_ms"]["mean"]
+        logger.info(f"F1={r['f1']:.3f} 精确率={r['precision']:.3f} 召回率={r['recall']:.3f} "
+                    f"延迟={latency if latency is None else round(latency)}ms  {r['params']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        logger.info(f"结果已写入: {args.output}")
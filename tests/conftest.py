@@ -0,0 +1,20 @@
+import logging
+import os
+import sys
+
+# 桥接脚本和工具脚本位于Unity工程的Assets/Scripts下
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Assets", "Scripts"))
+
+# 检测日志很多，测试时只保留警告
+logging.getLogger("ble_bridge").setLevel(logging.WARNING)
+
+class FakeClient:
+    """ClientConnection的替身: 直接记录发送的消息"""
+    address = "test"
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message, key=None, on_sent=None):
+        self.sent.append(message)
+        return True
@@ -0,0 +1,12 @@
+from imu_benchmark import run_stage
+
+def test_run_stage_counts_partial_last_batch():
+    """批量阶段按每批实际长度统计样本数(最后一批不满)"""
+    batches = [list(range(64)), list(range(64)), list(range(2))]
+    result = run_stage("test", lambda: (len, [(b,) for b in batches], [len(b) for b in batches]))
+    assert result["samples"] == 130
+    assert result["calls"] == 3
+
+def test_run_stage_constant_samples_per_call():
+    result = run_stage("test", lambda: (abs, [(-1,)] * 10, 1))
+    assert result["samples"] == 10
@@ -0,0 +1,57 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import ble_bridge
+from ble_bridge import IMUDevice, IMUFilter, apply_calibration, calibrate_device, compute_calibration, open_detection_session
+from conftest import FakeClient
+
+def still_samples(n=200, seed=0):
+    """静止数据: 带零偏，Z轴约1G"""
+    rng = np.random.default_rng(seed)
+    imu = rng.normal(0.0, [0.01, 0.01, 0.01, 0.5, 0.5, 0.5], size=(n, 6))
+    imu += [0.02, -0.03, 1.0, 1.5, -2.0, 0.5]
+    return imu
+
+def test_calibration_threshold():
+    calibration = compute_calibration(still_samples())
+    noise = calibration["noise_floor"]
+    assert calibration["motion_intensity_threshold"] == pytest.approx(3.0 * (noise[0] + noise[2] + noise[4] / 100))
+    np.testing.assert_allclose(calibration["bias"][3:], [1.5, -2.0, 0.5], atol=0.1)
+
+def test_calibration_applies_to_detection_sessions():
+    device = IMUDevice("d1")
+    follower = open_detection_session(FakeClient(), device)
+    overriding = open_detection_session(FakeClient(), device)
+    overriding.configure({"motion_intensity_threshold": 0.5, "cooldown_time": 4.0})
+
+    calibration = compute_calibration(still_samples())
+    apply_calibration(device, calibration)
+    threshold = calibration["motion_intensity_threshold"]
+    assert device.detector.motion_intensity_threshold == threshold
+    assert follower.detector.motion_intensity_threshold == threshold
+    # 校准替换客户端覆盖的阈值，其他覆盖参数保持不变
+    assert overriding.detector.motion_intensity_threshold == threshold
+    assert overriding.detector.cooldown_time == 4.0
+    np.testing.assert_allclose(device.parser.offset, -np.asarray(calibration["bias"]))
+
+def test_filtered_device_threshold_uses_filtered_noise(tmp_path, monkeypatch):
+    """带滤波阶段的设备: 噪声底按检测器看到的滤波后数据测量，零偏仍由原始数据计算"""
+    monkeypatch.setattr(ble_bridge, "CALIBRATION_FILE", str(tmp_path / "calibration.json"))
+    device = IMUDevice("d1", imu_filter=IMUFilter(100.0))
+    imu = still_samples()
+
+    async def run():
+        task = asyncio.create_task(calibrate_device(device))
+        await asyncio.sleep(0)
+        device.calibration_collector.add(imu)
+        return await task
+    calibration = asyncio.run(run())
+
+    noise = IMUFilter(100.0).process(imu).std(axis=0)
+    expected = 3.0 * (noise[0] + noise[2] + noise[4] / 100)
+    assert calibration["motion_intensity_threshold"] == pytest.approx(expected)
+    assert expected < compute_calibration(imu)["motion_intensity_threshold"]
+    assert device.detector.motion_intensity_threshold == pytest.approx(expected)
+    np.testing.assert_allclose(calibration["bias"], compute_calibration(imu)["bias"])
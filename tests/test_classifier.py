@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+import ble_bridge
+from ble_bridge import (EVENT_FRAME_HEADER, LinearClassifier, RuleClassifier, build_event_frame, load_classifier,
+                        load_device_config)
+
+def linear_model(**overrides):
+    """两个特征、两个动作的模型: a偏向跺脚，b偏向踢腿，都不明显时为无动作"""
+    model = {
+        "type": "logistic",
+        "actions": ["stomp", "kick"],
+        "feature_names": ["a", "b"],
+        "mean": [1.0, 2.0],
+        "scale": [0.5, 2.0],
+        "weights": [[3.0, 0.0, 0.0], [0.0, 3.0, 0.0]],
+        "bias": [0.0, 0.0, 1.5],
+        "min_confidence": 0.5,
+    }
+    model.update(overrides)
+    return model
+
+def test_linear_inference_matches_standardized_softmax():
+    model = linear_model()
+    classifier = LinearClassifier(model)
+    features = {"a": 1.6, "b": 2.5}
+    z = (np.array([1.6, 2.5]) - model["mean"]) / model["scale"]
+    logits = z @ np.array(model["weights"]) + model["bias"]
+    expected = np.exp(logits) / np.exp(logits).sum()
+    np.testing.assert_allclose(classifier.predict_proba(classifier.feature_vector(features)), expected)
+
+    result = classifier.classify(features)
+    assert result["action"] == "stomp"
+    assert result["confidence"] == pytest.approx(expected[0])
+    assert result["scores"] == pytest.approx({"stomp": expected[0], "kick": expected[1]})
+    assert result["reasons"][0].startswith("a=")
+    # 置信度不超过max_confidence
+    assert classifier.classify({"a": 3.0, "b": 2.0})["confidence"] == 0.95
+
+def test_linear_none_class_and_low_confidence():
+    classifier = LinearClassifier(linear_model())
+    # 两个特征都在均值处: 无动作类别胜出
+    assert classifier.classify({"a": 1.0, "b": 2.0}) is None
+    # 胜出动作的概率低于min_confidence时同样不输出
+    hesitant = LinearClassifier(linear_model(min_confidence=0.9))
+    assert hesitant.classify({"a": 1.6, "b": 2.0}) is None
+    assert classifier.classify({"a": 1.6, "b": 2.0})["action"] == "stomp"
+
+def test_linear_rejects_bad_shapes():
+    with pytest.raises(ValueError):
+        LinearClassifier(linear_model(bias=[0.0, 0.0]))
+    with pytest.raises(ValueError):
+        LinearClassifier(linear_model(type="tree"))
+
+def test_load_classifier_from_file(tmp_path):
+    (tmp_path / "model.json").write_text(json.dumps(linear_model()), encoding="utf-8")
+    assert isinstance(load_classifier("model.json", str(tmp_path)), LinearClassifier)
+
+@pytest.mark.parametrize("content", [None, "{not json", json.dumps(linear_model(weights=[[1.0, 0.0]]))])
+def test_load_classifier_falls_back_to_rules(tmp_path, content):
+    """分类器文件缺失、无法解析或模型无效时回退到内置规则表"""
+    if content is not None:
+        (tmp_path / "model.json").write_text(content, encoding="utf-8")
+    classifier = load_classifier("model.json", str(tmp_path))
+    assert type(classifier) is RuleClassifier
+    assert classifier.actions == ["stomp", "kick"]
+
+def test_config_defined_action(tmp_path, monkeypatch):
+    """devices.json的classifier中新增的动作可被分类，并自动分配二进制事件代码"""
+    monkeypatch.setattr(ble_bridge, "ACTION_CODES", dict(ble_bridge.ACTION_CODES))
+    config = {
+        "classifier": {
+            "actions": ["stomp", "kick", "jump"],
+            "min_total_score": 1.0,
+            "min_action_score": 2.0,
+            "rules": [
+                {"feature": "z_range", "above": 3.0, "scores": {"stomp": 6.0}},
+                {"feature": "z_range", "below": 1.5, "scores": {"kick": 6.0}},
+                {"feature": "duration", "max": 0.6, "scores": {"jump": 6.0}},
+            ],
+        },
+        "devices": [{"id": "d1", "address": "AA:BB"}],
+    }
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    device, = load_device_config(str(path))
+
+    result = device.detector.classifier.classify({"z_range": 2.0, "duration": 0.4})
+    assert result["action"] == "jump"
+    code = ble_bridge.ACTION_CODES["jump"]
+    assert code == max(ble_bridge.ACTION_CODES.values()) > ble_bridge.ACTION_CODES["motion_started"]
+    _, _, encoded, *_ = EVENT_FRAME_HEADER.unpack_from(build_event_frame(device, dict(result, timestamp=0.0)))
+    assert encoded == code
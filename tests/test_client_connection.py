@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import ble_bridge
+from ble_bridge import CLIENT_QUEUE_SIZE, ClientConnection
+
+class StalledWebSocket:
+    """发送一直不返回的WebSocket(模拟不读取数据的慢客户端)"""
+    remote_address = ("test", 0)
+
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+        self.closed = False
+        self._release = asyncio.Event()
+
+    async def send(self, message):
+        if self.error:
+            raise self.error
+        self.sent.append(message)
+        await self._release.wait()
+
+    async def close(self):
+        self.closed = True
+
+def run_stalled(policy, messages, error=None):
+    """写任务卡在第一条消息上时依次放入messages[(消息, key)]，返回(连接, WebSocket, 各次send的返回值)"""
+    async def run():
+        websocket = StalledWebSocket(error)
+        client = ClientConnection(websocket, policy)
+        client.send("first")
+        await asyncio.sleep(0.01)
+        accepted = [client.send(message, key) for message, key in messages]
+        await asyncio.sleep(0.01)
+        client.close()
+        return client, websocket, accepted
+    return asyncio.run(run())
+
+def test_drop_policy_keeps_newest():
+    messages = [(f"m{i}", None) for i in range(CLIENT_QUEUE_SIZE + 10)]
+    client, websocket, accepted = run_stalled("drop", messages)
+    assert all(accepted)
+    assert client.get_stats()["queue_depth"] == CLIENT_QUEUE_SIZE
+    assert client.dropped == 10
+    assert [item[1] for item in client._queue] == [m for m, _ in messages[10:]]
+    assert websocket.sent == ["first"]
+
+def test_coalesce_policy_replaces_same_key():
+    messages = [(f"m{i}", f"d{i % 3}") for i in range(CLIENT_QUEUE_SIZE + 10)]
+    client, _, accepted = run_stalled("coalesce", messages)
+    assert all(accepted)
+    assert client.get_stats()["queue_depth"] == 3
+    assert client.coalesced == len(messages) - 3
+    assert client.dropped == 0
+    assert [item[1] for item in client._queue] == [m for m, _ in messages[-3:]]
+
+def test_disconnect_policy_closes_on_overflow():
+    messages = [(f"m{i}", None) for i in range(CLIENT_QUEUE_SIZE + 1)]
+    client, websocket, accepted = run_stalled("disconnect", messages)
+    assert accepted == [True] * CLIENT_QUEUE_SIZE + [False]
+    assert client.closed
+    assert websocket.closed
+    assert client.send("late") is False
+
+def test_send_error_closes_connection(caplog):
+    """写任务遇到ConnectionClosed之外的错误时记录日志并断开，而不是静默停止发送"""
+    with caplog.at_level("ERROR", logger=ble_bridge.logger.name):
+        client, websocket, accepted = run_stalled("drop", [], error=RuntimeError("boom"))
+    assert client.closed
+    assert websocket.closed
+    assert "boom" in caplog.text
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+import ble_bridge
+import fake_ble
+from ble_bridge import BLEConnectionManager, IMUDevice
+
+@pytest.fixture(autouse=True)
+def fast_reconnect(monkeypatch):
+    monkeypatch.setattr(ble_bridge, "RECONNECT_BACKOFF_INITIAL", 0.1)
+    monkeypatch.setattr(ble_bridge, "last_scan", (float("-inf"), []))
+
+def test_reconnects_after_dropout():
+    """模拟设备0.3秒时断线0.2秒、1.0秒时通知暂停0.6秒: 重连一次，恢复耗时和通知中断都有统计"""
+    device = IMUDevice("d1", address="FA:KE:00:00:00:01")
+    backend = fake_ble.make_backend([device], dropouts=((0.3, 0.2),), stalls=((1.0, 0.6),), slowdowns=(),
+                                    period=None, connect_delay=0.01)
+    backend.scan_delay = 0.01
+
+    async def run():
+        connection = BLEConnectionManager(device, backend)
+        task = asyncio.create_task(connection.run())
+        await asyncio.sleep(1.9)
+        connected = device.connected
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return connection, connected
+    connection, connected = asyncio.run(run())
+
+    stats = connection.get_stats()
+    assert connected
+    assert stats["connects"] == 2
+    assert stats["reconnects"] == 1
+    # 断线0.2秒，加上重试退避，不超过一秒恢复
+    assert 150 <= stats["last_recovery_ms"] <= 1000
+    assert stats["recovery"]["count"] == 1
+    assert stats["notification_gaps"] == 1
+    assert 550 <= stats["max_gap_ms"] <= 800
+    assert stats["notifications"] > 50
+    assert stats["state"] == "idle"
+    assert not device.connected
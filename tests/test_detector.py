@@ -0,0 +1,94 @@
+import json
+
+import copy
+
+import pytest
+
+from ble_bridge import (DEFAULT_CLASSIFIER_CONFIG, FRAME_BATCH_SIZE, WALL_CLOCK_OFFSET, IMUDevice, RuleClassifier,
+                        SequentialMotionDetector, process_imu_frames)
+from fake_ble import generate_imu_stream
+
+# 原实现(逐样本处理)在合成数据(cycles=5, seed=3)上的事件: (时间戳, 动作, 置信度)
+BASELINE_EVENTS = [
+    (5.03, "stomp", 0.7), (8.55, "kick", 0.85), (11.58, "stomp", 0.7), (14.61, "stomp", 0.7),
+    (18.04, "kick", 0.85), (21.07, "stomp", 0.7), (24.1, "stomp", 0.7), (27.56, "kick", 0.85),
+    (30.59, "stomp", 0.7), (33.62, "stomp", 0.7), (37.05, "kick", 0.85), (40.08, "stomp", 0.7),
+    (43.11, "stomp", 0.7), (46.55, "kick", 0.85),
+]
+
+@pytest.fixture(scope="module")
+def stream():
+    arrival_times, frames, _, _ = generate_imu_stream(cycles=5, seed=3)
+    return arrival_times.tolist(), frames
+
+def events(messages):
+    """事件的(流内时间戳, 动作, 置信度)，时间戳换算回检测器使用的时间"""
+    return [(round(m["timestamp"] - WALL_CLOCK_OFFSET, 2), m["motion_type"], m["confidence"]) for m in map(json.loads, messages)]
+
+@pytest.mark.parametrize("batch_size", [1, FRAME_BATCH_SIZE])
+def test_default_mode_matches_baseline(stream, batch_size):
+    """默认模式(未开启提前决策)的事件数量和时间与原实现一致"""
+    times, frames = stream
+    device = IMUDevice("test")
+    messages = []
+    for i in range(0, len(frames), batch_size):
+        messages.extend(process_imu_frames(device, frames[i:i + batch_size], times[i:i + batch_size]))
+    assert events(messages) == BASELINE_EVENTS
+
+def test_early_decision_fires_before_sequence_end(stream):
+    """提前决策模式: 每个事件在对应的完整序列结束之前发出"""
+    times, frames = stream
+    device = IMUDevice("test")
+    device.detector.early_decision = True
+    results = [json.loads(m) for m in process_imu_frames(device, frames, times)]
+    assert results
+    assert results[0]["motion_type"] == "stomp"
+    assert results[0]["timestamp"] - WALL_CLOCK_OFFSET < BASELINE_EVENTS[0][0]
+
+def peak_count_classifier():
+    """在内置规则表上增加使用峰值计数的规则"""
+    config = copy.deepcopy(DEFAULT_CLASSIFIER_CONFIG)
+    config["rules"].append({"feature": "peak_count_z", "min": 3, "scores": {"stomp": 1.0}})
+    config["rules"].append({"feature": "peak_count_x", "min": 3, "scores": {"kick": 1.0}})
+    return RuleClassifier(config)
+
+def test_early_decision_with_peak_count_rules():
+    """规则用到峰值计数时提前决策仍能分类，部分序列的峰值计数与完整序列特征的定义一致"""
+    arrival_times, _, imu, _ = generate_imu_stream(cycles=2, seed=3)
+    detector = SequentialMotionDetector(peak_count_classifier())
+    detector.early_decision = True
+    checked = 0
+    results = []
+    for timestamp, sample in zip(arrival_times.tolist(), imu.tolist()):
+        result = detector.process_motion_sequence(sample, timestamp)
+        if result:
+            results.append(result)
+        # 提前决策后部分序列特征不再更新，只在决策前比较
+        if (detector.motion_state == "building" and not detector.motion_decided and
+                detector.partial_features.count >= 10):
+            buffer = detector.motion_data_buffer
+            partial = detector.partial_motion_features()
+            full = detector.extract_motion_features(buffer.imu, buffer.timestamps)
+            assert partial["peak_count_x"] == full["peak_count_x"]
+            assert partial["peak_count_z"] == full["peak_count_z"]
+            checked += 1
+    assert checked > 0
+    assert any(r.get("early") for r in results)
+
+def test_early_decision_enabled_mid_motion_waits_for_next_motion():
+    """运动进行中开启提前决策: 当前运动按完整序列分析，从下一次运动开始才做部分序列分类"""
+    arrival_times, _, imu, _ = generate_imu_stream(cycles=2, seed=3)
+    detector = SequentialMotionDetector()
+    results = []
+    enabled_during = None
+    for timestamp, sample in zip(arrival_times.tolist(), imu.tolist()):
+        if detector.motion_state == "building" and enabled_during is None:
+            detector.early_decision = True
+            enabled_during = detector.motion_start_time
+        if detector.motion_state == "building" and detector.motion_start_time == enabled_during:
+            assert detector.partial_features.count == 0
+        result = detector.process_motion_sequence(sample, timestamp)
+        if result:
+            results.append(result)
+    assert not any(r.get("early") for r in results if r["motion_start"] == enabled_during)
+    assert any(r.get("early") for r in results if r["motion_start"] != enabled_during)
@@ -0,0 +1,24 @@
+import json
+import time
+
+import pytest
+
+from ble_bridge import EVENT_FRAME_HEADER, IMUDevice, build_event_frame, build_event_message
+
+RESULT = {"action": "stomp", "confidence": 0.8, "scores": {}, "reasons": []}
+
+def test_event_timestamp_is_wall_clock():
+    device = IMUDevice("d1")
+    result = dict(RESULT, timestamp=time.monotonic())
+    event = json.loads(build_event_message(device, result))
+    assert event["timestamp"] == pytest.approx(time.time(), abs=1.0)
+    *_, timestamp = EVENT_FRAME_HEADER.unpack_from(build_event_frame(device, result))
+    assert timestamp == event["timestamp"]
+
+def test_enqueue_keeps_zero_arrival_time():
+    device = IMUDevice("d1")
+    device.enqueue_frame(b"\x00", 0.0)
+    device.enqueue_frame(b"\x00")
+    (first, _, _), (second, _, _) = device.frame_queue.get_nowait(), device.frame_queue.get_nowait()
+    assert first == 0.0
+    assert second == pytest.approx(time.monotonic(), abs=1.0)
@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+import fake_ble
+
+def test_fake_ble_does_not_import_bridge():
+    """桥接脚本作为__main__运行时导入模拟设备，不应再加载一份ble_bridge模块"""
+    code = "import sys, fake_ble; sys.exit('ble_bridge' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(fake_ble.__file__)).returncode == 0
+
+def test_make_backend_uses_device_uuids():
+    from ble_bridge import IMUDevice
+    device = IMUDevice("test", address="AA:BB", service_uuid="1234", characteristic_uuid="5678")
+    backend = fake_ble.make_backend([device])
+    peripheral = backend.peripherals["AA:BB"]
+    assert peripheral.services.get_service("1234").get_characteristic("5678") is peripheral.characteristic
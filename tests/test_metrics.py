@@ -0,0 +1,32 @@
+import re
+
+import pytest
+
+import ble_bridge
+from ble_bridge import IMUDevice, process_imu_frames, render_prometheus_metrics
+from fake_ble import generate_imu_stream
+
+# 一行样本: 指标名{标签="值",...} 数值，值中只允许转义后的反斜杠、双引号和换行
+SAMPLE_LINE = re.compile(r'^[a-z_]+(\{[a-z_]+="(?:[^"\\\n]|\\[\\"n])*"(,[a-z_]+="(?:[^"\\\n]|\\[\\"n])*")*\})? \S+$')
+
+@pytest.fixture
+def device():
+    device = IMUDevice('lab "A"\\1\nx')
+    ble_bridge.devices.clear()
+    ble_bridge.devices[device.device_id] = device
+    yield device
+    ble_bridge.devices.clear()
+
+def test_label_values_are_escaped(device):
+    arrival_times, frames, _, _ = generate_imu_stream(cycles=1, seed=3)
+    process_imu_frames(device, frames, arrival_times.tolist())
+    device.detector.detection_stats['say "hi"'] = 1
+
+    text = render_prometheus_metrics()
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            assert SAMPLE_LINE.match(line), line
+    escaped = 'device="lab \\"A\\"\\\\1\\nx"'
+    assert f'imu_bridge_queue_depth{{{escaped}}} 0' in text
+    assert f'imu_bridge_detections_total{{{escaped},action="say \\"hi\\""}} 1' in text
+    assert f'imu_bridge_stage_latency_seconds_count{{{escaped},stage="parse"}}' in text
@@ -0,0 +1,35 @@
+import struct
+
+import numpy as np
+import pytest
+
+from ble_bridge import IMUFrameParser
+from imu_protocol import ACCEL_SCALE, GYRO_SCALE
+
+SCALE = np.array([ACCEL_SCALE] * 3 + [GYRO_SCALE] * 3)
+
+def make_frame(raw, header_size, stride, trailer=b""):
+    """raw(每帧样本数, 6)的大端int16，样本之间用0xEE填充到stride字节"""
+    samples = [struct.pack(">6h", *row) + b"\xee" * (stride - 12) for row in raw]
+    return b"\xaa" * header_size + b"".join(samples) + trailer
+
+@pytest.mark.parametrize("trailers", [(b"", b""), (b"", b"\x00\x00")])
+def test_multi_sample_frame_with_padding(trailers):
+    """每帧3个样本、样本间距16字节(4字节填充)、4字节帧头；等长帧和不等长帧两条解析路径结果一致"""
+    parser = IMUFrameParser(header_size=4, samples_per_frame=3, sample_stride=16, sample_rate=100.0)
+    raw = np.arange(2 * 3 * 6, dtype=np.int16).reshape(2, 3, 6) * 37 - 500
+    frames = [make_frame(r, 4, 16, t) for r, t in zip(raw, trailers)]
+    assert parser.min_frame_size == 4 + 2 * 16 + 12
+
+    timestamps, imu = parser.parse_batch(frames, [1.0, 1.03])
+    np.testing.assert_allclose(imu, raw.reshape(-1, 6) * SCALE)
+    # 帧内前面的样本按标称采样率往前推，最后一个样本对齐到到达时间
+    np.testing.assert_allclose(timestamps, [0.98, 0.99, 1.0, 1.01, 1.02, 1.03])
+
+def test_short_frame_is_skipped():
+    parser = IMUFrameParser(header_size=4, samples_per_frame=2, sample_stride=14, sample_rate=50.0)
+    raw = np.ones((2, 6), dtype=np.int16) * 100
+    frame = make_frame(raw, 4, 14)
+    timestamps, imu = parser.parse_batch([frame, frame[:-3]], [1.0, 1.02])
+    assert len(imu) == 2
+    np.testing.assert_allclose(timestamps, [0.98, 1.0])
@@ -0,0 +1,119 @@
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from ble_bridge import (DEFAULT_CLASSIFIER_CONFIG, FRAME_BATCH_SIZE, FrameRecorder, IMUDevice, IMUFilter,
+                        IMUFrameParser, Recording, RuleClassifier, apply_calibration, configure_detector, process_imu_frames,
+                        recording_sidecar_path, replay_offline)
+from fake_ble import generate_imu_stream
+
+def record(path, device, arrival_times, frames):
+    recorder = FrameRecorder(str(path), device)
+    recorder.write_batch(arrival_times, frames)
+    recorder.close()
+
+@pytest.mark.parametrize("variable_length", [False, True])
+def test_round_trip(tmp_path, variable_length):
+    """写入后用mmap读回: 文件头、到达时间、原始帧和解码结果与写入时一致"""
+    path = tmp_path / "d1.imurec"
+    device = IMUDevice("d1", parser=IMUFrameParser(sample_rate=100.0))
+    arrival_times, frames, _, _ = generate_imu_stream(cycles=1, seed=1)
+    frames = [bytes(f) + b"\0" * (i % 3 if variable_length else 0) for i, f in enumerate(frames[:200])]
+    times = arrival_times[:200].tolist()
+    recorder = FrameRecorder(str(path), device)
+    recorder.write_batch(times[:100], frames[:100])
+    recorder.write_batch(times[100:], frames[100:])
+    recorder.close()
+    # 末尾写了一半的记录被忽略
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    recording = Recording(str(path))
+    assert recording.device_id == "d1"
+    assert (recording.header_size, recording.samples_per_frame, recording.sample_stride) == (10, 1, 12)
+    assert recording.sample_rate == 100.0
+    assert recording.count == 200
+    np.testing.assert_array_equal(recording.arrival_times, times)
+    assert [bytes(f) for f in recording.frames()] == frames
+    decoded_times, imu = recording.decode(device.parser)
+    expected_times, expected_imu = device.parser.parse_batch(frames, times)
+    np.testing.assert_array_equal(decoded_times, expected_times)
+    np.testing.assert_array_equal(imu, expected_imu)
+    # 按范围解码
+    np.testing.assert_array_equal(recording.decode(device.parser, start=50, end=60)[1], expected_imu[50:60])
+
+def test_append_rejects_header_mismatch(tmp_path):
+    path = str(tmp_path / "d1.imurec")
+    _, frames, _, _ = generate_imu_stream(cycles=1, seed=1)
+    record(path, IMUDevice("d1"), [1.0], frames[:1])
+    other = IMUDevice("d1", parser=IMUFrameParser(samples_per_frame=2, sample_rate=100.0))
+    with pytest.raises(ValueError):
+        FrameRecorder(path, other)
+    # 格式相同的设备可以继续追加
+    record(path, IMUDevice("d1"), [2.0], frames[1:2])
+    assert Recording(path).count == 2
+
+def test_wall_clock_anchor_per_segment(tmp_path):
+    path = tmp_path / "d1.imurec"
+    device = IMUDevice("d1")
+    _, frames, _, _ = generate_imu_stream(cycles=1, seed=1)
+    now = time.monotonic()
+    record(path, device, [now, now + 0.01], frames[:2])
+    # 模拟重启后追加: 单调时钟从较小的值重新计数
+    record(path, device, [5.0, 5.01], frames[2:4])
+    with open(recording_sidecar_path(str(path)), encoding="utf-8") as f:
+        segments = json.load(f)["segments"]
+    segments[1]["monotonic_time"] = 4.0
+    segments[1]["wall_time"] = time.time() + 10.0
+    with open(recording_sidecar_path(str(path)), "w", encoding="utf-8") as f:
+        json.dump({"device_id": "d1", "segments": segments}, f)
+
+    recording = Recording(str(path))
+    assert [s["frame"] for s in recording.segments] == [0, 2]
+    wall = recording.wall_times()
+    assert wall[0] == pytest.approx(time.time(), abs=5.0)
+    np.testing.assert_allclose(np.diff(wall)[[0, 2]], [0.01, 0.01], atol=1e-6)
+    # 两次运行的墙钟时间保持先后顺序
+    assert wall[2] > wall[1] + 5.0
+
+def test_legacy_recording_without_sidecar(tmp_path):
+    path = tmp_path / "d1.imurec"
+    _, frames, _, _ = generate_imu_stream(cycles=1, seed=1)
+    record(path, IMUDevice("d1"), [1.7e9, 1.7e9 + 0.01], frames[:2])
+    os.remove(recording_sidecar_path(str(path)))
+    recording = Recording(str(path))
+    np.testing.assert_array_equal(recording.wall_times(), recording.arrival_times)
+
+def event_keys(messages):
+    return [(m["motion_type"], round(m["timestamp"], 3)) for m in map(json.loads, messages)]
+
+def test_replay_matches_live(tmp_path):
+    """录制时的滤波、校准、分类器配置和中途的阈值调整在回放时同样生效"""
+    path = str(tmp_path / "d1.imurec")
+    config = copy.deepcopy(DEFAULT_CLASSIFIER_CONFIG)
+    config["min_action_score"] = 4.0
+    device = IMUDevice("d1", classifier=RuleClassifier(config), imu_filter=IMUFilter(100.0))
+    apply_calibration(device, {"bias": [0.01, -0.02, 0.03, 1.0, -1.0, 0.5], "motion_intensity_threshold": 0.1})
+    device.recorder = FrameRecorder(path, device)
+
+    arrival_times, frames, _, _ = generate_imu_stream(cycles=4, seed=2)
+    times = (arrival_times + time.monotonic()).tolist()
+    live = []
+    middle = len(frames) // 2 // FRAME_BATCH_SIZE * FRAME_BATCH_SIZE
+    for i in range(0, len(frames), FRAME_BATCH_SIZE):
+        if i == middle:
+            configure_detector(device, {"cooldown_time": 4.0})
+        device.recorder.write_batch(times[i:i + FRAME_BATCH_SIZE], frames[i:i + FRAME_BATCH_SIZE])
+        live.extend(process_imu_frames(device, frames[i:i + FRAME_BATCH_SIZE], times[i:i + FRAME_BATCH_SIZE]))
+    device.recorder.close()
+
+    replayed_device, replayed, samples, _ = replay_offline(path)
+    assert samples == len(frames)
+    assert replayed_device.filter is not None
+    assert replayed_device.detector.cooldown_time == 4.0
+    assert len(live) >= 4
+    assert event_keys(replayed) == event_keys(live)
@@ -0,0 +1,62 @@
+import struct
+
+import numpy as np
+import pytest
+
+from ble_bridge import SampleClock
+
+def counter_frames(counters, size=1):
+    """帧头开头为计数器的通知帧"""
+    fmt = {1: "<B", 2: "<H"}[size]
+    return [struct.pack(fmt, c % (1 << (8 * size))) + bytes(12) for c in counters]
+
+def test_batched_arrival_is_evenly_spaced():
+    """一个连接间隔内一起到达的帧按采样间隔展开，最后一个样本对齐到到达时间"""
+    clock = SampleClock("nominal", sample_rate=100.0)
+    frames = counter_frames(range(8))
+    arrivals = [10.04] * 4 + [10.08] * 4
+    first = clock.timestamps(frames[:4], arrivals[:4])
+    second = clock.timestamps(frames[4:], arrivals[4:])
+    times = np.concatenate([first, second])
+    np.testing.assert_allclose(np.diff(times), 0.01, atol=1e-9)
+    assert first[-1] == pytest.approx(10.04)
+
+def test_strictly_increasing_when_anchor_moves_back():
+    clock = SampleClock("nominal", sample_rate=100.0)
+    first = clock.timestamps(counter_frames(range(4)), [1.05] * 4)
+    # 后一批到达更早: 锚点前移，时间戳仍严格递增
+    second = clock.timestamps(counter_frames(range(4)), [1.03, 1.04, 1.05, 1.06])
+    times = np.concatenate([first, second])
+    assert (np.diff(times) > 0).all()
+
+def test_counter_wraparound():
+    clock = SampleClock("counter", sample_rate=100.0, size=1)
+    counters = list(range(250, 262))
+    times = clock.timestamps(counter_frames(counters), [1.0 + 0.01 * i for i in range(len(counters))])
+    np.testing.assert_allclose(np.diff(times), 0.01, atol=1e-9)
+    assert clock.dropped_samples == 0
+    assert clock.resyncs == 0
+
+def test_counter_dropped_samples():
+    clock = SampleClock("counter", sample_rate=100.0, size=2)
+    counters = [10, 11, 12, 15, 16]
+    arrivals = [1.00, 1.01, 1.02, 1.05, 1.06]
+    times = clock.timestamps(counter_frames(counters, size=2), arrivals)
+    assert clock.dropped_samples == 2
+    np.testing.assert_allclose(np.diff(times), [0.01, 0.01, 0.03, 0.01], atol=1e-9)
+
+def test_nominal_gap_resyncs():
+    """标称模式下到达时间的长间隔计为丢样并重新对齐"""
+    clock = SampleClock("nominal", sample_rate=100.0)
+    arrivals = [1.00, 1.01, 1.02, 2.02, 2.03]
+    times = clock.timestamps(counter_frames(range(5)), arrivals)
+    assert clock.resyncs == 1
+    assert clock.dropped_samples == 99
+    np.testing.assert_allclose(times, arrivals, atol=1e-9)
+
+def test_gap_between_batches_resyncs():
+    clock = SampleClock("nominal", sample_rate=100.0)
+    clock.timestamps(counter_frames(range(3)), [1.00, 1.01, 1.02])
+    times = clock.timestamps(counter_frames(range(2)), [2.02, 2.03])
+    assert clock.resyncs == 1
+    np.testing.assert_allclose(times, [2.02, 2.03], atol=1e-9)
@@ -0,0 +1,53 @@
+import asyncio
+
+import numpy as np
+
+from ble_bridge import (SENSOR_BUFFER_SIZE, SENSOR_FRAME_HEADER, IMUDevice, IMUFilter, process_imu_frames,
+                        subscribe_sensor, unsubscribe_sensor)
+from conftest import FakeClient
+from fake_ble import generate_imu_stream
+
+def unpack(frames):
+    """解出传感器数据帧中的(时间戳, 六轴)"""
+    times, imu = [], []
+    for frame in frames:
+        _, _, id_length, count, base_time = SENSOR_FRAME_HEADER.unpack_from(frame)
+        records = np.frombuffer(frame, dtype='<f4', offset=SENSOR_FRAME_HEADER.size + id_length).reshape(count, 7)
+        times.append(base_time + records[:, 0])
+        imu.append(records[:, 1:])
+    return np.concatenate(times), np.concatenate(imu)
+
+def stream(sources, n):
+    """以很高的输出频率订阅(不降采样)，一个节拍内写入n个样本，返回各来源收到的数据"""
+    arrival_times, frames, _, _ = generate_imu_stream(cycles=1, seed=1)
+    device = IMUDevice("test", imu_filter=IMUFilter(100.0))
+    clients = {source: FakeClient() for source in sources}
+
+    async def run():
+        for source, client in clients.items():
+            subscribe_sensor(client, device, rate=1e6, source=source)
+        process_imu_frames(device, frames[:n], arrival_times[:n].tolist())
+        await asyncio.sleep(0.2)
+        for client in clients.values():
+            unsubscribe_sensor(client, [device])
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    return device, {source: unpack(client.sent) for source, client in clients.items()}
+
+def test_raw_and_filtered_sources():
+    device, received = stream(["raw", "filtered"], 300)
+    raw_times, raw = received["raw"]
+    filtered_times, filtered = received["filtered"]
+    assert len(raw) == len(filtered) == 300
+    np.testing.assert_allclose(raw_times, filtered_times, atol=1e-3)
+    # 滤波阶段去除了重力，原始数据保留Z轴约1G
+    assert abs(raw[:, 2].mean() - 1.0) < 0.1
+    assert abs(filtered[:, 2].mean()) < 0.1
+    # 没有订阅者后释放来源缓冲区
+    assert device.sensor_buffers == {}
+
+def test_backlog_beyond_detection_window():
+    """一个节拍内的积压超过检测窗口(80个样本)时仍能完整取回，上限为SENSOR_BUFFER_SIZE"""
+    _, received = stream(["raw"], 500)
+    assert len(received["raw"][0]) == min(500, SENSOR_BUFFER_SIZE)
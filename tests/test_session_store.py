@@ -0,0 +1,81 @@
+import glob
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from ble_bridge import SessionStore, SessionWriter
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), "..", "Assets", "Scripts")
+
+def motion_result(action, confidence, scores):
+    return {"action": action, "confidence": confidence, "scores": scores, "reasons": []}
+
+def test_write_and_reload(tmp_path):
+    path = str(tmp_path / "session")
+    writer = SessionWriter(path, "d1", {"sample_rate": 100.0}, chunk_samples=100)
+    timestamps = 1000.0 + np.arange(250) / 100.0
+    imu = np.random.default_rng(0).normal(size=(250, 6)).astype(np.float32)
+    writer.add_samples(timestamps[:180], imu[:180])
+    for i in range(180, 250):
+        writer.add_sample(timestamps[i], imu[i])
+    writer.add_motion(1000.2, 1001.0, {"duration": 0.8, "x_std": 0.1},
+                      motion_result("stomp", 0.7, {"stomp": 0.7, "kick": 0.1}), True)
+    writer.add_motion(1001.5, 1002.2, {"duration": 0.7, "peak_count_z": 3}, None, False)
+    writer.close()
+
+    store = SessionStore(path)
+    assert store.device_id == "d1"
+    assert store.manifest["sample_rate"] == 100.0
+    assert [c["count"] for c in store.manifest["chunks"]["samples"]] == [100, 100, 50]
+    loaded_times, loaded_imu = store.samples()
+    np.testing.assert_array_equal(loaded_times, timestamps)
+    np.testing.assert_array_equal(loaded_imu, imu)
+    # 按时间范围只取需要的样本
+    part_times, _ = store.samples(1001.0, 1001.5)
+    np.testing.assert_array_equal(part_times, timestamps[(timestamps >= 1001.0) & (timestamps <= 1001.5)])
+
+    motions = store.motions()
+    assert motions["action"].tolist() == ["stomp", ""]
+    assert motions["emitted"].tolist() == [True, False]
+    assert motions["feature_names"] == ["duration", "x_std", "peak_count_z"]
+    np.testing.assert_array_equal(motions["features"], [[0.8, 0.1, np.nan], [0.7, np.nan, 3]])
+    assert store.motions(emitted_only=True)["action"].tolist() == ["stomp"]
+
+def test_clock_anchor(tmp_path):
+    path = str(tmp_path / "session")
+    writer = SessionWriter(path, "d1", chunk_samples=10)
+    now = time.monotonic()
+    writer.add_samples(np.array([now]), np.zeros((1, 6)))
+    writer.close()
+
+    store = SessionStore(path)
+    anchor = store.manifest["clock_anchor"]
+    assert anchor["wall_time"] == pytest.approx(time.time(), abs=5.0)
+    assert store.wall_time(store.samples()[0])[0] == pytest.approx(time.time(), abs=5.0)
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要POSIX信号")
+def test_sigterm_flushes_session(tmp_path):
+    """收到SIGTERM时与Ctrl+C一样正常退出并写出会话"""
+    process = subprocess.Popen(
+        [sys.executable, "ble_bridge.py", "--fake-ble", "--session", str(tmp_path), "--metrics-port", "0"],
+        cwd=SCRIPTS_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        for line in process.stderr:
+            if "启动到首个样本" in line:
+                break
+        time.sleep(1.0)
+        process.send_signal(signal.SIGTERM)
+        process.communicate(timeout=10)
+    finally:
+        process.kill()
+    assert process.returncode == 0
+    manifest, = glob.glob(str(tmp_path / "*" / "manifest.json"))
+    with open(manifest, encoding="utf-8") as f:
+        chunks = json.load(f)["chunks"]["samples"]
+    assert sum(c["count"] for c in chunks) > 0
@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import pytest
+
+import ble_bridge
+from ble_bridge import IMUDevice, parse_detector_params, websocket_handler
+
+class FakeWebSocket:
+    """按测试推入的顺序产生消息的WebSocket，记录服务端发送的回复"""
+    def __init__(self, port):
+        self.remote_address = ("test", port)
+        self.sent = []
+        self.incoming = asyncio.Queue()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def close(self):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def command(self, **data):
+        """发送命令并返回服务端的回复"""
+        count = len(self.sent)
+        await self.incoming.put(json.dumps(data))
+        for _ in range(100):
+            await asyncio.sleep(0.001)
+            if len(self.sent) > count:
+                return json.loads(self.sent[-1])
+        raise AssertionError(f"命令没有回复: {data}")
+
+@pytest.fixture
+def device():
+    device = IMUDevice("d1")
+    ble_bridge.devices.clear()
+    ble_bridge.devices["d1"] = device
+    yield device
+    ble_bridge.devices.clear()
+
+def run_clients(scenario, count=2):
+    """启动count个客户端连接，执行scenario(websockets)后断开"""
+    async def run():
+        sockets = [FakeWebSocket(port) for port in range(count)]
+        handlers = [asyncio.create_task(websocket_handler(ws)) for ws in sockets]
+        await asyncio.sleep(0.01)
+        try:
+            await scenario(*sockets)
+        finally:
+            for ws in sockets:
+                await ws.incoming.put(None)
+            await asyncio.gather(*handlers)
+    asyncio.run(run())
+
+def test_default_scope_is_device(device):
+    async def scenario(a, b):
+        reply = await a.command(command="set_thresholds", motion_intensity_threshold=0.3)
+        assert reply == {"status": "thresholds_updated", "scope": "device"}
+        assert device.detector.motion_intensity_threshold == 0.3
+        assert device.detection_sessions == {}
+    run_clients(scenario)
+
+def test_client_scope_overrides_only_set_params(device):
+    async def scenario(a, b):
+        reply = await a.command(command="set_thresholds", scope="client", cooldown_time=5.0)
+        assert reply["scope"] == "client"
+        session, = device.detection_sessions.values()
+        assert session.detector.cooldown_time == 5.0
+        assert device.detector.cooldown_time != 5.0
+        # 设备范围的修改同步到会话中未覆盖的参数，覆盖的参数不变
+        await b.command(command="set_thresholds", motion_intensity_threshold=0.25, cooldown_time=2.0)
+        assert session.detector.motion_intensity_threshold == 0.25
+        assert session.detector.cooldown_time == 5.0
+        assert device.detector.cooldown_time == 2.0
+        stats = await a.command(command="get_stats")
+        assert stats["session"]["d1"]["overrides"] == {"cooldown_time": 5.0}
+    run_clients(scenario)
+    # 断开后关闭会话
+    assert device.detection_sessions == {}
+
+def test_invalid_values_are_rejected(device):
+    async def scenario(a):
+        threshold = device.detector.motion_intensity_threshold
+        reply = await a.command(command="set_thresholds", motion_intensity_threshold="abc")
+        assert "error" in reply
+        reply = await a.command(command="set_thresholds", early_decision="maybe")
+        assert "error" in reply
+        assert device.detector.motion_intensity_threshold == threshold
+        # 连接仍可继续使用
+        reply = await a.command(command="set_thresholds", early_decision="false")
+        assert reply["status"] == "thresholds_updated"
+        assert device.detector.early_decision is False
+    run_clients(scenario, count=1)
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), (False, False), ("true", True), ("False", False), ("0", False), (1, True),
+])
+def test_parse_bool(value, expected):
+    assert parse_detector_params({"early_decision": value}) == {"early_decision": expected}
+
+@pytest.mark.parametrize("value", ["abc", None, [1], True, "nan", "inf"])
+def test_parse_float_rejects(value):
+    with pytest.raises(ValueError):
+        parse_detector_params({"cooldown_time": value})
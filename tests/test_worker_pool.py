@@ -0,0 +1,53 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+import ble_bridge
+from ble_bridge import DetectionWorkerPool, IMUDevice, SessionStore, SessionWriter
+from fake_ble import generate_imu_stream
+
+def run_pool(tmp_path, before_close=None, timeout=ble_bridge.WORKER_SHUTDOWN_TIMEOUT):
+    """启动单个工作进程检测一段数据(会话块足够大，只在退出时写出)，关闭后返回(进程, 写入的样本数)"""
+    async def run():
+        device = IMUDevice("d1")
+        device.session = SessionWriter(str(tmp_path / "session"), "d1", chunk_samples=100000)
+        ble_bridge.devices["d1"] = device
+        pool = DetectionWorkerPool(1)
+        try:
+            pool.start([device])
+            await pool.wait_ready()
+            arrival_times, frames, _, _ = generate_imu_stream(cycles=1, seed=1)
+            written = 0
+            for i in range(0, len(frames), 64):
+                batch = frames[i:i + 64]
+                written += len(batch) - device.worker.submit(arrival_times[i:i + 64].tolist(),
+                                                             [time.perf_counter()] * len(batch), batch)
+                await asyncio.sleep(0.002)
+            await asyncio.sleep(0.2)
+            if before_close:
+                before_close(pool)
+        finally:
+            pool.close(timeout)
+            ble_bridge.devices.clear()
+        return pool._processes[0], written
+    return asyncio.run(run())
+
+def test_close_waits_for_session_flush(tmp_path):
+    process, written = run_pool(tmp_path)
+    # 工作进程自行退出(未被终止)，退出前写完了全部样本
+    assert process.exitcode == 0
+    store = SessionStore(str(tmp_path / "session"))
+    assert written > 0
+    assert len(store.samples()[0]) == written
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要SIGSTOP")
+def test_close_terminates_unresponsive_worker(tmp_path):
+    started = time.monotonic()
+    process, _ = run_pool(tmp_path, lambda pool: os.kill(pool._processes[0].pid, signal.SIGSTOP), timeout=0.5)
+    assert not process.is_alive()
+    assert process.exitcode != 0
+    assert time.monotonic() - started < 20